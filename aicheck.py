@@ -0,0 +1,139 @@
+import time
+
+_started = time.perf_counter()
+
+import os
+import sys
+import logging
+import argparse
+import importlib
+import threading
+
+LOG_FILE = "logs/all.log"
+
+# サブコマンド → (モジュール, 関数, 説明)。モジュールは実行するサブコマンドの分だけimportする
+COMMANDS = {
+    "search": ("search_github_projects", "main", "AIAgentによるGitHubプロジェクト検索"),
+    "clone": ("clone_projects", "main", "GitHubリポジトリをclone"),
+    "check": ("check_repo_files", "main", "README・Dockerfileの有無を判定"),
+    "index": ("repo_index", "main", "cloneしたリポジトリの関係ファイルをインデックス化"),
+    "report": ("generate_report", "main", "READMEを解析しrepos.jsonへ追記"),
+    "docker": ("docker_test_runner", "cli", "Dockerビルド・テストとAI要約"),
+    "markdown": ("generate_markdown_report", "main", "Markdownレポートを生成"),
+    "pipeline": ("pipeline", "main", "入力に変更のあったステージのみ実行"),
+    "watch": ("watch_repos", "main", "clone先を常駐監視し、変更のあったリポジトリだけ再処理"),
+}
+
+# ログに付けるステージ名。run_commandを呼んだスレッドはそのステージ名、
+# ステージ内で作られたワーカースレッドは最後に開始したステージ名になる
+_current = "aicheck"
+_local = threading.local()
+_config_loaded = False
+
+
+class _StageFilter(logging.Filter):
+    def filter(self, record):
+        record.stage = getattr(_local, "stage", _current)
+        return True
+
+
+def load_config():
+    """.envを1回だけ読み込む（各モジュールが定数を読む前に呼ぶ）。"""
+    global _config_loaded
+    if not _config_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _config_loaded = True
+
+
+def setup_logging():
+    """全ステージ共通のロガー。各スクリプトのbasicConfigより先に設定するので、そちらは無視される。"""
+    root = logging.getLogger()
+    if any(getattr(h, "_aicheck", False) for h in root.handlers):
+        return
+    os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+    handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(stage)s] %(message)s"))
+    handler.addFilter(_StageFilter())
+    handler._aicheck = True
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def load_command(name):
+    module_name, func_name, _ = COMMANDS[name]
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run_command(name, argv=None, isolated=False):
+    """サブコマンドを同じプロセス内で実行し終了コードを返す。
+
+    isolated=True（パイプラインから呼ぶ場合）はメトリクスをステージ毎に分けて書き出す。
+    """
+    global _current
+    import metrics
+    load_config()
+    setup_logging()
+    previous, _current = _current, name
+    previous_local = getattr(_local, "stage", None)
+    _local.stage = name
+    try:
+        func = load_command(name)
+        if isolated:
+            with metrics.scope():
+                func(argv or [])
+        else:
+            func(argv)
+        return 0
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        msg = f"[{name}] 異常終了: {e}"
+        print(msg)
+        logging.exception(msg)
+        return 1
+    finally:
+        _current = previous
+        if previous_local is None:
+            del _local.stage
+        else:
+            _local.stage = previous_local
+
+
+def profile_import(name):
+    """サブコマンドのモジュールをimportし、所要時間と新たに読み込まれたパッケージを表示する。"""
+    before = set(sys.modules)
+    t0 = time.perf_counter()
+    load_command(name)
+    elapsed = time.perf_counter() - t0
+    new = set(sys.modules) - before
+    # 標準ライブラリ以外（依存パッケージ・本リポジトリのモジュール）を表示
+    packages = sorted({m.split(".")[0] for m in new} - set(sys.stdlib_module_names))
+    print(
+        f"[startup] 起動まで {(t0 - _started) * 1000:.0f}ms, {COMMANDS[name][0]} のimport {elapsed * 1000:.0f}ms"
+        f"（新規モジュール {len(new)}個。標準ライブラリ以外: {', '.join(packages)}）",
+        file=sys.stderr
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="aicheck",
+        description="検索・clone・解析・Dockerテスト・レポート生成を1つのコマンドで実行",
+        epilog="各サブコマンドの引数は aicheck <サブコマンド> --help を参照。",
+    )
+    parser.add_argument("--profile-startup", action="store_true", help="サブコマンドのimport所要時間を表示（詳細は python -X importtime）")
+    parser.add_argument("command", choices=list(COMMANDS), metavar="command", help=" / ".join(f"{k}: {v[2]}" for k, v in COMMANDS.items()))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    load_config()
+    setup_logging()
+    if args.profile_startup:
+        profile_import(args.command)
+    sys.exit(run_command(args.command, args.args))
+
+
+if __name__ == "__main__":
+    # pipeline等からの import aicheck で別インスタンスが作られないようにする
+    sys.modules.setdefault("aicheck", sys.modules[__name__])
+    main()
@@ -0,0 +1,67 @@
+import os
+import json
+import random
+import subprocess
+
+GIT_ENV = {
+    "GIT_AUTHOR_NAME": "bench",
+    "GIT_AUTHOR_EMAIL": "bench@example.com",
+    "GIT_COMMITTER_NAME": "bench",
+    "GIT_COMMITTER_EMAIL": "bench@example.com",
+}
+
+KEYWORDS = ["Python", "Node.js", "PyTorch", "TensorFlow", "OpenAI", "Claude", "HuggingFace", "Playwright"]
+FEATURES = ["自動化", "チェック", "画像認識", "チャットボット", "自然言語処理", "分類"]
+
+def _readme(rng, name, size_kb):
+    lines = [f"# {name}", "", f"{name} は {rng.choice(FEATURES)} のための {rng.choice(KEYWORDS)} プロジェクトです。", ""]
+    lines += ["## Installation", "", "```bash", "pip install -r requirements.txt", "```", ""]
+    lines += ["## Usage", "", "```python", "from app import run", "run()", "```", ""]
+    filler = f"This project uses {rng.choice(KEYWORDS)} and {rng.choice(KEYWORDS)}. "
+    body = []
+    while sum(len(l) for l in body) < size_kb * 1024:
+        body.append(filler * rng.randint(1, 8))
+    lines += ["## Details", ""] + body
+    return "\n".join(lines) + "\n"
+
+def make_repo(path, rng, index):
+    """README/Dockerfile/requirements.txt/package.json/main.py を持つローカルgitリポジトリを作る。"""
+    name = os.path.basename(path)
+    os.makedirs(path, exist_ok=True)
+    size_kb = rng.choice([1, 4, 16, 64, 256])
+    with open(os.path.join(path, "README.md"), "w", encoding="utf-8") as f:
+        f.write(_readme(rng, name, size_kb))
+    # 7割のリポジトリにDockerfile
+    if index % 10 < 7:
+        with open(os.path.join(path, "Dockerfile"), "w", encoding="utf-8") as f:
+            base = rng.choice(["python:3.11-slim", "python:3.12-slim", "node:20-slim"])
+            f.write(f"FROM {base}\nWORKDIR /app\nCOPY . /app\nCMD [\"python\", \"main.py\"]\n")
+    with open(os.path.join(path, "requirements.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(rng.sample(["requests", "openai", "torch", "numpy", "flask", "playwright"], 3)) + "\n")
+    with open(os.path.join(path, "package.json"), "w", encoding="utf-8") as f:
+        json.dump({"name": name, "dependencies": {d: "^1.0.0" for d in rng.sample(["express", "react", "openai", "axios"], 2)}}, f)
+    with open(os.path.join(path, "main.py"), "w", encoding="utf-8") as f:
+        f.write("import os\n" + "".join(f"# line {i} {rng.choice(KEYWORDS)}\n" for i in range(rng.randint(10, 5000))))
+    env = dict(os.environ, **GIT_ENV)
+    subprocess.run(["git", "init", "-q", "-b", "main", path], check=True, env=env)
+    subprocess.run(["git", "-C", path, "add", "-A"], check=True, env=env)
+    subprocess.run(["git", "-C", path, "commit", "-q", "-m", "init"], check=True, env=env)
+
+def make_corpus(root, count, seed=0):
+    """root/src 配下にcount個のリポジトリを作り、repos.json形式のリストを返す。"""
+    rng = random.Random(seed)
+    repos = []
+    for i in range(count):
+        name = f"bench-repo-{i:05d}"
+        path = os.path.abspath(os.path.join(root, "src", name))
+        if not os.path.isdir(os.path.join(path, ".git")):
+            make_repo(path, rng, i)
+        repos.append({
+            "name": name,
+            "full_name": f"bench/{name}",
+            "clone_url": path,
+            "stars": rng.randint(0, 50000),
+            "html_url": f"https://github.com/bench/{name}",
+            "description": f"synthetic benchmark repository {i}",
+        })
+    return repos
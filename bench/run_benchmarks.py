@@ -0,0 +1,120 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+from corpus import make_corpus
+from stubs import start_openai_stub, start_github_stub, install_fake_docker
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# (ステージ名, スクリプト, 引数, 標準入力)
+STAGES = [
+    ("search", "search_github_projects.py", ["--max-results", "{n}"], "ベンチマーク用の検索\n"),
+    ("clone", "clone_projects.py", [], None),
+    ("check", "check_repo_files.py", [], None),
+    ("report", "generate_report.py", [], None),
+    ("docker", "docker_test_runner.py", [], None),
+    ("markdown", "generate_markdown_report.py", [], None),
+]
+
+def run_stage(script, args, stdin, cwd, env):
+    """子プロセスでステージを実行し (秒数, ピークRSS[MB], 終了コード) を返す。"""
+    log_path = os.path.join(cwd, "logs", f"{os.path.splitext(script)[0]}.out")
+    with open(log_path, "w", encoding="utf-8") as out:
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, script)] + args,
+            cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=out, stderr=subprocess.STDOUT, text=True
+        )
+        if stdin:
+            proc.stdin.write(stdin)
+        proc.stdin.close()
+        # wait4でこの子プロセス単独のrusageを取得
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return elapsed, usage.ru_maxrss / 1024, proc.returncode
+
+def bench_size(n, args, corpus_root):
+    workspace = tempfile.mkdtemp(prefix=f"aicheck-bench-{n}-")
+    os.makedirs(os.path.join(workspace, "logs"))
+    os.makedirs(os.path.join(workspace, "output"))
+    for template in ("report_template.md", "report_repo.md", "report_index.md"):
+        shutil.copy(os.path.join(ROOT, template), workspace)
+    print(f"== {n} repos: コーパス生成中 ...")
+    repos = make_corpus(corpus_root, n, seed=args.seed)
+    openai_stub = start_openai_stub(args.llm_latency)
+    github_stub = start_github_stub(repos, args.github_latency)
+    bin_dir = os.path.join(workspace, "bin")
+    install_fake_docker(bin_dir)
+    env = dict(
+        os.environ,
+        PATH=bin_dir + os.pathsep + os.environ.get("PATH", ""),
+        CLONE_DIR=os.path.join(workspace, "repos"),
+        OPENAI_API_KEY="bench",
+        OPENAI_API_BASE=f"http://127.0.0.1:{openai_stub.server_port}/v1",
+        GITHUB_API_URL=f"http://127.0.0.1:{github_stub.server_port}/search/repositories",
+        FAKE_DOCKER_LATENCY=str(args.docker_latency),
+        LLM_CACHE="1" if args.llm_cache else "0",
+    )
+    results = {}
+    try:
+        for name, script, stage_args, stdin in STAGES:
+            if name == "clone":
+                # 検索結果の代わりにコーパスのrepos.jsonで以降のステージを回す
+                with open(os.path.join(workspace, "output", "repos.json"), "w", encoding="utf-8") as f:
+                    json.dump(repos, f, ensure_ascii=False, indent=2)
+            stage_args = [a.format(n=n) for a in stage_args]
+            elapsed, peak_rss, returncode = run_stage(script, stage_args, stdin, workspace, env)
+            results[name] = {
+                "seconds": round(elapsed, 3),
+                "repos_per_sec": round(n / elapsed, 2) if elapsed else None,
+                "peak_rss_mb": round(peak_rss, 1),
+                "returncode": returncode,
+            }
+            print(f"  {name:<9} {elapsed:8.2f}s  {n / elapsed:8.1f} repos/s  RSS {peak_rss:7.1f}MB  rc={returncode}")
+    finally:
+        openai_stub.shutdown()
+        github_stub.shutdown()
+        if not args.keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="合成コーパスと偽OpenAI/GitHub/dockerで各ステージの性能を計測")
+    parser.add_argument("--sizes", default="10,100,1000", help="リポジトリ数（カンマ区切り）")
+    parser.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "aicheck-bench-corpus"), help="合成リポジトリの置き場（再利用される）")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="偽OpenAIの応答遅延（秒）")
+    parser.add_argument("--github-latency", type=float, default=0.02, help="偽GitHub検索の応答遅延（秒）")
+    parser.add_argument("--docker-latency", type=float, default=0.05, help="偽dockerの1コマンドあたりの遅延（秒）")
+    parser.add_argument("--llm-cache", action="store_true", help="LLMキャッシュを有効にして計測")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="作業ディレクトリを削除しない")
+    parser.add_argument("--output", default=None, help="結果JSONの出力先（既定: bench/results/<日時>.json）")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "settings": {k: v for k, v in vars(args).items() if k not in ("output",)},
+        "sizes": {},
+    }
+    for n in sizes:
+        report["sizes"][str(n)] = bench_size(n, args, args.corpus_dir)
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"ベンチマーク結果を {output} に保存しました。")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+FAKE_DOCKER = r'''#!/usr/bin/env python3
+# ベンチマーク用の偽dockerコマンド。FAKE_DOCKER_LATENCY秒待ってそれらしい出力を返す。
+# FAKE_DOCKER_LOG を指定すると実行されたコマンドを1行1JSONで追記し、そのログで
+# pull/build済みのイメージだけを存在するものとして扱う（コマンド列の確認用）。
+# FAKE_DOCKER_PULL_FAIL（カンマ区切り）に含まれるイメージのpullは失敗させる。
+import os, sys, json, time, signal, tempfile
+time.sleep(float(os.environ.get("FAKE_DOCKER_LATENCY", "0.05")))
+argv = sys.argv[1:]
+cmd = argv[0] if argv else ""
+log = os.environ.get("FAKE_DOCKER_LOG")
+pull_fail = set(filter(None, os.environ.get("FAKE_DOCKER_PULL_FAIL", "").split(",")))
+
+def known_images():
+    images = set()
+    if log and os.path.exists(log):
+        with open(log, encoding="utf-8") as f:
+            for line in f:
+                prev = json.loads(line)
+                if prev[:1] == ["pull"] and prev[1] not in pull_fail:
+                    images.add(prev[1])
+                elif prev[:1] == ["build"] and "-t" in prev:
+                    images.add(prev[prev.index("-t") + 1])
+                elif prev[:1] == ["rmi"]:
+                    images.difference_update(prev[1:])
+    return images
+
+present = known_images()
+if log:
+    with open(log, "a", encoding="utf-8") as f:
+        f.write(json.dumps(argv) + "\n")
+if cmd == "pull" and argv[1] in pull_fail:
+    print(f"Error response from daemon: pull access denied for {argv[1]}", file=sys.stderr)
+    sys.exit(1)
+elif cmd == "build":
+    for i in range(int(os.environ.get("FAKE_DOCKER_BUILD_LINES", "200"))):
+        print(f"#{i} RUN step {i} ... done")
+elif cmd == "run":
+    # --name付きならkillで止められるようpidを残す。FAKE_DOCKER_RUN_OUTPUTで出力、FAKE_DOCKER_HANGで出力後の待機秒、
+    # FAKE_DOCKER_RUN_EXITで終了コードを指定
+    if "--name" in argv:
+        with open(os.path.join(tempfile.gettempdir(), "fake-docker-" + argv[argv.index("--name") + 1] + ".pid"), "w") as f:
+            f.write(str(os.getpid()))
+    print(os.environ.get("FAKE_DOCKER_RUN_OUTPUT", "collected 3 items\n===== 3 passed in 0.01s ====="), flush=True)
+    time.sleep(float(os.environ.get("FAKE_DOCKER_HANG", "0")))
+    sys.exit(int(os.environ.get("FAKE_DOCKER_RUN_EXIT", "0")))
+elif cmd == "kill":
+    pid_file = os.path.join(tempfile.gettempdir(), "fake-docker-" + argv[1] + ".pid")
+    if os.path.exists(pid_file):
+        with open(pid_file) as f:
+            pid = int(f.read())
+        os.remove(pid_file)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+elif cmd == "image" and argv[1:2] == ["inspect"]:
+    if log and argv[-1] not in present:
+        print(f"Error: No such image: {argv[-1]}", file=sys.stderr)
+        sys.exit(1)
+    print("123456789")
+elif cmd == "stats":
+    print("12.5MiB / 1GiB")
+'''
+
+def _serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# 偽OpenAIが受け付けるコンテキスト長（文字数/4で概算）
+STUB_CONTEXT_TOKENS = 4096
+
+def start_openai_stub(latency=0.0, errors=()):
+    """/v1/chat/completions を模したスタブ。固定の要約とusageを返す。
+
+    errors に (ステータス, ヘッダdict) を並べると、最初のリクエストから順にそのエラーを返す。
+    受けたリクエスト本文は server.requests に残す。
+    """
+    errors = list(errors)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(latency)
+            server.requests.append(request)
+            if errors:
+                status, headers = errors.pop(0)
+                self._reply(status, {"error": {"message": f"stub error {status}", "type": "stub_error"}}, headers)
+                return
+            prompt_chars = sum(len(m.get("content", "")) for m in request.get("messages", []))
+            if prompt_chars // 4 + request.get("max_tokens", 0) > STUB_CONTEXT_TOKENS:
+                # 実APIと同様にコンテキスト長超過は400で拒否する
+                self._reply(400, {"error": {
+                    "message": f"This model's maximum context length is {STUB_CONTEXT_TOKENS} tokens.",
+                    "type": "invalid_request_error",
+                    "code": "context_length_exceeded",
+                }})
+                return
+            self._reply(200, {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "- 用途A\n- 使い方B\n- 導入C"},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": 20, "total_tokens": prompt_chars // 4 + 20}
+            })
+
+        def _reply(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = _serve(Handler)
+    server.requests = []
+    return server
+
+def start_github_stub(repos, latency=0.0, rate_limited=0):
+    """/search/repositories を模したスタブ。reposをページングして返し、ETagに対応する。
+
+    最初の rate_limited 回はレート制限切れ（403, X-RateLimit-Remaining: 0）を返す。
+    受けたリクエストは server.requests に (page, If-None-Match, ステータス) で残す。
+    """
+    limited = [rate_limited]
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            query = parse_qs(urlparse(self.path).query)
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["30"])[0])
+            etag = f'"{len(repos)}-{page}-{per_page}"'
+            if limited[0] > 0:
+                limited[0] -= 1
+                server.requests.append((page, self.headers.get("If-None-Match"), 403))
+                body = b'{"message": "API rate limit exceeded"}'
+                self.send_response(403)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-RateLimit-Remaining", "0")
+                self.send_header("X-RateLimit-Reset", str(int(time.time()) + 5))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if self.headers.get("If-None-Match") == etag:
+                server.requests.append((page, etag, 304))
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            items = [
+                {
+                    "name": r["name"],
+                    "full_name": r["full_name"],
+                    "clone_url": r["clone_url"],
+                    "stargazers_count": r["stars"],
+                    "html_url": r["html_url"],
+                    "description": r["description"],
+                    "default_branch": "main",
+                }
+                for r in repos[(page - 1) * per_page:page * per_page]
+            ]
+            body = json.dumps({"total_count": len(repos), "items": items}).encode("utf-8")
+            server.requests.append((page, self.headers.get("If-None-Match"), 200))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("X-RateLimit-Remaining", "5000")
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = _serve(Handler)
+    server.requests = []
+    return server
+
+def install_fake_docker(bin_dir):
+    """bin_dir/docker に偽dockerを書き出す（PATHの先頭にbin_dirを置いて使う）。"""
+    import os
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, "docker")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(FAKE_DOCKER)
+    os.chmod(path, 0o755)
+    return path
@@ -1,7 +1,10 @@
 import os
 import json
+import argparse
 import logging
 from dotenv import load_dotenv
+import metrics
+from repo_index import build_index, index_repo, save_index, INDEX_FILE
 
 load_dotenv()
 REPOS_DIR = os.environ.get("CLONE_DIR", "repos")
@@ -15,12 +18,29 @@ logging.basicConfig(
     encoding="utf-8"
 )
 
-def check_files(repo_path):
-    readme_exists = os.path.isfile(os.path.join(repo_path, "README.md"))
-    dockerfile_exists = os.path.isfile(os.path.join(repo_path, "Dockerfile"))
+def check_files(repo_path, entry=None):
+    # READMEはreadme.rst等、Dockerfileはdockerfile等の表記揺れも含めて判定
+    if entry is None:
+        entry = index_repo(repo_path)
+    readme_exists = "readme" in entry["kinds"]
+    dockerfile_exists = "dockerfile" in entry["kinds"]
     return readme_exists, dockerfile_exists
 
-def main():
+def check_result(repo_name, entry):
+    """check_results.json の1件分。"""
+    readme, dockerfile = check_files(entry["path"], entry)
+    return {
+        "repo_name": repo_name,
+        "path": entry["path"],
+        "readme": readme,
+        "dockerfile": dockerfile,
+        "readme_file": entry["kinds"].get("readme"),
+        "dockerfile_file": entry["kinds"].get("dockerfile")
+    }
+
+def main(argv=None):
+    argparse.ArgumentParser(description="cloneしたリポジトリのREADME・Dockerfile有無を判定").parse_args(argv)
+    metrics.init("check")
     results = []
     if not os.path.exists(REPOS_DIR):
         msg = "repos ディレクトリがありません。先にclone処理を実行してください。"
@@ -28,21 +48,18 @@ def main():
         logging.info(msg)
         return
 
-    for repo_name in os.listdir(REPOS_DIR):
-        repo_path = os.path.join(REPOS_DIR, repo_name)
-        if os.path.isdir(repo_path):
-            readme, dockerfile = check_files(repo_path)
-            results.append({
-                "repo_name": repo_name,
-                "path": repo_path,
-                "readme": readme,
-                "dockerfile": dockerfile
-            })
+    # 各リポジトリを1回ずつscandirし、後続ステージ用にインデックスを保存
+    with metrics.span("index"):
+        index = build_index(REPOS_DIR)
+        save_index(index)
+    metrics.incr("repos", len(index))
+    for repo_name, entry in index.items():
+        results.append(check_result(repo_name, entry))
 
     with open(RESULT_FILE, "w", encoding="utf-8") as f:
         json.dump(results, f, ensure_ascii=False, indent=2)
 
-    msg = f"チェック結果を {RESULT_FILE} に保存しました。"
+    msg = f"チェック結果を {RESULT_FILE}、ファイルインデックスを {INDEX_FILE} に保存しました。"
     print(msg)
     logging.info(msg)
 
@@ -1,9 +1,15 @@
 import os
+import shutil
 import subprocess
 import json
+import time
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+import metrics
+from repo_index import RELEVANT_FILES
+from results_store import ResultsStore, input_fingerprint
 
 load_dotenv()
 
@@ -15,46 +21,249 @@ logging.basicConfig(
     encoding="utf-8"
 )
 
-def clone_repo(clone_url, repo_name, base_dir):
+# search_github_projects.py の出力を読み、path等を追記して同じファイルへ書き戻す
+REPOS_JSON = "output/repos.json"
+DEFAULT_JOBS = int(os.environ.get("CLONE_JOBS", "4"))
+# full: 履歴ごとclone / metadata: bloblessミラーから解析に使うファイルだけ展開（Docker対象のみ作業ツリー全体）
+CLONE_MODE = os.environ.get("CLONE_MODE", "full")
+MIRROR_DIR = os.environ.get("MIRROR_DIR", os.path.join(".cache", "mirrors"))
+# metadataモードで展開したディレクトリの目印（中身は展開元のコミット）
+METADATA_MARKER = ".aicheck-metadata"
+
+def _log(msg):
+    print(msg)
+    logging.info(msg)
+
+def _git(args):
+    # 並列実行時に進捗表示が混ざらないよう出力は捕捉する
+    return subprocess.run(["git"] + args, check=True, capture_output=True, text=True, encoding="utf-8", errors="replace")
+
+def refresh_repo(repo_name, target_dir):
+    """既存チェックアウトを git fetch + fast-forward で最新化する。"""
+    _log(f"Refreshing {repo_name} ...")
+    _git(["-C", target_dir, "fetch", "--prune", "origin"])
+    try:
+        _git(["-C", target_dir, "merge", "--ff-only", "@{u}"])
+    except subprocess.CalledProcessError as e:
+        # upstream未設定・分岐済みの場合はfetchのみで終了
+        _log(f"{repo_name}: fast-forward できませんでした: {e.stderr.strip()}")
+        return "fetched"
+    return "updated"
+
+def clone_repo(clone_url, repo_name, base_dir, mode=CLONE_MODE):
+    """1リポジトリをclone（既存ならrefresh）し、{"status", "duration", "checkout"} を返す。
+
+    checkout は作業ツリー全体なら "full"、解析用ファイルのみなら "metadata"。
+    """
+    with metrics.span("clone", repo=repo_name, mode=mode):
+        if mode == "metadata":
+            outcome = _sync_metadata(clone_url, repo_name, base_dir)
+        else:
+            outcome = _clone_or_refresh(clone_url, repo_name, base_dir)
+    metrics.incr("clone_results", status=outcome["status"], checkout=outcome["checkout"])
+    return outcome
+
+def is_metadata_managed(target_dir):
+    """metadataモードで作ったディレクトリ（展開のみ、またはミラーのworktree）か。"""
+    return os.path.isfile(os.path.join(target_dir, METADATA_MARKER)) or os.path.isfile(os.path.join(target_dir, ".git"))
+
+def update_mirror(clone_url, repo_name, mirror_dir=MIRROR_DIR):
+    """blobless（--filter=blob:none）のbareミラーを作成または更新し (パス, 新規作成か) を返す。
+
+    コミットとツリーのみ取得し、ファイル本体は必要になった分だけ取り寄せる。
+    """
+    path = os.path.abspath(os.path.join(mirror_dir, repo_name + ".git"))
+    if os.path.isdir(path):
+        _git(["-C", path, "fetch", "--prune", "origin"])
+        return path, False
+    os.makedirs(mirror_dir, exist_ok=True)
+    _git(["clone", "--mirror", "--filter=blob:none", clone_url, path])
+    return path, True
+
+def root_files(mirror, rev):
+    """revの直下にあるファイル {名前: blobのsha}。"""
+    files = {}
+    for line in _git(["-C", mirror, "ls-tree", rev]).stdout.splitlines():
+        meta, name = line.split("\t", 1)
+        _, kind, sha = meta.split()
+        if kind == "blob":
+            files[name] = sha
+    return files
+
+def relevant_kinds(names):
+    """ファイル名一覧から repo_index と同じ基準で種別を判定する。"""
+    return {kind for kind, (_, pat) in RELEVANT_FILES.items() if any(pat.match(n) for n in names)}
+
+def materialize_metadata(mirror, rev, files, target_dir):
+    """解析に使うファイルだけを target_dir へ書き出す（履歴・作業ツリーは作らない）。"""
+    wanted = {name: sha for name, sha in files.items() if any(pat.match(name) for _, pat in RELEVANT_FILES.values())}
+    if wanted:
+        # 必要なblobを1回のfetchでまとめて取得（cat-fileに任せると1ファイル毎に取得しに行く）
+        _git(["-C", mirror, "fetch", "--no-tags", "--no-write-fetch-head", "origin"] + sorted(set(wanted.values())))
+    tmp = target_dir + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, sha in wanted.items():
+        blob = subprocess.run(["git", "-C", mirror, "cat-file", "blob", sha], check=True, capture_output=True).stdout
+        with open(os.path.join(tmp, name), "wb") as f:
+            f.write(blob)
+    with open(os.path.join(tmp, METADATA_MARKER), "w", encoding="utf-8") as f:
+        f.write(rev + "\n")
+    _remove_checkout(target_dir, mirror)
+    os.replace(tmp, target_dir)
+
+def materialize_worktree(mirror, rev, target_dir):
+    """ミラーのworktreeとして作業ツリー全体を用意する（既存ならrevへ切り替え）。"""
+    if os.path.isfile(os.path.join(target_dir, ".git")):
+        _git(["-C", target_dir, "checkout", "--detach", "--force", rev])
+        return
+    _remove_checkout(target_dir, mirror)
+    _git(["-C", mirror, "worktree", "add", "--detach", "--force", os.path.abspath(target_dir), rev])
+
+def _remove_checkout(target_dir, mirror=None):
+    if os.path.lexists(target_dir):
+        shutil.rmtree(target_dir)
+    if mirror:
+        _git(["-C", mirror, "worktree", "prune"])
+
+def current_rev(target_dir):
+    """展開済みディレクトリ・worktreeが指すコミット（不明ならNone）。"""
+    marker = os.path.join(target_dir, METADATA_MARKER)
+    if os.path.isfile(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    if os.path.isfile(os.path.join(target_dir, ".git")):
+        result = subprocess.run(["git", "-C", target_dir, "rev-parse", "HEAD"], capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+    return None
+
+def _sync_metadata(clone_url, repo_name, base_dir):
+    target_dir = os.path.join(base_dir, repo_name)
+    start = time.monotonic()
+    checkout = "metadata"
+    try:
+        if os.path.isdir(os.path.join(target_dir, ".git")):
+            # fullモードでclone済みのものはそのまま更新する
+            _log(f"{repo_name} is a full clone. Refreshing in place ...")
+            status = refresh_repo(repo_name, target_dir)
+            checkout = "full"
+        else:
+            _log(f"Syncing mirror of {repo_name} ...")
+            mirror, created = update_mirror(clone_url, repo_name)
+            rev = _git(["-C", mirror, "rev-parse", "HEAD"]).stdout.strip()
+            files = root_files(mirror, rev)
+            kinds = relevant_kinds(files)
+            # Dockerステージの対象（READMEとDockerfileがある）だけ作業ツリー全体を展開
+            if "readme" in kinds and "dockerfile" in kinds:
+                checkout = "full"
+            previous = current_rev(target_dir)
+            was_full = os.path.isfile(os.path.join(target_dir, ".git"))
+            if previous == rev and was_full == (checkout == "full"):
+                status = "fetched"
+            else:
+                if checkout == "full":
+                    materialize_worktree(mirror, rev, target_dir)
+                else:
+                    materialize_metadata(mirror, rev, files, target_dir)
+                status = "cloned" if created or previous is None else "updated"
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode("utf-8", "replace") if isinstance(e.stderr, bytes) else (e.stderr or "")
+        _log(f"Clone failed for {repo_name}: {e} {stderr.strip()}")
+        status = "failed"
+    except Exception as e:
+        _log(f"Unexpected error for {repo_name}: {e}")
+        status = "failed"
+    return {"status": status, "duration": round(time.monotonic() - start, 3), "checkout": checkout}
+
+def _clone_or_refresh(clone_url, repo_name, base_dir):
     target_dir = os.path.join(base_dir, repo_name)
+    start = time.monotonic()
     need_clone = False
     if not os.path.exists(target_dir):
         need_clone = True
     elif not os.listdir(target_dir):
-        msg = f"{repo_name} exists but is empty. Re-cloning ..."
-        print(msg)
-        logging.info(msg)
+        _log(f"{repo_name} exists but is empty. Re-cloning ...")
         need_clone = True
-    if need_clone:
-        msg = f"Cloning {repo_name} ..."
-        print(msg)
-        logging.info(msg)
-        try:
-            subprocess.run(["git", "clone", clone_url, target_dir], check=True)
-        except subprocess.CalledProcessError as e:
-            msg = f"Clone failed for {repo_name}: {e}"
-            print(msg)
-            logging.info(msg)
-        except Exception as e:
-            msg = f"Unexpected error for {repo_name}: {e}"
-            print(msg)
-            logging.info(msg)
-    else:
-        msg = f"{repo_name} already exists. Skipping."
-        print(msg)
-        logging.info(msg)
+    try:
+        if not need_clone and is_metadata_managed(target_dir):
+            # metadataモードで展開したものは通常のcloneに置き換える
+            _log(f"{repo_name} is a metadata checkout. Re-cloning ...")
+            _remove_checkout(target_dir)
+            need_clone = True
+        if need_clone:
+            _log(f"Cloning {repo_name} ...")
+            _git(["clone", clone_url, target_dir])
+            status = "cloned"
+        elif os.path.isdir(os.path.join(target_dir, ".git")):
+            status = refresh_repo(repo_name, target_dir)
+        else:
+            _log(f"{repo_name} already exists (not a git checkout). Skipping.")
+            status = "skipped"
+    except subprocess.CalledProcessError as e:
+        _log(f"Clone failed for {repo_name}: {e} {(e.stderr or '').strip()}")
+        status = "failed"
+    except Exception as e:
+        _log(f"Unexpected error for {repo_name}: {e}")
+        status = "failed"
+    return {"status": status, "duration": round(time.monotonic() - start, 3), "checkout": "full"}
+
+def clone_all(repos, base_dir, jobs=DEFAULT_JOBS, store=None, run_id=None, mode=CLONE_MODE):
+    """reposを最大jobs並列でcloneし、入力順のまま各repoへpath/clone_status/clone_durationを付与する。
+
+    storeを渡すと1件終わる毎に結果を保存し、同じrun_idで処理済みのrepoはスキップする。
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    done = store.completed(run_id) if store else {}
+    # clone先は base_dir/name なので、同名のリポジトリ（オーナー違い）は最初の1件だけ扱う
+    owner_of = {}
+    for position, repo in enumerate(repos):
+        owner_of.setdefault(repo["name"], position)
 
-def main():
+    def work(position, repo):
+        if position in done:
+            repo.update(done[position])
+            return
+        first = owner_of[repo["name"]]
+        if first != position:
+            _log(f"{repo.get('full_name', repo['name'])} は {repos[first].get('full_name', repo['name'])} と"
+                 f"clone先が同じになるため省略します")
+            # 他のリポジトリのチェックアウトを指さないようpathは外す
+            repo.pop("path", None)
+            repo["clone_status"] = "skipped"
+            repo["clone_duration"] = 0.0
+            repo["checkout"] = None
+        else:
+            outcome = clone_repo(repo["clone_url"], repo["name"], base_dir, mode)
+            repo["path"] = os.path.join(base_dir, repo["name"])
+            repo["clone_status"] = outcome["status"]
+            repo["clone_duration"] = outcome["duration"]
+            repo["checkout"] = outcome["checkout"]
+        if store:
+            store.put("clone", run_id, repo["name"], position, repo)
+
+    if done:
+        _log(f"前回中断した実行を再開します（処理済み {len(done)} 件）")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for future in [pool.submit(work, i, r) for i, r in enumerate(repos)]:
+            future.result()
+    return repos
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="GitHubリポジトリを指定ディレクトリにclone")
     parser.add_argument("--dir", default=None, help="clone先ディレクトリ (環境変数CLONE_DIR優先、未指定時はrepos)")
-    args = parser.parse_args()
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"並列clone数 (環境変数CLONE_JOBS、未指定時は{DEFAULT_JOBS})")
+    parser.add_argument("--restart", action="store_true", help="中断した前回実行を再開せず最初からやり直す")
+    parser.add_argument("--mode", choices=["full", "metadata"], default=CLONE_MODE,
+                        help=f"metadata: 共有ミラーから解析用ファイルのみ展開し、Docker対象だけ作業ツリー全体を用意 (環境変数CLONE_MODE、既定{CLONE_MODE})")
+    args = parser.parse_args(argv)
+    metrics.init("clone")
 
     env_dir = os.environ.get("CLONE_DIR")
     base_dir = args.dir if args.dir else (env_dir if env_dir else "repos")
 
-    repos_json = "repos.json"
+    repos_json = REPOS_JSON
     if not os.path.exists(repos_json):
-        msg = "repos.json が見つかりません。先に検索スクリプトを実行してください。"
+        msg = f"{REPOS_JSON} が見つかりません。先に検索スクリプトを実行してください。"
         print(msg)
         logging.info(msg)
         return
@@ -62,13 +271,13 @@ def main():
     with open(repos_json, "r", encoding="utf-8") as f:
         repos = json.load(f)
 
-    os.makedirs(base_dir, exist_ok=True)
-    for repo in repos:
-        clone_repo(repo["clone_url"], repo["name"], base_dir)
-        repo["path"] = os.path.join(base_dir, repo["name"])
-    # クローン後にpathキーをrepos.jsonへ保存
-    with open(repos_json, "w", encoding="utf-8") as f:
-        json.dump(repos, f, ensure_ascii=False, indent=2)
+    store = ResultsStore()
+    run_id = store.start_run("clone", resume=not args.restart, fingerprint=input_fingerprint(repos))
+    clone_all(repos, base_dir, args.jobs, store, run_id, args.mode)
+    store.finish_run(run_id)
+    # クローン後にpath/ステータスをrepos.jsonへ書き出し（入力順）
+    store.export_json(run_id, repos_json)
+    store.close()
 
 if __name__ == "__main__":
     main()
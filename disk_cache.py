@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import metrics
+
+
+def make_key(*parts):
+    """任意のJSON化可能な値からキャッシュキー（sha256）を作る。"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """1エントリ1JSONファイルのディスクキャッシュ。
+
+    - 作成からmax_age秒を超えたエントリは期限切れ（TTL、アクセスしても延長しない）
+    - 合計サイズがmax_bytesを超えたら最終アクセスの古い順に削除（LRU）
+
+    ファイルのmtimeを作成時刻、atimeを最終アクセス時刻として使う。
+    """
+
+    def __init__(self, cache_dir, max_bytes=200 * 1024 * 1024, max_age=7 * 24 * 3600, name="cache"):
+        self.cache_dir = cache_dir
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._miss()
+            return None
+        if self.max_age and time.time() - entry.get("created", 0) > self.max_age:
+            self._remove(path)
+            self._miss()
+            return None
+        # LRU用に最終アクセス時刻（atime）だけ更新し、mtime（作成時刻）はTTL判定用に残す
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        metrics.incr("cache_hits", cache=self.name)
+        return entry.get("value")
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        metrics.incr("cache_misses", cache=self.name)
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "value": value}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """期限切れとサイズ超過分を削除し、削除件数を返す。"""
+        entries = []
+        now = time.time()
+        removed = 0
+        with os.scandir(self.cache_dir) as it:
+            for e in it:
+                if not e.name.endswith(".json"):
+                    continue
+                st = e.stat()
+                if self.max_age and now - st.st_mtime > self.max_age:
+                    self._remove(e.path)
+                    removed += 1
+                    continue
+                entries.append((st.st_atime, st.st_size, e.path))
+        total = sum(size for _, size, _ in entries)
+        if self.max_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+        return removed
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -1,15 +1,103 @@
 import os
 import json
+import time
+import argparse
+import threading
 import subprocess
-import openai
 import logging
+import hashlib
+import gzip
+import re
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from disk_cache import DiskCache, make_key
+from llm_client import achat_completion, estimate_tokens, truncate_to_tokens, MODEL_CONTEXT_TOKENS
+from results_store import ResultsStore, input_fingerprint
+import perf_history
+import metrics
 
 OUTPUT_DIR = "output"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 RESULT_FILE = os.path.join(OUTPUT_DIR, "check_results.json")
 TEST_RESULT_FILE = os.path.join(OUTPUT_DIR, "test_results.json")
 AI_REPORT_FILE = os.path.join(OUTPUT_DIR, "ai_summary_report.md")
+# 前回のビルド＋テスト所要時間（長いものから投入するために使用）
+DURATION_FILE = os.path.join(OUTPUT_DIR, "test_durations.json")
+
+BUILD_TIMEOUT = 600
+RUN_TIMEOUT = 100
+DEFAULT_BUILD_JOBS = int(os.environ.get("DOCKER_BUILD_JOBS", "2"))
+DEFAULT_RUN_JOBS = int(os.environ.get("DOCKER_RUN_JOBS", "4"))
+
+# ビルド・テスト結果キャッシュ（HEAD・Dockerfile・ビルドコンテキスト・テストコマンドで判定）
+BUILD_CACHE_DIR = os.environ.get("BUILD_CACHE_DIR", os.path.join(".cache", "docker_results"))
+BUILD_CACHE_MAX_MB = int(os.environ.get("BUILD_CACHE_MAX_MB", "200"))
+BUILD_CACHE_MAX_AGE_DAYS = float(os.environ.get("BUILD_CACHE_MAX_AGE_DAYS", "7"))
+BUILD_TIMEOUT_MSG = "Dockerビルドがタイムアウトしました。"
+RUN_TIMEOUT_MSG = "Dockerテストがタイムアウトしました。"
+# dockerコマンド自体を実行できなかった場合のログの先頭
+DOCKER_ERROR_MSG = "dockerコマンドを実行できませんでした: "
+# デーモン・レジストリ側の一時的な障害。これらを含む結果はキャッシュしない
+DOCKER_TRANSIENT_ERRORS = [
+    "Cannot connect to the Docker daemon",
+    "Is the docker daemon running",
+    "error during connect",
+    "toomanyrequests",
+    "TLS handshake timeout",
+]
+
+# ビルド・テストログ全文はここへgzipで保存し、結果JSONには先頭・末尾の抜粋のみ残す
+DOCKER_LOG_DIR = os.path.join("logs", "docker")
+LOG_HEAD_CHARS = 1000
+LOG_TAIL_CHARS = 1000
+TEST_FAILURE_KEYWORDS = ["failed", "timeout", "error", "ハング", "停止"]
+
+# テスト出力を1行ずつ照合する判定ルール (名前, 種別, 正規表現)。
+# fail は判定確定としてその場でコンテナを停止する。suspect は失敗扱いにするが実行は続ける。
+# pass は途中で止めず、終了コード0で終わり出力の末尾TEST_PASS_TAIL_LINES行以内に一致した場合だけ
+# 成功とする（suspectより優先）。途中で "OK" 等を出力するだけのプログラムを成功と誤判定しないため
+TEST_RULES_CONFIG = os.environ.get("TEST_RULES_CONFIG", "test_rules.json")
+DEFAULT_TEST_RULES = [
+    ("python_import_error", "fail", r"^(ModuleNotFoundError|ImportError|SyntaxError|IndentationError): "),
+    ("segfault", "fail", r"[Ss]egmentation fault|core dumped"),
+    ("oom_killed", "fail", r"[Oo]ut of memory|^Killed$"),
+    ("npm_error", "fail", r"^npm ERR! "),
+    ("pytest_failed", "fail", r"^(=+ )?(\d+ \w+, )*\d+ (failed|errors?)\b.* in [\d.]+s"),
+    ("unittest_failed", "fail", r"^FAILED \((failures|errors)=\d+"),
+    ("jest_failed", "fail", r"^Tests:\s+(\d+ \w+, )*\d+ failed"),
+    ("pytest_passed", "pass", r"^(=+ )?\d+ passed(, \d+ (skipped|warnings?|deselected|xfailed|xpassed))* in [\d.]+s"),
+    ("unittest_ok", "pass", r"^OK( \(.*\))?$"),
+    ("jest_passed", "pass", r"^Tests:\s+(\d+ skipped, )?\d+ passed, \d+ total"),
+] + [(f"keyword:{kw}", "suspect", re.escape(kw)) for kw in TEST_FAILURE_KEYWORDS]
+TEST_PASS_TAIL_LINES = int(os.environ.get("TEST_PASS_TAIL_LINES", "20"))
+# この秒数出力がなければハングとみなして停止する（既定0で無効。出力の少ない遅いテストを止めないよう明示指定時のみ）
+RUN_IDLE_TIMEOUT = float(os.environ.get("DOCKER_IDLE_TIMEOUT", "0"))
+RUN_IDLE_TIMEOUT_MSG = "Dockerテストの出力が途絶えたため停止しました。"
+
+# テスト結果要約（map-reduce）。1リクエストの入力予算と同時実行数
+TEST_SUMMARY_MAX_TOKENS = 512
+TEST_SUMMARY_INPUT_TOKENS = MODEL_CONTEXT_TOKENS - TEST_SUMMARY_MAX_TOKENS - 300
+TEST_SUMMARY_CONCURRENCY = int(os.environ.get("TEST_SUMMARY_CONCURRENCY", "4"))
+
+# テスト後に残すリポジトリイメージの合計サイズ上限（ベースイメージ分は除く）。0なら毎回削除
+IMAGE_BUDGET_MB = int(os.environ.get("DOCKER_IMAGE_BUDGET_MB", "10240"))
+
+# テストコンテナのメモリ使用量を取得する間隔（秒、0で取得しない）
+DOCKER_STATS_INTERVAL = float(os.environ.get("DOCKER_STATS_INTERVAL", "1"))
+# コンテナのcgroupのピークメモリ（v2 systemd / v2 cgroupfs / v1）。読めなければ docker stats を使う
+CGROUP_MEMORY_FILES = [
+    "/sys/fs/cgroup/system.slice/docker-{id}.scope/memory.peak",
+    "/sys/fs/cgroup/docker/{id}/memory.peak",
+    "/sys/fs/cgroup/memory/docker/{id}/memory.max_usage_in_bytes",
+    "/sys/fs/cgroup/memory/system.slice/docker-{id}.scope/memory.max_usage_in_bytes",
+]
+SIZE_RE = re.compile(r"^([\d.]+)\s*([kKMGT]?i?B)$")
+SIZE_UNITS = {
+    "B": 1, "kB": 1000, "KB": 1000, "MB": 1000 ** 2, "GB": 1000 ** 3, "TB": 1000 ** 4,
+    "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4,
+}
 
 LOG_FILE = "logs/all.log"
 logging.basicConfig(
@@ -20,58 +108,726 @@ logging.basicConfig(
 )
 
 load_dotenv()
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
 
-def run_docker_build_and_test(repo_path, repo_name):
-    build_cmd = ["docker", "build", "-t", f"{repo_name.lower()}_img", repo_path]
+def docker_image_name(repo_name):
+    return f"{repo_name.lower()}_img"
+
+class LogExcerpt:
+    """出力を行単位で受け取り、先頭LOG_HEAD_CHARS文字と末尾LOG_TAIL_CHARS文字だけ保持する。"""
+
+    def __init__(self, head_chars=LOG_HEAD_CHARS, tail_chars=LOG_TAIL_CHARS):
+        self.head_chars = head_chars
+        self.tail_chars = tail_chars
+        self.head = []
+        self.head_len = 0
+        self.tail = deque()
+        self.tail_len = 0
+        self.omitted = False
+
+    def add(self, line):
+        if self.head_len < self.head_chars:
+            part = line[:self.head_chars - self.head_len]
+            self.head.append(part)
+            self.head_len += len(part)
+            line = line[len(part):]
+            if not line:
+                return
+        self.tail.append(line)
+        self.tail_len += len(line)
+        while self.tail_len > self.tail_chars and self.tail:
+            dropped = self.tail.popleft()
+            self.tail_len -= len(dropped)
+            self.omitted = True
+            if self.tail_len < self.tail_chars:
+                # 末尾バッファをちょうど上限まで埋めるよう、削った行の後半を戻す
+                keep = dropped[len(dropped) - (self.tail_chars - self.tail_len):]
+                self.tail.appendleft(keep)
+                self.tail_len += len(keep)
+
+    def text(self):
+        head = "".join(self.head)
+        tail = "".join(self.tail)
+        if self.omitted:
+            return head + "\n...省略...\n" + tail
+        return head + tail
+
+def docker_log_path(repo_name, kind):
+    return os.path.join(DOCKER_LOG_DIR, f"{repo_name}_{kind}.log.gz")
+
+def stream_command(cmd, timeout, log_path, on_line=None, idle_timeout=None, kill=None):
+    """コマンド出力（stdout+stderr）を逐次読み、全文をgzipへ書き出しつつ抜粋のみメモリに保持する。
+
+    on_line(line) が真を返すとその時点で停止し、idle_timeout 秒出力がなくても停止する。
+    kill を渡すと停止時にまず kill() を呼ぶ（docker run の場合はクライアントではなくコンテナを止めるため）。
+    (returncode, 抜粋, 停止理由) を返す。停止理由は None（自然終了）/"timeout"/"idle"/"stopped" で、
+    停止した場合 returncode は None。
+    """
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    excerpt = LogExcerpt()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding="utf-8", errors="replace")
+    decided = threading.Event()
+    last_output = [time.monotonic()]
+
+    def pump():
+        with gzip.open(log_path, "wt", encoding="utf-8") as gz:
+            for line in proc.stdout:
+                last_output[0] = time.monotonic()
+                gz.write(line)
+                excerpt.add(line)
+                if on_line and not decided.is_set() and on_line(line):
+                    decided.set()
+
+    reader = threading.Thread(target=pump, daemon=True)
+    reader.start()
+    started = time.monotonic()
+    ended = None
+    while ended is None:
+        try:
+            proc.wait(timeout=0.2)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+        now = time.monotonic()
+        if decided.is_set():
+            ended = "stopped"
+        elif timeout and now - started > timeout:
+            ended = "timeout"
+        elif idle_timeout and now - last_output[0] > idle_timeout:
+            ended = "idle"
+    if ended:
+        if kill:
+            try:
+                kill()
+                # コンテナが止まればクライアントも終わるので少しだけ待つ
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                pass
+            except Exception as e:
+                logging.info(f"停止コマンド失敗: {e}")
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    reader.join()
+    return (None if ended else proc.returncode), excerpt.text(), ended
+
+def build_image(repo_path, repo_name, dockerfile=None):
+    """Dockerイメージをビルドし (build_success, build_log抜粋, ログファイルパス, 所要秒数) を返す。"""
+    build_cmd = ["docker", "build", "-t", docker_image_name(repo_name)]
+    if dockerfile and dockerfile != "Dockerfile":
+        # dockerfile / Containerfile 等の表記揺れは明示的に指定
+        build_cmd += ["-f", os.path.join(repo_path, dockerfile)]
+    build_cmd.append(repo_path)
+    log_path = docker_log_path(repo_name, "build")
     print(f"[{repo_name}] Dockerビルド開始...")
+    started = time.monotonic()
     try:
-        build_result = subprocess.run(build_cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=600)
-        build_success = build_result.returncode == 0
-        build_log = build_result.stdout + "\n" + build_result.stderr
-    except subprocess.TimeoutExpired:
-        build_success = False
-        build_log = "Dockerビルドがタイムアウトしました。"
+        with metrics.span("build", repo=repo_name):
+            returncode, build_log, ended = stream_command(build_cmd, BUILD_TIMEOUT, log_path)
+        build_success = returncode == 0
+        if ended == "timeout":
+            metrics.incr("timeouts", kind="docker_build")
+            build_log = BUILD_TIMEOUT_MSG + "\n" + build_log
     except Exception as e:
         build_success = False
-        build_log = str(e)
+        build_log = DOCKER_ERROR_MSG + str(e)
+    if not build_success:
+        print(f"[{repo_name}] Dockerビルド失敗: {build_log}")
+    return build_success, build_log, log_path, round(time.monotonic() - started, 3)
+
+def docker_run_command(repo_name, cpus=None, memory=None, name=None):
+    # テストコマンドはDockerfileのCMD/ENTRYPOINTに依存
+    run_cmd = ["docker", "run", "--rm"]
+    if name:
+        run_cmd += ["--name", name]
+    if cpus:
+        run_cmd += ["--cpus", str(cpus)]
+    if memory:
+        run_cmd += ["--memory", str(memory)]
+    run_cmd.append(docker_image_name(repo_name))
+    return run_cmd
+
+def container_name(repo_name):
+    return re.sub(r"[^a-zA-Z0-9_.-]", "_", f"aicheck_{repo_name}_{os.getpid()}")
+
+def parse_size(text):
+    """docker の "12.5MiB" 等の表記をバイト数にする（読めなければNone）。"""
+    m = SIZE_RE.match(text.strip())
+    if not m or m.group(2) not in SIZE_UNITS:
+        return None
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+
+def docker_stats_memory(name):
+    """docker stats によるコンテナの現在のメモリ使用量（バイト）。"""
+    try:
+        result = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{.MemUsage}}", name],
+            capture_output=True, text=True, timeout=30
+        )
+    except Exception:
+        return None
+    if result.returncode != 0 or not result.stdout.strip():
+        return None
+    return parse_size(result.stdout.strip().splitlines()[0].split("/")[0])
+
+def cgroup_memory_file(name):
+    """コンテナのcgroupのピークメモリのファイル（ローカルのdockerでなければNone）。"""
+    try:
+        result = subprocess.run(["docker", "inspect", "--format", "{{.Id}}", name], capture_output=True, text=True, timeout=30)
+    except Exception:
+        return None
+    container_id = result.stdout.strip() if result.returncode == 0 else ""
+    if not container_id:
+        return None
+    for pattern in CGROUP_MEMORY_FILES:
+        path = pattern.format(id=container_id)
+        if os.path.isfile(path):
+            return path
+    return None
+
+class MemorySampler:
+    """テスト実行中にコンテナのメモリ使用量をinterval秒毎に取得し、最大値を peak に保持する。"""
+
+    def __init__(self, name, interval=DOCKER_STATS_INTERVAL):
+        self.name = name
+        self.interval = interval
+        self.peak = None
+        self._cgroup = None
+        self._lookups = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.interval > 0:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        # 取得中の docker stats（1回に1秒以上かかる）の終了は待たない
+        self._stop.set()
+
+    def sample(self):
+        # コンテナ起動直後はまだ見つからないことがあるので、cgroupの特定は数回まで試す
+        if self._cgroup is None and self._lookups < 3:
+            self._lookups += 1
+            self._cgroup = cgroup_memory_file(self.name)
+        if self._cgroup:
+            try:
+                with open(self._cgroup, "r", encoding="utf-8") as f:
+                    return int(f.read().strip())
+            except (OSError, ValueError):
+                # コンテナ終了でcgroupが消えた
+                self._cgroup = ""
+                return None
+        return docker_stats_memory(self.name)
+
+    def _run(self):
+        while not self._stop.is_set():
+            value = self.sample()
+            if value is not None and (self.peak is None or value > self.peak):
+                self.peak = value
+            self._stop.wait(self.interval)
+
+def load_test_rules(path=TEST_RULES_CONFIG):
+    """判定ルールを設定ファイルから読み、コンパイル済みの [(名前, 種別, 正規表現)] を返す。
+
+    設定ファイルは {"rules": [{"name": ..., "kind": "fail|pass|suspect", "pattern": ...}]}。
+    なければDEFAULT_TEST_RULES。suspect は大文字小文字を区別しない。
+    """
+    rules = DEFAULT_TEST_RULES
+    if path and os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        rules = [(r["name"], r.get("kind", "fail"), r["pattern"]) for r in config.get("rules", [])] or rules
+    return [
+        (name, kind, re.compile(pattern, re.IGNORECASE if kind == "suspect" else 0))
+        for name, kind, pattern in rules
+    ]
 
+TEST_RULES = load_test_rules()
+
+class OutputMatcher:
+    """テスト出力を1行ずつ判定ルールに照合する。fail に一致した時点で判定確定とする。"""
+
+    def __init__(self, rules=None):
+        self.rules = TEST_RULES if rules is None else rules
+        self.decision = None
+        self.suspect = None
+        self.passed = None
+        self.passed_line = 0
+        self.lines = 0
+
+    def feed(self, line):
+        """判定が確定したらTrueを返す（stream_commandのon_lineとして使う）。"""
+        line = line.rstrip("\n")
+        self.lines += 1
+        for name, kind, pattern in self.rules:
+            if not pattern.search(line):
+                continue
+            if kind == "suspect":
+                if self.suspect is None:
+                    self.suspect = name
+                continue
+            if kind == "pass":
+                self.passed, self.passed_line = name, self.lines
+                continue
+            self.decision = (name, kind)
+            return True
+        return False
+
+    def passed_at_end(self, tail=TEST_PASS_TAIL_LINES):
+        """pass ルールに一致した行が出力の末尾tail行以内にあれば、そのルール名を返す。"""
+        if self.passed and self.lines - self.passed_line < tail:
+            return self.passed
+        return None
+
+def run_container(repo_name, cpus=None, memory=None):
+    """ビルド済みイメージでテストコンテナを実行し
+    (test_success, test_log抜粋, ログファイルパス, 判定ルール, 所要秒数, ピークメモリ(バイト)) を返す。
+
+    失敗が確定する出力（TEST_RULESのfail）が出たり、RUN_IDLE_TIMEOUT秒出力が途絶えたりした時点で
+    コンテナを docker kill する。判定ルールは一致したルール名、"timeout"/"idle_timeout"、
+    終了コードのみで判定した場合 "exit_code"、
+    dockerを実行できなかった場合 "error"。
+    """
+    print(f"[{repo_name}] Dockerテスト開始...")
+    name = container_name(repo_name)
+    run_cmd = docker_run_command(repo_name, cpus, memory, name=name)
+    log_path = docker_log_path(repo_name, "run")
+    matcher = OutputMatcher()
+
+    def kill():
+        subprocess.run(["docker", "kill", name], capture_output=True, timeout=30)
+
+    rule = None
+    started = time.monotonic()
+    sampler = MemorySampler(name)
+    try:
+        with metrics.span("run", repo=repo_name), sampler:
+            returncode, test_log, ended = stream_command(
+                run_cmd, RUN_TIMEOUT, log_path, on_line=matcher.feed, idle_timeout=RUN_IDLE_TIMEOUT, kill=kill
+            )
+        if matcher.decision:
+            # 確定ルールは終了コードやsuspectより優先する
+            rule, kind = matcher.decision
+            test_success = False
+            if ended == "stopped":
+                metrics.incr("early_stops", kind=kind)
+                logging.info(f"[{repo_name}] 判定確定（{rule}）のためコンテナを停止しました")
+        elif ended == "timeout":
+            rule = "timeout"
+            metrics.incr("timeouts", kind="docker_run")
+            test_success = False
+            test_log = RUN_TIMEOUT_MSG + "\n" + test_log
+        elif ended == "idle":
+            rule = "idle_timeout"
+            metrics.incr("timeouts", kind="docker_idle")
+            test_success = False
+            test_log = RUN_IDLE_TIMEOUT_MSG + f"（{RUN_IDLE_TIMEOUT:g}秒）\n" + test_log
+        elif returncode == 0 and matcher.passed_at_end():
+            rule = matcher.passed_at_end()
+            test_success = True
+        elif returncode == 0 and not matcher.suspect:
+            rule = "exit_code"
+            test_success = True
+        else:
+            rule = matcher.suspect or "exit_code"
+            test_success = False
+        if not test_success:
+            logging.info(f"[{repo_name}] Dockerテスト失敗またはハング検知（{rule}）: {test_log[:200]}")
+    except Exception as e:
+        test_success = False
+        test_log = DOCKER_ERROR_MSG + str(e)
+        rule = "error"
+    if rule:
+        metrics.incr("test_rules", rule=rule)
+    return test_success, test_log, log_path, rule, round(time.monotonic() - started, 3), sampler.peak
+
+def run_docker_build_and_test(repo_path, repo_name, cpus=None, memory=None, dockerfile=None):
+    build_success, build_log, build_log_path, build_seconds = build_image(repo_path, repo_name, dockerfile)
     test_success = None
     test_log = ""
+    test_log_path = None
+    test_rule = None
+    run_seconds = None
+    peak_memory = None
+    image_bytes = None
     if build_success:
-        print(f"[{repo_name}] Dockerテスト開始...")
-        # テストコマンドはDockerfileのCMD/ENTRYPOINTに依存
-        run_cmd = ["docker", "run", "--rm", f"{repo_name.lower()}_img"]
-        try:
-            test_result = subprocess.run(run_cmd, capture_output=True, text=True, encoding="utf-8", errors="replace", timeout=100)
-            test_log = test_result.stdout + "\n" + test_result.stderr
-            # 失敗やハングを検知して test_success を判定
-            if test_result.returncode == 0 and not any(
-                kw in test_log.lower() for kw in ["failed", "timeout", "error", "ハング", "停止"]
-            ):
-                test_success = True
-            else:
-                test_success = False
-                logging.info(f"[{repo_name}] Dockerテスト失敗またはハング検知: {test_log[:200]}")
-        except subprocess.TimeoutExpired:
-            test_success = False
-            test_log = "Dockerテストがタイムアウトしました。"
-        except Exception as e:
-            test_success = False
-            test_log = str(e)
-    else:
-        print(f"[{repo_name}] Dockerビルド失敗: {build_log}")
+        image_bytes = docker_image_size(docker_image_name(repo_name))
+        test_success, test_log, test_log_path, test_rule, run_seconds, peak_memory = run_container(repo_name, cpus, memory)
 
     return {
         "repo_name": repo_name,
         "build_success": build_success,
         "build_log": build_log,
         "test_success": test_success,
-        "test_log": test_log
+        "test_log": test_log,
+        "test_rule": test_rule,
+        "build_log_path": build_log_path,
+        "test_log_path": test_log_path,
+        "build_seconds": build_seconds,
+        "run_seconds": run_seconds,
+        "image_bytes": image_bytes,
+        "peak_memory_bytes": peak_memory
     }
 
-def main():
+def git_head(repo_path):
+    try:
+        result = subprocess.run(["git", "-C", repo_path, "rev-parse", "HEAD"], capture_output=True, text=True, timeout=30)
+    except Exception:
+        return None
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def context_manifest_hash(repo_path):
+    """ビルドコンテキスト（.git除く）の相対パス・サイズ・mtimeからハッシュを作る。"""
+    h = hashlib.sha256()
+    for root, dirs, files in os.walk(repo_path):
+        dirs[:] = sorted(d for d in dirs if d != ".git")
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            rel = os.path.relpath(path, repo_path)
+            h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "replace"))
+    return h.hexdigest()
+
+def file_hash(path):
+    h = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+    except OSError:
+        return None
+    return h.hexdigest()
+
+def build_cache_key(repo_path, repo_name, cpus=None, memory=None, dockerfile=None):
+    return make_key(
+        "docker-result-v2",
+        git_head(repo_path),
+        file_hash(os.path.join(repo_path, dockerfile or "Dockerfile")),
+        context_manifest_hash(repo_path),
+        docker_run_command(repo_name, cpus, memory),
+        [(name, kind, pattern.pattern) for name, kind, pattern in TEST_RULES],
+        RUN_IDLE_TIMEOUT,
+    )
+
+def is_cacheable(result):
+    """タイムアウト・dockerコマンドの実行失敗・デーモン接続エラーなど一時的な失敗はキャッシュしない。"""
+    build_log = str(result.get("build_log") or "")
+    test_log = str(result.get("test_log") or "")
+    if build_log.startswith((BUILD_TIMEOUT_MSG, DOCKER_ERROR_MSG)):
+        return False
+    if test_log.startswith((RUN_TIMEOUT_MSG, RUN_IDLE_TIMEOUT_MSG, DOCKER_ERROR_MSG)):
+        return False
+    return not any(err in log for err in DOCKER_TRANSIENT_ERRORS for log in (build_log, test_log))
+
+def open_build_cache():
+    return DiskCache(
+        BUILD_CACHE_DIR,
+        max_bytes=BUILD_CACHE_MAX_MB * 1024 * 1024,
+        max_age=BUILD_CACHE_MAX_AGE_DAYS * 24 * 3600,
+        name="docker",
+    )
+
+FROM_RE = re.compile(r"^\s*FROM\s+(?:--\S+\s+)*(\S+)(?:\s+AS\s+(\S+))?", re.IGNORECASE)
+ARG_RE = re.compile(r"^\s*ARG\s+([A-Za-z_][A-Za-z0-9_]*)(?:=(\S*))?", re.IGNORECASE)
+VAR_RE = re.compile(r"\$\{?([A-Za-z_][A-Za-z0-9_]*)\}?")
+
+def normalize_image(image):
+    """タグ・ダイジェストのないイメージ名に :latest を補う。"""
+    name = image.rsplit("/", 1)[-1]
+    if "@" in image or ":" in name:
+        return image
+    return image + ":latest"
+
+def parse_base_images(dockerfile_path):
+    """DockerfileのFROM行から外部ベースイメージを出現順に返す（ステージ名参照とscratchは除く）。
+
+    最初のFROMより前のARGの既定値は ${VAR} に展開する。最終ステージのベースが先頭になるよう並べる。
+    """
+    args = {}
+    stages = {}
+    bases = []
+    final = None
+    seen_from = False
+    try:
+        with open(dockerfile_path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().replace("\\\n", " ").splitlines()
+    except OSError:
+        return []
+    for line in lines:
+        m = ARG_RE.match(line)
+        if m and not seen_from and m.group(2) is not None:
+            args[m.group(1)] = m.group(2).strip("\"'")
+            continue
+        m = FROM_RE.match(line)
+        if not m:
+            continue
+        seen_from = True
+        image = VAR_RE.sub(lambda v: args.get(v.group(1), v.group(0)), m.group(1))
+        # ステージ名を参照するFROMは、そのステージのベースを辿る
+        base = stages.get(image.lower(), None if image.lower() == "scratch" or "$" in image else normalize_image(image))
+        if base and base not in bases:
+            bases.append(base)
+        if m.group(2):
+            stages[m.group(2).lower()] = base
+        final = base
+    if final in bases:
+        bases.remove(final)
+        bases.insert(0, final)
+    return bases
+
+def plan_builds(targets, durations=None):
+    """(ビルド順, 温めるべきベースイメージ一覧, {repo_name: 最終ステージのベース}) を返す。
+
+    同じベースのリポジトリを連続してビルドしレイヤーキャッシュを効かせる。グループは前回所要時間の
+    合計が長い順、グループ内は長い順（所要時間不明は最長扱い）。
+    """
+    durations = durations or {}
+    groups = {}
+    bases = []
+    base_of = {}
+    for target in targets:
+        repo_path, repo_name, dockerfile = target
+        images = parse_base_images(os.path.join(repo_path, dockerfile or "Dockerfile"))
+        for image in images:
+            if image not in bases:
+                bases.append(image)
+        base_of[repo_name] = images[0] if images else None
+        groups.setdefault(base_of[repo_name], []).append(target)
+    expected = lambda t: durations.get(t[1], float("inf"))
+    for members in groups.values():
+        members.sort(key=lambda t: -expected(t))
+    ordered = sorted(groups.items(), key=lambda g: -sum(expected(t) for t in g[1]))
+    return [t for _, members in ordered for t in members], bases, base_of
+
+def docker_image_size(image):
+    """ローカルイメージのサイズ（バイト）。存在しなければNone。"""
+    try:
+        result = subprocess.run(
+            ["docker", "image", "inspect", "--format", "{{.Size}}", image],
+            capture_output=True, text=True, timeout=60
+        )
+    except Exception:
+        return None
+    if result.returncode != 0:
+        return None
+    try:
+        return int(result.stdout.strip().splitlines()[0])
+    except (ValueError, IndexError):
+        return None
+
+def warm_base_images(bases, jobs=DEFAULT_BUILD_JOBS):
+    """各ベースイメージを1回だけ用意する（ローカルになければpull）。{image: サイズ} を返す。"""
+    def warm(image):
+        with metrics.span("warm", image=image):
+            size = docker_image_size(image)
+            if size is None:
+                msg = f"ベースイメージ取得: {image}"
+                print(msg)
+                logging.info(msg)
+                try:
+                    result = subprocess.run(["docker", "pull", image], capture_output=True, text=True, timeout=BUILD_TIMEOUT)
+                except (OSError, subprocess.SubprocessError) as e:
+                    # dockerが無い・pullがタイムアウトした場合も、失敗は各リポジトリのビルド結果として記録させる
+                    logging.info(f"ベースイメージ取得失敗: {image}: {e}")
+                    metrics.incr("base_images", status="failed")
+                    return image, None
+                if result.returncode != 0:
+                    # pullできなくてもビルド側で改めて解決させる
+                    logging.info(f"ベースイメージ取得失敗: {image}: {result.stderr.strip()[:200]}")
+                    metrics.incr("base_images", status="failed")
+                    return image, None
+                metrics.incr("base_images", status="pulled")
+                size = docker_image_size(image)
+            else:
+                metrics.incr("base_images", status="cached")
+            return image, size
+
+    if not bases:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return dict(pool.map(warm, bases))
+
+class ImageBudget:
+    """テスト済みリポジトリイメージの合計サイズを上限内に保つ。
+
+    ベースイメージと共有する分は差し引いて数え、上限を超えたら古いものから削除して
+    ダングリングレイヤーもpruneする。ベースイメージ自体は削除しない。
+    """
+
+    def __init__(self, budget_mb=IMAGE_BUDGET_MB, base_sizes=None):
+        self.budget = budget_mb * 1024 * 1024
+        self.base_sizes = base_sizes or {}
+        self.images = deque()
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def add(self, image, base=None, size=None):
+        """テストを終えたイメージを登録し、上限を超えていれば削除する。sizeが分かっていれば渡す。"""
+        if size is None:
+            size = docker_image_size(image)
+        size = size or 0
+        size = max(size - (self.base_sizes.get(base) or 0), 0)
+        with self._lock:
+            self.images.append((image, size))
+            self.total += size
+            self._enforce()
+
+    def release(self):
+        """ビルド失敗等で残った中間レイヤーを片付ける。"""
+        with self._lock:
+            self._prune()
+
+    def _enforce(self):
+        removed = []
+        while self.images and (self.budget <= 0 or self.total > self.budget):
+            image, size = self.images.popleft()
+            self.total -= size
+            removed.append(image)
+        if not removed:
+            return
+        try:
+            subprocess.run(["docker", "rmi", "-f"] + removed, capture_output=True, timeout=BUILD_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            # 削除できなくてもテスト結果には影響させない（次回の上限判定で再度対象にはしない）
+            logging.info(f"イメージ削除失敗: {', '.join(removed)}: {e}")
+            return
+        metrics.incr("images_removed", len(removed))
+        logging.info(f"イメージ上限超過のため削除: {', '.join(removed)}")
+        self._prune()
+
+    def _prune(self):
+        try:
+            subprocess.run(["docker", "image", "prune", "-f"], capture_output=True, timeout=BUILD_TIMEOUT)
+        except (OSError, subprocess.SubprocessError) as e:
+            logging.info(f"docker image prune を省略しました: {e}")
+
+def load_durations(path=DURATION_FILE):
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_durations(durations, path=DURATION_FILE):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(durations, f, ensure_ascii=False, indent=2)
+
+def schedule_docker_tests(targets, build_jobs=DEFAULT_BUILD_JOBS, run_jobs=DEFAULT_RUN_JOBS, cpus=None, memory=None, durations=None, on_result=None, image_budget_mb=IMAGE_BUDGET_MB):
+    """ビルドを最大build_jobs並列、テストコンテナを最大run_jobs並列で実行する。
+
+    targets は (repo_path, repo_name, dockerfile) のリスト。FROMのベースイメージを先に1回ずつ用意し、
+    同じベースのリポジトリをまとめて（前回の所要時間が長いものから）投入する。テストが終わる度に
+    image_budget_mb を超えた分のイメージを削除し、{repo_name: result} と更新後の所要時間表を返す。
+    on_result(repo_name, result) は各リポジトリのビルド・テストが終わった時点で呼ばれる。
+    """
+    durations = dict(durations or {})
+    ordered, bases, base_of = plan_builds(targets, durations)
+    if bases:
+        msg = f"ベースイメージ {len(bases)} 種をビルド前に用意します: {', '.join(bases)}"
+        print(msg)
+        logging.info(msg)
+    budget = ImageBudget(image_budget_mb, warm_base_images(bases, build_jobs))
+    results = {}
+    lock = threading.Lock()
+    run_pool = ThreadPoolExecutor(max_workers=max(1, run_jobs))
+    run_futures = []
+
+    def run_stage(repo_name, started):
+        test_success, test_log, test_log_path, test_rule, run_seconds, peak_memory = run_container(repo_name, cpus, memory)
+        with lock:
+            results[repo_name].update({
+                "test_success": test_success,
+                "test_log": test_log,
+                "test_rule": test_rule,
+                "test_log_path": test_log_path,
+                "run_seconds": run_seconds,
+                "peak_memory_bytes": peak_memory
+            })
+            durations[repo_name] = round(time.monotonic() - started, 3)
+        budget.add(docker_image_name(repo_name), base_of.get(repo_name), results[repo_name]["image_bytes"])
+        if on_result:
+            on_result(repo_name, results[repo_name])
+
+    def build_stage(repo_path, repo_name, dockerfile):
+        started = time.monotonic()
+        msg = f"Testing {repo_name} ..."
+        print(msg)
+        logging.info(msg)
+        build_success, build_log, build_log_path, build_seconds = build_image(repo_path, repo_name, dockerfile)
+        # テスト後はイメージ上限で削除されることがあるので、サイズはビルド直後に測る
+        image_bytes = docker_image_size(docker_image_name(repo_name)) if build_success else None
+        with lock:
+            results[repo_name] = {
+                "repo_name": repo_name,
+                "build_success": build_success,
+                "build_log": build_log,
+                "test_success": None,
+                "test_log": "",
+                "test_rule": None,
+                "build_log_path": build_log_path,
+                "test_log_path": None,
+                "build_seconds": build_seconds,
+                "run_seconds": None,
+                "image_bytes": image_bytes,
+                "peak_memory_bytes": None
+            }
+            if build_success:
+                run_futures.append(run_pool.submit(run_stage, repo_name, started))
+                return
+            durations[repo_name] = round(time.monotonic() - started, 3)
+        budget.release()
+        if on_result:
+            on_result(repo_name, results[repo_name])
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, build_jobs)) as build_pool:
+            for f in [build_pool.submit(build_stage, *t) for t in ordered]:
+                f.result()
+        for f in list(run_futures):
+            f.result()
+    finally:
+        run_pool.shutdown(wait=True)
+    return results, durations
+
+def static_analysis_result(repo):
+    # Dockerfileがない場合は静的解析・AI要約
+    readme_path = os.path.join(repo["path"], repo.get("readme_file") or "README.md")
+    static_result = {
+        "repo_name": repo["repo_name"],
+        "build_success": None,
+        "build_log": "Dockerfileなし。静的解析のみ実施。",
+        "test_success": None,
+        "test_log": ""
+    }
+    try:
+        with open(readme_path, "r", encoding="utf-8") as rf:
+            readme_content = rf.read()
+        static_result["test_log"] = f"README内容抜粋:\n{readme_content[:1000]}"
+    except Exception as e:
+        static_result["test_log"] = f"README取得失敗: {e}"
+    return static_result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dockerビルド・テストを並列実行しAI要約を作成")
+    parser.add_argument("--build-jobs", type=int, default=DEFAULT_BUILD_JOBS, help=f"同時ビルド数 (既定{DEFAULT_BUILD_JOBS})")
+    parser.add_argument("--run-jobs", type=int, default=DEFAULT_RUN_JOBS, help=f"同時テストコンテナ数 (既定{DEFAULT_RUN_JOBS})")
+    parser.add_argument("--cpus", default=os.environ.get("DOCKER_CPUS"), help="コンテナ毎の --cpus 制限")
+    parser.add_argument("--memory", default=os.environ.get("DOCKER_MEMORY"), help="コンテナ毎の --memory 制限 (例: 2g)")
+    parser.add_argument("--restart", action="store_true", help="中断した前回実行を再開せず最初からやり直す")
+    parser.add_argument("--no-cache", action="store_true", help="結果キャッシュを使わず全リポジトリを再ビルド・再テスト")
+    parser.add_argument("--image-budget-mb", type=int, default=IMAGE_BUDGET_MB, help=f"テスト後に残すイメージ合計の上限MB。0で毎回削除 (既定{IMAGE_BUDGET_MB})")
+    parser.add_argument("--refresh", action="append", default=[], metavar="REPO", help="指定リポジトリのみキャッシュを無視して再実行（複数指定可）")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.init("docker")
     if not os.path.exists(RESULT_FILE):
         msg = "check_results.json がありません。先にファイルチェックを実行してください。"
         print(msg)
@@ -81,39 +837,190 @@ def main():
     with open(RESULT_FILE, "r", encoding="utf-8") as f:
         repos = json.load(f)
 
-    results = []
-    for repo in repos:
+    store = ResultsStore()
+    run_id = store.start_run("docker", resume=not args.restart, fingerprint=input_fingerprint(repos))
+    done = store.completed(run_id)
+    if done:
+        print(f"前回中断した実行を再開します（処理済み {len(done)} 件）")
+    cache = None if args.no_cache else open_build_cache()
+    positions = {}
+    cache_keys = {}
+    pending = []
+    for position, repo in enumerate(repos):
+        repo_name = repo["repo_name"]
+        if position in done:
+            continue
         if repo["readme"] and repo["dockerfile"]:
-            msg = f"Testing {repo['repo_name']} ..."
-            print(msg)
-            logging.info(msg)
-            result = run_docker_build_and_test(repo["path"], repo["repo_name"])
-            results.append(result)
+            target = (repo["path"], repo_name, repo.get("dockerfile_file"))
+            positions[repo_name] = position
+            if cache is None:
+                pending.append(target)
+                continue
+            key = build_cache_key(repo["path"], repo_name, args.cpus, args.memory, target[2])
+            cache_keys[repo_name] = key
+            cached = None if repo_name in args.refresh else cache.get(key)
+            if cached is not None and not is_cacheable(cached):
+                # 以前の版で保存された一時的な失敗は使わない
+                cache.delete(key)
+                cached = None
+            if cached is not None:
+                msg = f"[{repo_name}] キャッシュヒット。ビルド・テストを省略します。"
+                print(msg)
+                logging.info(msg)
+                store.put("docker", run_id, repo_name, position, cached)
+            else:
+                pending.append(target)
         elif repo["readme"]:
-            # Dockerfileがない場合は静的解析・AI要約
-            readme_path = os.path.join(repo["path"], "README.md")
-            static_result = {
-                "repo_name": repo["repo_name"],
-                "build_success": None,
-                "build_log": "Dockerfileなし。静的解析のみ実施。",
-                "test_success": None,
-                "test_log": ""
-            }
-            try:
-                with open(readme_path, "r", encoding="utf-8") as rf:
-                    readme_content = rf.read()
-                static_result["test_log"] = f"README内容抜粋:\n{readme_content[:1000]}"
-            except Exception as e:
-                static_result["test_log"] = f"README取得失敗: {e}"
-            results.append(static_result)
+            store.put("docker", run_id, repo_name, position, static_analysis_result(repo))
+
+    def save(repo_name, result):
+        # 1リポジトリ終わる毎に確定（中断しても次回はここから再開）
+        if cache is not None and is_cacheable(result):
+            cache.put(cache_keys[repo_name], result)
+        store.put("docker", run_id, repo_name, positions[repo_name], result)
+        # 実際にビルド・テストした分だけ性能履歴に残す（キャッシュヒットは含めない）
+        perf_history.record(store, run_id, result)
 
-    with open(TEST_RESULT_FILE, "w", encoding="utf-8") as f:
-        json.dump(results, f, ensure_ascii=False, indent=2)
+    _, durations = schedule_docker_tests(
+        pending, args.build_jobs, args.run_jobs, args.cpus, args.memory, load_durations(), on_result=save,
+        image_budget_mb=args.image_budget_mb
+    )
+    save_durations(durations)
+    if cache is not None:
+        cache.evict()
+        logging.info(f"結果キャッシュ: hit={cache.hits} miss={cache.misses}")
+
+    # 出力順はcheck_results.jsonの順を維持
+    store.finish_run(run_id)
+    store.export_json(run_id, TEST_RESULT_FILE)
+    for repo_name, regressions in perf_history.find_regressions(store).items():
+        msg = f"[{repo_name}] 性能劣化: " + "、".join(perf_history.describe(r) for r in regressions)
+        print(msg)
+        logging.info(msg)
+    store.close()
 
     msg = f"テスト結果を {TEST_RESULT_FILE} に保存しました。"
     print(msg)
     logging.info(msg)
 
+def trim_log(log, head=1000, tail=1000):
+    # ログ長制限：先頭1000文字＋末尾1000文字のみ抽出
+    if not log:
+        return ""
+    log = str(log)
+    if len(log) <= head + tail:
+        return log
+    return log[:head] + "\n...省略...\n" + log[-tail:]
+
+ERROR_LINE_RE = re.compile(r"error|exception|traceback|failed|failure|not found|denied|killed|timed? ?out", re.IGNORECASE)
+ANSI_RE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+NORMALIZE_RES = [
+    (re.compile(r"^#\d+\s+(\[[^\]]*\]\s+)?(\d+(\.\d+)?s?\s+)?"), ""),  # BuildKitのステップ番号・経過時間
+    (re.compile(r"(/[\w.@+-]+)+/?"), "<path>"),
+    (re.compile(r"\b[0-9a-f]{12,64}\b"), "<id>"),
+    (re.compile(r"(?<![A-Za-z\d])\d+"), "N"),
+    (re.compile(r"\s+"), " "),
+]
+
+def failure_signature(result):
+    """結果の状態と、ログ中で最後に現れるエラー行を正規化したもの（パス・数値・ID等を伏せる）を返す。"""
+    if result.get("build_success") is None:
+        return "static", ""
+    if result.get("build_success") and result.get("test_success"):
+        return "success", ""
+    status = "build_failed" if not result.get("build_success") else "test_failed"
+    log = str(result.get("build_log" if status == "build_failed" else "test_log") or "")
+    for msg in (BUILD_TIMEOUT_MSG, RUN_TIMEOUT_MSG, RUN_IDLE_TIMEOUT_MSG):
+        if log.startswith(msg):
+            return status, msg
+    lines = [ANSI_RE.sub("", line).strip() for line in log.splitlines()]
+    errors = [line for line in lines if ERROR_LINE_RE.search(line)]
+    line = errors[-1] if errors else next((l for l in reversed(lines) if l), "")
+    for pattern, repl in NORMALIZE_RES:
+        line = pattern.sub(repl, line)
+    return status, line.strip()[:200]
+
+def cluster_results(results):
+    """同じ (状態, エラーシグネチャ) の結果を1件にまとめる。件数の多い順に返す。"""
+    clusters = {}
+    for r in results:
+        key = failure_signature(r)
+        cluster = clusters.get(key)
+        if cluster is None:
+            cluster = clusters[key] = {"status": key[0], "signature": key[1], "repos": [], "example": r}
+        cluster["repos"].append(r.get("repo_name", ""))
+    return sorted(clusters.values(), key=lambda c: -len(c["repos"]))
+
+def cluster_text(cluster, max_tokens):
+    """1クラスタ分のプロンプト断片。ログは代表1件の抜粋のみ載せる。"""
+    repos = cluster["repos"]
+    names = ", ".join(repos[:20]) + (f" 他{len(repos) - 20}件" if len(repos) > 20 else "")
+    lines = [f"状態: {cluster['status']}（{len(repos)}件）", f"リポジトリ: {names}"]
+    if cluster["status"] in ("build_failed", "test_failed"):
+        r = cluster["example"]
+        lines.append(f"エラーシグネチャ: {cluster['signature']}")
+        lines.append("build_log抜粋:\n" + trim_log(r.get("build_log", "")))
+        lines.append("test_log抜粋:\n" + trim_log(r.get("test_log", "")))
+    lines.append("-" * 40)
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+def chunk_texts(texts, budget):
+    """断片を順に詰め、概算トークン数がbudgetを超えない塊に分ける。"""
+    chunks = []
+    current = []
+    used = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and used + tokens > budget:
+            chunks.append("\n".join(current))
+            current = []
+            used = 0
+        current.append(text)
+        used += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+TEST_SUMMARY_SYSTEM = {"role": "system", "content": "あなたは優秀なAIプロジェクト検証エージェントです。"}
+MAP_PROMPT = (
+    "以下はAIプロジェクトのDockerテスト結果の一部です（同じエラーはまとめて件数を付記）。"
+    "エラー傾向と該当件数を日本語で箇条書きに要約してください。\n### テスト結果:\n"
+)
+REDUCE_PROMPT = (
+    "以下はAIプロジェクトのDockerテスト結果の部分要約です。重複をまとめ、件数を保ったまま日本語で箇条書きに統合してください。\n"
+    "### 部分要約:\n"
+)
+FINAL_PROMPT = (
+    "以下はAIプロジェクトのDockerテスト結果（同じエラーはまとめて件数を付記、長大なログは抜粋）です。"
+    "主な特徴・エラー傾向・改善案を日本語で3点要約してください。\n### テスト結果:\n"
+)
+
+async def _summarize_chunk(prefix, chunk, semaphore):
+    async with semaphore:
+        response = await achat_completion(
+            [TEST_SUMMARY_SYSTEM, {"role": "user", "content": prefix + chunk}],
+            max_tokens=TEST_SUMMARY_MAX_TOKENS,
+            temperature=0.4
+        )
+    return response["choices"][0]["message"]["content"].strip()
+
+async def map_reduce_summary(texts, budget=TEST_SUMMARY_INPUT_TOKENS, concurrency=TEST_SUMMARY_CONCURRENCY):
+    """断片をbudget毎の塊に分けて並列に要約（map）し、1塊に収まるまで部分要約を統合（reduce）する。"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    chunks = chunk_texts(texts, budget)
+    prefix = MAP_PROMPT
+    while len(chunks) > 1:
+        with metrics.span("summarize_level", chunks=len(chunks)):
+            partials = await asyncio.gather(*(_summarize_chunk(prefix, c, semaphore) for c in chunks))
+        next_chunks = chunk_texts(partials, budget)
+        if len(next_chunks) >= len(chunks):
+            # 部分要約が縮まらない場合は2つずつ統合して必ず収束させる
+            next_chunks = ["\n".join(partials[i:i + 2]) for i in range(0, len(partials), 2)]
+        chunks = next_chunks
+        prefix = REDUCE_PROMPT
+    final_prefix = FINAL_PROMPT if prefix == MAP_PROMPT else FINAL_PROMPT.replace("### テスト結果:", "### 部分要約:")
+    return await _summarize_chunk(final_prefix, chunks[0] if chunks else "", semaphore)
+
 def summarize_test_results(test_results_path, output_report_path):
     if not os.path.isfile(test_results_path):
         msg = "test_results.jsonがありません"
@@ -122,61 +1029,53 @@ def summarize_test_results(test_results_path, output_report_path):
         return
     with open(test_results_path, "r", encoding="utf-8") as f:
         results = json.load(f)
-    # ログ長制限：各ログ先頭1000文字＋末尾1000文字のみ抽出
-    def trim_log(log, head=1000, tail=1000):
-        if not log:
-            return ""
-        log = str(log)
-        if len(log) <= head + tail:
-            return log
-        return log[:head] + "\n...省略...\n" + log[-tail:]
-    summary_lines = []
-    for r in results:
-        summary_lines.append(f"リポジトリ: {r.get('repo_name','')}")
-        summary_lines.append(f"build_success: {r.get('build_success','')}")
-        summary_lines.append("build_log抜粋:\n" + trim_log(r.get('build_log','')))
-        summary_lines.append(f"test_success: {r.get('test_success','')}")
-        summary_lines.append("test_log抜粋:\n" + trim_log(r.get('test_log','')))
-        summary_lines.append("-" * 40)
-    summary_prompt = (
-        "以下はAIプロジェクトのDockerテスト結果（長大なログは抜粋）です。主な特徴・エラー傾向・改善案を日本語で3点要約してください。\n"
-        "### テスト結果:\n" + "\n".join(summary_lines)
-    )
-    last_error = None
-    for attempt in range(3):
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "あなたは優秀なAIプロジェクト検証エージェントです。"},
-                    {"role": "user", "content": summary_prompt}
-                ],
-                max_tokens=512,
-                temperature=0.4
-            )
-            summary = response["choices"][0]["message"]["content"]
-            with open(output_report_path, "w", encoding="utf-8") as rf:
-                rf.write("# AIテスト結果要約レポート\n\n")
-                rf.write(f"対象: {test_results_path}\n")
-                rf.write(f"要約日時: {__import__('datetime').datetime.now()}\n\n")
-                rf.write("## 要約内容\n")
-                rf.write(summary.strip() + "\n")
-            msg = f"AI要約レポートを {output_report_path} に保存しました。"
-            print(msg)
-            logging.info(msg)
-            return
-        except Exception as e:
-            last_error = str(e)
-            msg = f"OpenAI要約失敗（{attempt+1}回目）: {e}"
-            print(msg)
-            logging.info(msg)
+    store = ResultsStore()
+    regressions = perf_history.find_regressions(store)
+    store.close()
+    # 同じエラーはローカルでまとめ、代表1件のログと件数だけを送る
+    clusters = cluster_results(results)
+    texts = [cluster_text(c, TEST_SUMMARY_INPUT_TOKENS // 2) for c in clusters]
+    msg = f"{len(results)}件のテスト結果を{len(clusters)}グループにまとめて要約します。"
+    print(msg)
+    logging.info(msg)
+    try:
+        with metrics.span("summarize_tests"):
+            summary = asyncio.run(map_reduce_summary(texts))
+        error = None
+    except Exception as e:
+        summary = None
+        error = str(e)
+        msg = f"OpenAI要約失敗: {e}"
+        print(msg)
+        logging.info(msg)
     with open(output_report_path, "w", encoding="utf-8") as rf:
         rf.write("# AIテスト結果要約レポート\n\n")
         rf.write(f"対象: {test_results_path}\n")
         rf.write(f"要約日時: {__import__('datetime').datetime.now()}\n\n")
-        rf.write("## 要約失敗\n")
-        rf.write(f"AI要約失敗: {last_error}\n")
+        if summary is not None:
+            rf.write("## 要約内容\n")
+            rf.write(summary + "\n")
+        else:
+            rf.write("## 要約失敗\n")
+            rf.write(f"AI要約失敗: {error}\n")
+        rf.write("\n## エラー傾向（同一シグネチャ毎の件数）\n")
+        for c in clusters:
+            if c["status"] in ("build_failed", "test_failed"):
+                rf.write(f"- {c['status']} × {len(c['repos'])}: {c['signature'] or '(ログなし)'}\n")
+        rf.write(f"\n## 性能劣化（直近{perf_history.PERF_BASELINE_RUNS}回の中央値比 +{perf_history.PERF_REGRESSION_THRESHOLD:.0%}超）\n")
+        rf.write(f"{perf_history.PERF_HISTORY_NOTE}\n\n")
+        for repo_name, items in regressions.items():
+            rf.write(f"- {repo_name}: " + "、".join(perf_history.describe(r) for r in items) + "\n")
+        if not regressions:
+            rf.write("なし\n")
+    if summary is not None:
+        msg = f"AI要約レポートを {output_report_path} に保存しました。"
+        print(msg)
+        logging.info(msg)
 
-if __name__ == "__main__":
-    main()
+def cli(argv=None):
+    main(argv)
     summarize_test_results(TEST_RESULT_FILE, AI_REPORT_FILE)
+
+if __name__ == "__main__":
+    cli()
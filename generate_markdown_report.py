@@ -1,23 +1,184 @@
+import os
+import re
 import json
-from jinja2 import Template
+import argparse
+import itertools
 from datetime import datetime
+from disk_cache import make_key
+from results_store import ResultsStore, RESULTS_DB
+import perf_history
+import metrics
 
-def main():
-    with open("output/repos.json", "r", encoding="utf-8") as f:
-        repos = json.load(f)
-    with open("report_template.md", "r", encoding="utf-8") as f:
-        template_str = f.read()
-    template = Template(template_str)
-    md = template.render(repos=repos)
+REPOS_JSON = "output/repos.json"
+TEMPLATE_DIR = "."
+REPORT_TEMPLATE = "report_template.md"
+REPO_TEMPLATE = "report_repo.md"
+INDEX_TEMPLATE = "report_index.md"
+# コンパイル済みテンプレートのキャッシュ（実行をまたいで再コンパイルしない）
+JINJA_CACHE_DIR = os.environ.get("JINJA_CACHE_DIR", os.path.join(".cache", "jinja"))
+SHARD_DIR = os.path.join("output", "report")
+SHARD_STATE = ".shards.json"
+READ_CHUNK_SIZE = 1024 * 1024
+WHITESPACE_RE = re.compile(r"[ \t\r\n]*")
+
+_env = None
+
+def get_environment():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        _env = Environment(
+            loader=FileSystemLoader(TEMPLATE_DIR),
+            bytecode_cache=FileSystemBytecodeCache(JINJA_CACHE_DIR),
+        )
+        _env.globals["perf_note"] = perf_history.PERF_HISTORY_NOTE
+    return _env
+
+def iter_json_array(path, chunk_size=READ_CHUNK_SIZE):
+    """JSON配列の要素を1件ずつ返す（ファイル全体を読み込まない）。"""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        started = False
+        eof = False
+        while True:
+            # 区切り（空白・カンマ・括弧）を読み飛ばす
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) or eof:
+                    break
+                buf, pos = f.read(chunk_size), 0
+                eof = not buf
+            if pos >= len(buf):
+                return
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError(f"{path} はJSON配列ではありません")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                nxt = WHITESPACE_RE.match(buf, end).end()
+                if not eof and (nxt >= len(buf) or buf[nxt] not in ",]"):
+                    # 数値等はバッファ末尾で切れていても読めてしまうので、次の区切りまで読めたか確認する
+                    raise json.JSONDecodeError("incomplete", buf, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # 要素が途中で切れているので続きを読み足す
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield item
+            pos = end
+
+def perf_flags(db_path=RESULTS_DB):
+    """ビルド時間・イメージサイズが直近の実行より悪化したリポジトリ {名前: [説明]}（履歴がなければ空）。"""
+    if not os.path.isfile(db_path):
+        return {}
+    store = ResultsStore(db_path)
+    try:
+        return {
+            repo: [perf_history.describe(r) for r in items]
+            for repo, items in perf_history.find_regressions(store).items()
+        }
+    finally:
+        store.close()
+
+def with_perf_flags(repos, flags):
+    """該当リポジトリに "性能劣化" を付けて1件ずつ返す。"""
+    for repo in repos:
+        name = repo.get("name")
+        yield {**repo, "性能劣化": flags[name]} if name in flags else repo
+
+def shard_filename(repo):
+    name = repo.get("full_name") or repo.get("name") or "repo"
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in name.replace("/", "__")) + ".md"
+
+def template_key(env, *names):
+    """テンプレート本文のハッシュ（テンプレート変更時は全シャードを作り直す）。"""
+    return make_key(*(env.loader.get_source(env, name)[0] for name in names))
+
+def load_shard_state(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_shards(repos, shard_dir=SHARD_DIR):
+    """リポジトリ毎のMarkdownと索引ページを書き出す。前回からデータが変わったものだけ再生成する。"""
+    env = get_environment()
+    template = env.get_template(REPO_TEMPLATE)
+    tkey = template_key(env, REPO_TEMPLATE)
+    os.makedirs(shard_dir, exist_ok=True)
+    state_path = os.path.join(shard_dir, SHARD_STATE)
+    previous = load_shard_state(state_path)
+    state = {}
+    items = []
+    rendered = 0
+    for repo in repos:
+        filename = shard_filename(repo)
+        key = make_key(tkey, repo)
+        path = os.path.join(shard_dir, filename)
+        if previous.get(filename) != key or not os.path.isfile(path):
+            with metrics.span("render_shard", repo=filename):
+                template.stream(repo=repo).dump(path, encoding="utf-8")
+            rendered += 1
+        state[filename] = key
+        # 索引には表に載せる項目だけ残す
+        items.append({
+            "name": repo.get("name", ""),
+            "file": filename,
+            "stars": repo.get("stars", ""),
+            "stack": repo.get("技術スタック") or [],
+            "regressed": bool(repo.get("性能劣化")),
+        })
+    for filename in set(previous) - set(state):
+        try:
+            os.remove(os.path.join(shard_dir, filename))
+        except OSError:
+            pass
+    index_path = os.path.join(shard_dir, "index.md")
+    env.get_template(INDEX_TEMPLATE).stream(
+        items=items, count=len(items), date=datetime.now().strftime("%Y-%m-%d"),
+        regressed=any(item["regressed"] for item in items)
+    ).dump(index_path, encoding="utf-8")
+    tmp = state_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, state_path)
+    return index_path, rendered, len(items)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="repos.jsonからMarkdownレポートを生成")
+    parser.add_argument("--shards", action="store_true", help=f"リポジトリ毎のファイルと索引ページを {SHARD_DIR} に出力（変更分のみ再生成）")
+    args = parser.parse_args(argv)
+    metrics.init("markdown")
+    repos = with_perf_flags(iter_json_array(REPOS_JSON), perf_flags())
+    if args.shards:
+        with metrics.span("render"):
+            index_path, rendered, total = write_shards(repos)
+        print(f"{index_path} を生成しました（{total}件中 {rendered}件を再生成）。")
+        return
     # ファイル名: {プロジェクト名}_{作成日}.md
-    if repos:
-        proj_name = repos[0]["name"]
+    first = next(repos, None)
+    if first is not None:
+        proj_name = first["name"]
+        repos = itertools.chain([first], repos)
     else:
         proj_name = "report"
     date_str = datetime.now().strftime("%Y%m%d")
     filename = f"output/{proj_name}_{date_str}.md"
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write(md)
+    with metrics.span("render"):
+        get_environment().get_template(REPORT_TEMPLATE).stream(repos=repos).dump(filename, encoding="utf-8")
     print(f"{filename} を生成しました。")
 
 if __name__ == "__main__":
@@ -1,144 +1,288 @@
 import os
 import json
 import re
-import openai
+import asyncio
+import argparse
 from dotenv import load_dotenv
+from llm_client import chat_completion, achat_completion, truncate_to_tokens, MODEL_CONTEXT_TOKENS
+from repo_index import load_index, entry_for
+from readme_fetcher import fetch_readme, fetch_readmes
+from readme_parser import parse_readme, usage_items
+from results_store import ResultsStore, input_fingerprint
+import metrics
 
 load_dotenv()
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
 
-def ai_summarize(text):
+SUMMARY_MAX_TOKENS = 256
+# プロンプト定型文の分を差し引いたREADME本文のトークン予算
+SUMMARY_INPUT_TOKENS = MODEL_CONTEXT_TOKENS - SUMMARY_MAX_TOKENS - 300
+SUMMARY_CONCURRENCY = int(os.environ.get("SUMMARY_CONCURRENCY", "4"))
+
+def build_summary_messages(text):
     prompt = (
         "以下のREADME.md内容から、このプロジェクトの『用途』『使い方』に関するポイントを日本語で3点要約してください。\n"
         "コマンド例や利用シーン、導入方法なども含めて簡潔にまとめてください。\n"
-        "### 内容:\n" + text
+        "### 内容:\n" + truncate_to_tokens(text, SUMMARY_INPUT_TOKENS)
     )
-    last_error = None
-    for attempt in range(3):
-        try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "あなたは優秀なAIプロジェクト分析者です。"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=256,
-                temperature=0.4
-            )
-            summary = response["choices"][0]["message"]["content"]
-            lines = [line.strip("-・ ") for line in summary.splitlines() if line.strip()]
-            return [line for line in lines if line]
-        except Exception as e:
-            last_error = str(e)
-            print(f"OpenAI要約失敗（{attempt+1}回目）: {e}")
-    return [f"AI要約失敗: {last_error}"]
-
-def extract_usage_from_readme(readme_path):
-    usage = []
-    if not os.path.isfile(readme_path):
-        return usage
-    with open(readme_path, "r", encoding="utf-8") as f:
-        content = f.read()
-        # Usageセクション抽出
-        usage_match = re.search(r"(?:^|\n)#+\s*Usage[^\n]*\n(.*?)(?:\n#+|\Z)", content, re.IGNORECASE | re.DOTALL)
-        if usage_match:
-            usage_text = usage_match.group(1).strip()
-            usage.append(usage_text)
-        # コードブロック抽出
-        code_blocks = re.findall(r"```(?:[a-zA-Z0-9]*)\n(.*?)```", content, re.DOTALL)
-        usage.extend([cb.strip() for cb in code_blocks])
-    return usage
+    return [
+        {"role": "system", "content": "あなたは優秀なAIプロジェクト分析者です。"},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_summary(response):
+    summary = response["choices"][0]["message"]["content"]
+    lines = [line.strip("-・ ") for line in summary.splitlines() if line.strip()]
+    return [line for line in lines if line]
+
+def ai_summarize(text):
+    try:
+        response = chat_completion(build_summary_messages(text), max_tokens=SUMMARY_MAX_TOKENS, temperature=0.4)
+        return parse_summary(response)
+    except Exception as e:
+        print(f"OpenAI要約失敗: {e}")
+        return [f"AI要約失敗: {e}"]
+
+async def ai_summarize_async(text, semaphore, repo=None):
+    async with semaphore:
+        metrics.incr("summaries")
+        with metrics.span("summarize", repo=repo or ""):
+            try:
+                response = await achat_completion(build_summary_messages(text), max_tokens=SUMMARY_MAX_TOKENS, temperature=0.4)
+                return parse_summary(response)
+            except Exception as e:
+                print(f"OpenAI要約失敗: {e}")
+                return [f"AI要約失敗: {e}"]
+
+async def summarize_readmes(texts, concurrency=SUMMARY_CONCURRENCY, on_done=None, names=None):
+    """READMEごとに1リクエストで要約する。同時実行数はconcurrencyまで、結果は入力順。
+
+    on_done(index, result) を渡すと各要約の完了時点で呼ばれる。names はメトリクスのrepoラベル。
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    async def one(i, text):
+        repo = names[i] if names else None
+        result = await ai_summarize_async(text, semaphore, repo) if text and text.strip() else []
+        if on_done:
+            on_done(i, result)
+        return result
+    return await asyncio.gather(*(one(i, t) for i, t in enumerate(texts)))
+
+_repo_index = None
+
+def get_repo_index():
+    """check_repo_files.py が保存したファイルインデックス（1回だけ読む。なければ空）。"""
+    global _repo_index
+    if _repo_index is None:
+        _repo_index = load_index() or {}
+    return _repo_index
+
+def repo_file(repo_dir, kind, name):
+    """repo_dir内の種別kindのファイルパスを返す。インデックスにあればファイルシステムを見ない。"""
+    entry = entry_for(get_repo_index(), repo_dir)
+    if entry is not None:
+        found = name if name in entry["files"] else entry["kinds"].get(kind)
+        return os.path.join(repo_dir, found) if found else None
+    path = os.path.join(repo_dir, name)
+    return path if os.path.isfile(path) else None
+
+def extract_usage_from_readme(readme_path, doc=None):
+    """Usage/Installation節とコードブロックを抜き出す。doc（parse_readmeの結果）を渡すとREADMEを読み直さない。"""
+    if doc is None:
+        doc = load_readme(readme_path)
+    return usage_items(doc)
 
 REPOS_JSON = "output/repos.json"
 REPOS_DIR = "repos"
 
+# (キーワード, ラベル, 分類) 分類は "tech"（技術スタック）か "ai"（AI Provider）
 TECH_KEYWORDS = [
-    ("Playwright", "Playwright MCP"),
-    ("Claude", "Claude Code"),
-    ("Anthropic", "Anthropic Claude"),
-    ("Python", "Python"),
-    ("Node.js", "Node.js"),
-    ("TensorFlow", "TensorFlow"),
-    ("PyTorch", "PyTorch"),
-    ("OpenAI", "OpenAI"),
-    ("HuggingFace", "HuggingFace"),
-    ("Google AI", "Google AI"),
-    ("Azure AI", "Azure AI")
+    ("Playwright", "Playwright MCP", "tech"),
+    ("Claude", "Claude Code", "ai"),
+    ("Anthropic", "Anthropic Claude", "ai"),
+    ("Python", "Python", "tech"),
+    ("Node.js", "Node.js", "tech"),
+    ("TensorFlow", "TensorFlow", "tech"),
+    ("PyTorch", "PyTorch", "tech"),
+    ("OpenAI", "OpenAI", "ai"),
+    ("HuggingFace", "HuggingFace", "ai"),
+    ("Google AI", "Google AI", "ai"),
+    ("Azure AI", "Azure AI", "ai")
+]
+FEATURE_PATTERNS = [
+    "デザインレビュー", "自動化", "チェック", "認識", "分類", "アクセシビリティ", "UI/UX", "自然言語処理", "チャットボット", "画像認識"
 ]
+# キーワード表を差し替える場合のJSONファイル
+# {"keywords": [{"keyword": "...", "label": "...", "category": "tech|ai"}], "features": ["..."]}
+KEYWORDS_CONFIG = os.environ.get("KEYWORDS_CONFIG", "keywords.json")
+SCAN_CHUNK_SIZE = 1024 * 1024
+
+def load_keyword_config(path=KEYWORDS_CONFIG):
+    """キーワード表を設定ファイルから読む。なければ既定のTECH_KEYWORDS/FEATURE_PATTERNS。"""
+    if not path or not os.path.isfile(path):
+        return TECH_KEYWORDS, FEATURE_PATTERNS
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    keywords = [
+        (k["keyword"], k.get("label", k["keyword"]), k.get("category", "tech"))
+        for k in config.get("keywords", [])
+    ]
+    return keywords or TECH_KEYWORDS, config.get("features", FEATURE_PATTERNS)
+
+def _alternation(keywords):
+    # 同じ位置から始まる場合は長いキーワードを優先
+    alternatives = sorted(keywords, key=len, reverse=True)
+    return re.compile("(?=(" + "|".join(re.escape(k) for k in alternatives) + "))")
+
+def build_scanner(keywords, features):
+    """キーワードを分類毎に1本の正規表現にまとめる。
+
+    技術キーワードは大文字小文字を区別せず（本文を小文字化して照合）、機能キーワードは区別する。
+    名前付きグループやIGNORECASEは re の高速化が効かなくなるため使わない。
+    先読みで各位置を1回だけ走査するので、開始位置の異なる重なり合うキーワードも取りこぼさない。
+    戻り値は ([(正規表現, 小文字化するか, キーワード→[(分類, ラベル)])], キーワード総数, 最長キーワード長)。
+    """
+    tech = {}
+    for kw, label, category in keywords:
+        tech.setdefault(kw.lower(), []).append((category, label))
+    feature = {}
+    for pat in features:
+        feature.setdefault(pat, []).append(("feature", pat))
+    passes = [(_alternation(groups), lower, groups) for groups, lower in [(tech, True), (feature, False)] if groups]
+    max_len = max([len(k) for k in tech] + [len(k) for k in feature] + [1])
+    return passes, len(tech) + len(feature), max_len
 
-def extract_info_from_readme(readme_path):
+SCANNER = build_scanner(*load_keyword_config())
+
+def scan_text(text, found, scanner=SCANNER):
+    """textを走査し、見つかった (走査の番号, キーワード) をfoundへ追加する。"""
+    passes, total, _ = scanner
+    for i, (regex, lower, _) in enumerate(passes):
+        for m in regex.finditer(text.lower() if lower else text):
+            found.add((i, m.group(1)))
+            if len(found) == total:
+                return found
+    return found
+
+def scan_file(path, found, scanner=SCANNER):
+    """ファイルを分割読み込みしながら走査する（境界をまたぐ一致のため末尾を重ねる）。"""
+    _, total, max_len = scanner
+    overlap = ""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while len(found) < total:
+            chunk = f.read(SCAN_CHUNK_SIZE)
+            if not chunk:
+                break
+            text = overlap + chunk
+            scan_text(text, found, scanner)
+            overlap = text[-(max_len - 1):] if max_len > 1 else ""
+    return found
+
+_repo_lookup = None
+
+def get_repo_lookup():
+    """repos.json の name→repo 対応表（1回だけ読む）。"""
+    global _repo_lookup
+    if _repo_lookup is None:
+        try:
+            with open(REPOS_JSON, "r", encoding="utf-8") as f:
+                repos = json.load(f)
+        except (OSError, ValueError):
+            repos = []
+        _repo_lookup = {r.get("name"): r for r in repos}
+    return _repo_lookup
+
+def read_readme(readme_path):
+    """README.mdを読む。ローカルになければGitHub rawから取得し、どちらもなければ空文字。"""
+    local_path = repo_file(os.path.dirname(readme_path), "readme", os.path.basename(readme_path))
+    if local_path:
+        with open(local_path, "r", encoding="utf-8") as f:
+            return f.read()
+    repo = get_repo_lookup().get(os.path.basename(os.path.dirname(readme_path)))
+    return fetch_readme(repo) if repo else ""
+
+def load_readme(readme_path, readme_text=None):
+    """READMEを1回だけ読み、行単位で走査した結果（ReadmeDoc）を返す。
+
+    ローカルのファイルは全体を読み込まずに行ごとに流し込む。readme_text を渡すとそれを使う。
+    """
+    if readme_text is None:
+        local_path = repo_file(os.path.dirname(readme_path), "readme", os.path.basename(readme_path))
+        if local_path:
+            with open(local_path, "r", encoding="utf-8", errors="replace") as f:
+                return parse_readme(f)
+        readme_text = read_readme(readme_path)
+    return parse_readme(readme_text.splitlines(keepends=True))
+
+def extract_info_from_readme(readme_path, readme_text=None, summarize=True, doc=None):
+    """README等から技術スタック・機能・AI Providerを抽出する。
+
+    readme_text か doc（parse_readmeの結果）を渡すとREADMEを読み直さない。summarize=False のときAI要約は行わず
+    ai_features は空（要約は呼び出し側でまとめて行う）。
+    """
     tech = set()
     features = set()
     ai_providers = set()
     ai_features = []
-    contents = []
+    found = set()
+    repo_dir = os.path.dirname(readme_path)
     # README.md
-    if os.path.isfile(readme_path):
-        with open(readme_path, "r", encoding="utf-8") as f:
-            contents.append(f.read())
-    else:
-        # GitHub rawからREADME.md取得
-        repo_name = os.path.basename(os.path.dirname(readme_path))
-        full_name = None
-        # repos.jsonからfull_name取得
-        try:
-            with open("output/repos.json", "r", encoding="utf-8") as rf:
-                all_repos = json.load(rf)
-                for r in all_repos:
-                    if r.get("name") == repo_name:
-                        full_name = r.get("full_name")
-                        break
-        except Exception:
-            pass
-        if full_name:
-            import requests
-            raw_url = f"https://raw.githubusercontent.com/{full_name}/main/README.md"
-            try:
-                resp = requests.get(raw_url, timeout=10)
-                if resp.status_code == 200:
-                    contents.append(resp.text)
-            except Exception:
-                pass
-    # requirements.txt
-    req_path = os.path.join(os.path.dirname(readme_path), "requirements.txt")
-    if os.path.isfile(req_path):
-        with open(req_path, "r", encoding="utf-8") as f:
-            contents.append(f.read())
+    if doc is not None:
+        readme_text = doc.text
+    if readme_text is None:
+        readme_text = read_readme(readme_path)
+    if readme_text:
+        scan_text(readme_text, found)
     # package.json
-    pkg_path = os.path.join(os.path.dirname(readme_path), "package.json")
-    if os.path.isfile(pkg_path):
+    pkg_path = repo_file(repo_dir, "package_json", "package.json")
+    if pkg_path:
         try:
-            pkg = json.load(open(pkg_path, "r", encoding="utf-8"))
+            with open(pkg_path, "r", encoding="utf-8") as f:
+                pkg = json.load(f)
             deps = pkg.get("dependencies", {})
             tech.update(deps.keys())
         except Exception:
             pass
-    # main.py, app.js
-    for fname in ["main.py", "app.js"]:
-        fpath = os.path.join(os.path.dirname(readme_path), fname)
-        if os.path.isfile(fpath):
-            with open(fpath, "r", encoding="utf-8") as f:
-                contents.append(f.read())
-    # 解析
-    for content in contents:
-        for kw, label in TECH_KEYWORDS:
-            if re.search(kw, content, re.IGNORECASE):
-                if "AI" in label or "Claude" in label or "OpenAI" in label or "HuggingFace" in label:
-                    ai_providers.add(label)
-                elif "Playwright" in label or "Python" in label or "Node.js" in label or "TensorFlow" in label or "PyTorch" in label:
-                    tech.add(label)
-        feature_patterns = [
-            r"デザインレビュー", r"自動化", r"チェック", r"認識", r"分類", r"アクセシビリティ", r"UI/UX", r"自然言語処理", r"チャットボット", r"画像認識"
-        ]
-        for pat in feature_patterns:
-            if re.search(pat, content):
-                features.add(pat)
-        if "README" in readme_path:
-            ai_features = ai_summarize(content)
+    # requirements.txt, main.py, app.js は分割読み込みで走査
+    for kind, fname in [("requirements", "requirements.txt"), ("main_py", "main.py"), ("app_js", "app.js")]:
+        fpath = repo_file(repo_dir, kind, fname)
+        if fpath:
+            scan_file(fpath, found)
+    # 解析（分類は走査器の構築時に決定済み）
+    passes = SCANNER[0]
+    for i, kw in found:
+        for category, label in passes[i][2][kw]:
+            if category == "ai":
+                ai_providers.add(label)
+            elif category == "tech":
+                tech.add(label)
+            else:
+                features.add(label)
+    # AI要約はREADME本文に対して1回だけ
+    if summarize and readme_text:
+        ai_features = ai_summarize(readme_text)
     return list(tech), list(features), list(ai_providers), ai_features
 
-def main():
+def analyze_repo(repo, repo_dir, readme_text=None):
+    """1リポジトリのREADME等を解析してrepoの各項目を上書きし、READMEの走査結果を返す（AI要約は行わない）。"""
+    readme_path = os.path.join(repo_dir, "README.md")
+    with metrics.span("extract", repo=repo["name"]):
+        # READMEは1回だけ読み、走査結果を両方の抽出で共有する
+        doc = load_readme(readme_path, readme_text)
+        tech, features, ai_providers, _ = extract_info_from_readme(readme_path, summarize=False, doc=doc)
+        usage = extract_usage_from_readme(readme_path, doc=doc)
+    # 必ず項目を上書き
+    repo["技術スタック"] = tech if tech else ["情報抽出できませんでした"]
+    repo["主な用途・使い方"] = features if features else ["情報抽出できませんでした"]
+    repo["Usage例"] = usage if usage else ["情報抽出できませんでした"]
+    repo["利用AI Provider"] = ai_providers if ai_providers else ["情報抽出できませんでした"]
+    return doc
+
+def main(argv=None):
+    global _repo_lookup
+    parser = argparse.ArgumentParser(description="READMEを解析しrepos.jsonへ技術スタック・用途・Usage例を追記")
+    parser.add_argument("--restart", action="store_true", help="中断した前回実行を再開せず最初からやり直す")
+    args = parser.parse_args(argv)
+    metrics.init("report")
     os.makedirs("output", exist_ok=True)
     if not os.path.isfile(REPOS_JSON):
         print("repos.jsonがありません。新規作成します。")
@@ -146,18 +290,46 @@ def main():
     else:
         with open(REPOS_JSON, "r", encoding="utf-8") as f:
             repos = json.load(f)
-    for repo in repos:
-        repo_dir = repo.get("path", os.path.join("AICheck", repo["name"]))
-        readme_path = os.path.join(repo_dir, "README.md")
-        tech, features, ai_providers, ai_features = extract_info_from_readme(readme_path)
-        usage = extract_usage_from_readme(readme_path)
-        # 必ず項目を上書き
-        repo["技術スタック"] = tech if tech else ["情報抽出できませんでした"]
-        repo["主な用途・使い方"] = ai_features if ai_features else features if features else ["情報抽出できませんでした"]
-        repo["Usage例"] = usage if usage else ["情報抽出できませんでした"]
-        repo["利用AI Provider"] = ai_providers if ai_providers else ["情報抽出できませんでした"]
-    with open(REPOS_JSON, "w", encoding="utf-8") as f:
-        json.dump(repos, f, ensure_ascii=False, indent=2)
+    store = ResultsStore()
+    run_id = store.start_run("report", resume=not args.restart, fingerprint=input_fingerprint(repos))
+    done = store.completed(run_id)
+    if done:
+        print(f"前回中断した実行を再開します（処理済み {len(done)} 件）")
+    _repo_lookup = {r["name"]: r for r in repos}
+    repo_dir_of = lambda repo: repo.get("path", os.path.join("AICheck", repo["name"]))
+    # ローカルにREADMEがないものは先にまとめて並列取得しておく
+    missing = [
+        r for position, r in enumerate(repos)
+        if position not in done and not repo_file(repo_dir_of(r), "readme", "README.md")
+    ]
+    if missing:
+        print(f"ローカルにREADMEがない {len(missing)} 件をGitHubから取得します...")
+    with metrics.span("readme_fallback"):
+        fetched = fetch_readmes(missing)
+    pending = []
+    readme_texts = []
+    for position, repo in enumerate(repos):
+        if position in done:
+            continue
+        doc = analyze_repo(repo, repo_dir_of(repo), fetched.get(repo.get("full_name") or repo["name"]))
+        pending.append(position)
+        readme_texts.append(doc.text)
+
+    def save(i, ai_features):
+        # 要約が終わったリポジトリから順に確定・保存
+        position = pending[i]
+        repo = repos[position]
+        if ai_features:
+            repo["主な用途・使い方"] = ai_features
+        store.put("report", run_id, repo["name"], position, repo)
+
+    # AI要約はリポジトリ毎に1リクエスト、同時実行数を制限して並列化
+    # 全体は summarize_all、リポジトリ毎は summarize スパンとして記録
+    with metrics.span("summarize_all"):
+        asyncio.run(summarize_readmes(readme_texts, on_done=save, names=[repos[p]["name"] for p in pending]))
+    store.finish_run(run_id)
+    store.export_json(run_id, REPOS_JSON)
+    store.close()
     print("READMEのusage情報をrepos.jsonへ保存しました。")
 
 if __name__ == "__main__":
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import random
+import atexit
+import asyncio
+import logging
+import threading
+from functools import lru_cache
+from dotenv import load_dotenv
+import metrics
+from disk_cache import DiskCache, make_key
+
+load_dotenv()
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE", "1") != "0"
+LLM_CACHE_DIR = os.environ.get("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+LLM_CACHE_MAX_MB = int(os.environ.get("LLM_CACHE_MAX_MB", "50"))
+LLM_CACHE_TTL_DAYS = float(os.environ.get("LLM_CACHE_TTL_DAYS", "30"))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+# gpt-3.5-turbo の文脈長（応答分を含む）
+MODEL_CONTEXT_TOKENS = 4096
+
+_cache = None
+_cache_lock = threading.Lock()
+_openai = None
+
+
+def get_openai():
+    """openaiモジュール（import に時間がかかるため最初のAPI呼び出し時に読み込む）。"""
+    global _openai
+    with _cache_lock:
+        if _openai is None:
+            import openai
+            openai.api_key = os.environ.get("OPENAI_API_KEY")
+            # ローカルのスタブサーバ等へ向ける場合に指定（例: http://127.0.0.1:8000/v1）
+            if os.environ.get("OPENAI_API_BASE"):
+                openai.api_base = os.environ["OPENAI_API_BASE"]
+            _openai = openai
+    return _openai
+
+
+def get_cache():
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache(
+                LLM_CACHE_DIR,
+                max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+                max_age=LLM_CACHE_TTL_DAYS * 24 * 3600,
+                name="llm",
+            )
+            atexit.register(_close_cache)
+    return _cache
+
+
+def _close_cache():
+    if _cache is None:
+        return
+    _cache.evict()
+    logging.info(f"LLMキャッシュ: hit={_cache.hits} miss={_cache.misses}")
+
+
+def cache_stats():
+    """LLMキャッシュのヒット/ミス件数を返す。"""
+    if _cache is None:
+        return {"hits": 0, "misses": 0}
+    return _cache.stats()
+
+
+@lru_cache(maxsize=None)
+def _tiktoken_encoding():
+    """tiktokenのエンコーディング。未インストールならNone（Noneも含め1回だけ解決する）。"""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(DEFAULT_MODEL)
+    except Exception:
+        return None
+
+
+def estimate_tokens(text):
+    """トークン数の概算。tiktokenがあれば使い、なければ文字種から見積もる。"""
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    # 英数字は約4文字/トークン、日本語等は約1文字/トークン
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def truncate_to_tokens(text, budget):
+    """概算トークン数がbudget以下になるよう末尾を切り詰める（先頭から1回走査するだけ）。"""
+    encoding = _tiktoken_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        return text if len(tokens) <= budget else encoding.decode(tokens[:budget])
+    if len(text) < budget:
+        # 1文字は高々1トークンと見積もるので切り詰め不要
+        return text
+    ascii_chars = 0
+    for i, c in enumerate(text):
+        if ord(c) < 128:
+            ascii_chars += 1
+        if ascii_chars // 4 + (i + 1 - ascii_chars) + 1 > budget:
+            return text[:i]
+    return text
+
+
+# openai.error 配下の一時的なエラー（http_statusを持たないもの含む）
+RETRYABLE_ERRORS = ("RateLimitError", "APIConnectionError", "Timeout", "ServiceUnavailableError", "TryAgain")
+
+
+def retry_delay(error, attempt):
+    """429/5xx なら待機秒数を返し、再試行すべきでない例外ならNoneを返す。"""
+    status = getattr(error, "http_status", None) or getattr(error, "status_code", None)
+    if status is not None and status != 429 and status < 500:
+        return None
+    headers = getattr(error, "headers", None) or {}
+    retry_after = headers.get("Retry-After") or headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    transient = isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+    if status is None and not transient:
+        return None
+    # Retry-Afterがなければ指数バックオフ（ジッタ付き）
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def _cache_key(messages, model, max_tokens, temperature):
+    return make_key("chat-v1", model, messages, temperature, max_tokens)
+
+
+def _create(messages, model, max_tokens, temperature):
+    with metrics.span("llm_call", model=model):
+        response = get_openai().ChatCompletion.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
+        )
+    # OpenAIObjectを素のdictへ変換してから保存
+    response = json.loads(json.dumps(response, ensure_ascii=False, default=str))
+    metrics.record_usage(response, model)
+    return response
+
+
+def chat_completion(messages, model=DEFAULT_MODEL, max_tokens=256, temperature=0.4, use_cache=True, max_retries=LLM_MAX_RETRIES):
+    """openai.ChatCompletion.create の共通ラッパー。
+
+    model・messages・temperature・max_tokens が同一ならディスクキャッシュの応答を返し、
+    APIは呼ばない。429はRetry-Afterに従って再試行する。戻り値は応答のdict（choices/usage）。
+    """
+    cache = get_cache() if use_cache else None
+    key = _cache_key(messages, model, max_tokens, temperature)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    for attempt in range(max_retries + 1):
+        try:
+            response = _create(messages, model, max_tokens, temperature)
+            break
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == max_retries:
+                metrics.incr("errors", kind="openai")
+                raise
+            logging.info(f"OpenAI再試行まで{delay:.1f}秒待機: {e}")
+            metrics.incr("retries", kind="openai")
+            time.sleep(delay)
+    if cache is not None:
+        cache.put(key, response)
+    return response
+
+
+async def achat_completion(messages, model=DEFAULT_MODEL, max_tokens=256, temperature=0.4, use_cache=True, max_retries=LLM_MAX_RETRIES):
+    """chat_completion のasyncio版。API呼び出しはスレッドで行い、待機はイベントループ上で行う。"""
+    cache = get_cache() if use_cache else None
+    key = _cache_key(messages, model, max_tokens, temperature)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    for attempt in range(max_retries + 1):
+        try:
+            response = await asyncio.to_thread(_create, messages, model, max_tokens, temperature)
+            break
+        except Exception as e:
+            delay = retry_delay(e, attempt)
+            if delay is None or attempt == max_retries:
+                metrics.incr("errors", kind="openai")
+                raise
+            logging.info(f"OpenAI再試行まで{delay:.1f}秒待機: {e}")
+            metrics.incr("retries", kind="openai")
+            await asyncio.sleep(delay)
+    if cache is not None:
+        cache.put(key, response)
+    return response
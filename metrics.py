@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join("output", "metrics"))
+PREFIX = "aicheck"
+
+_lock = threading.Lock()
+_spans = []
+_counters = {}
+_stage = None
+_registered = False
+_run_started = time.time()
+_run_t0 = time.perf_counter()
+
+
+def init(stage):
+    """ステージ名を設定し、終了時にメトリクスを書き出すよう登録する（各スクリプトのmainで1回呼ぶ）。
+
+    init からexportまでの経過時間は "stage" スパンとして記録される。
+    """
+    global _stage, _registered, _run_started, _run_t0
+    if not _registered:
+        atexit.register(export)
+        _registered = True
+    _stage = stage
+    _run_started = time.time()
+    _run_t0 = time.perf_counter()
+
+
+@contextmanager
+def scope():
+    """1プロセス内で別ステージのmainを呼ぶ間、メトリクスを分けて集計し、終了時にそのステージ分を書き出す。"""
+    global _stage, _run_started, _run_t0
+    with _lock:
+        saved = (_stage, _run_started, _run_t0, list(_spans), dict(_counters))
+        _spans[:] = []
+        _counters.clear()
+    try:
+        yield
+    finally:
+        if _stage != saved[0]:
+            export()
+        with _lock:
+            _stage, _run_started, _run_t0 = saved[:3]
+            _spans[:] = saved[3]
+            _counters.clear()
+            _counters.update(saved[4])
+
+
+@contextmanager
+def span(name, **labels):
+    """処理時間を計測するスパン。例: with metrics.span("build", repo=repo_name): ..."""
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - t0
+        with _lock:
+            _spans.append({
+                "name": name,
+                "labels": {k: str(v) for k, v in labels.items()},
+                "start": start,
+                "duration": duration,
+                "thread": threading.get_ident(),
+            })
+
+
+def incr(name, value=1, **labels):
+    """カウンタを加算する。例: metrics.incr("cache_hits", cache="llm")"""
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def record_usage(response, model=None):
+    """OpenAI応答の usage（prompt/completion/total tokens）を集計する。"""
+    usage = (response or {}).get("usage") or {}
+    model = model or (response or {}).get("model", "")
+    for kind in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        if usage.get(kind):
+            incr("llm_tokens", usage[kind], type=kind.replace("_tokens", ""), model=model)
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def prometheus_text():
+    """Prometheusのtextfile形式。スパンはrepoラベルを除いて名前毎に合計・件数へ集約する。"""
+    with _lock:
+        spans = list(_spans)
+        counters = dict(_counters)
+    stage = _stage or "unknown"
+    lines = []
+    totals = {}
+    for s in spans:
+        key = (s["name"], tuple(sorted((k, v) for k, v in s["labels"].items() if k != "repo")))
+        total = totals.setdefault(key, [0.0, 0, 0.0])
+        total[0] += s["duration"]
+        total[1] += 1
+        total[2] = max(total[2], s["duration"])
+    lines.append(f"# TYPE {PREFIX}_span_duration_seconds summary")
+    for (name, pairs), (seconds, count, _) in sorted(totals.items()):
+        labels = (("stage", stage), ("span", name)) + pairs
+        lines.append(f"{PREFIX}_span_duration_seconds_sum{_labels(labels)} {seconds:.6f}")
+        lines.append(f"{PREFIX}_span_duration_seconds_count{_labels(labels)} {count}")
+    lines.append(f"# TYPE {PREFIX}_span_duration_seconds_max gauge")
+    for (name, pairs), (_, _, longest) in sorted(totals.items()):
+        labels = (("stage", stage), ("span", name)) + pairs
+        lines.append(f"{PREFIX}_span_duration_seconds_max{_labels(labels)} {longest:.6f}")
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+        for (cname, pairs), value in sorted(counters.items()):
+            if cname == name:
+                lines.append(f"{PREFIX}_{name}_total{_labels((('stage', stage),) + pairs)} {value}")
+    lines.append(f"# TYPE {PREFIX}_run_timestamp_seconds gauge")
+    lines.append(f"{PREFIX}_run_timestamp_seconds{_labels((('stage', stage),))} {_run_started:.0f}")
+    return "\n".join(lines) + "\n"
+
+
+def trace_events():
+    """Chrome trace event形式（chrome://tracing や Perfetto で開ける）。"""
+    with _lock:
+        spans = list(_spans)
+        counters = dict(_counters)
+    events = [
+        {
+            "name": s["name"],
+            "cat": _stage or "aicheck",
+            "ph": "X",
+            "ts": int(s["start"] * 1e6),
+            "dur": int(s["duration"] * 1e6),
+            "pid": os.getpid(),
+            "tid": s["thread"],
+            "args": s["labels"],
+        }
+        for s in spans
+    ]
+    return {
+        "traceEvents": events,
+        "counters": [{"name": n, "labels": dict(p), "value": v} for (n, p), v in sorted(counters.items())],
+        "stage": _stage,
+        "started": _run_started,
+    }
+
+
+def export(directory=None):
+    """{stage}.prom と {stage}_trace.json を書き出す。"""
+    directory = directory or METRICS_DIR
+    stage = _stage or "unknown"
+    with _lock:
+        _spans[:] = [s for s in _spans if s["name"] != "stage"]
+        _spans.append({
+            "name": "stage",
+            "labels": {},
+            "start": _run_started,
+            "duration": time.perf_counter() - _run_t0,
+            "thread": threading.get_ident(),
+        })
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for name, content in (
+            (f"{stage}.prom", prometheus_text()),
+            (f"{stage}_trace.json", json.dumps(trace_events(), ensure_ascii=False)),
+        ):
+            path = os.path.join(directory, name)
+            # node_exporterが書き途中のファイルを読まないよう置き換えで書き出す
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(path + ".tmp", path)
+    except OSError:
+        pass
@@ -0,0 +1,65 @@
+import os
+import time
+import statistics
+
+# 直近何回分（最新を除く）の中央値をベースラインにするか
+PERF_BASELINE_RUNS = int(os.environ.get("PERF_BASELINE_RUNS", "5"))
+# ベースラインからこの割合以上増えたら劣化とみなす（0.2 = +20%）
+PERF_REGRESSION_THRESHOLD = float(os.environ.get("PERF_REGRESSION_THRESHOLD", "0.2"))
+# 小さな揺れを拾わないための最小増加量
+PERF_MIN_BUILD_DELTA_SECONDS = float(os.environ.get("PERF_MIN_BUILD_DELTA_SECONDS", "10"))
+PERF_MIN_IMAGE_DELTA_MB = float(os.environ.get("PERF_MIN_IMAGE_DELTA_MB", "50"))
+
+# レポートに添える注記。結果キャッシュにヒットしたリポジトリはビルドしないので履歴に残らない
+PERF_HISTORY_NOTE = "キャッシュヒットした実行は計測しないため、比較対象は実際にビルドした回のみです（結果キャッシュの有効期間中は履歴が溜まりにくくなります）。"
+
+# 指標 → (表示名, 最小増加量, 表示用の単位変換)
+WATCHED_METRICS = {
+    "build_seconds": ("ビルド時間", PERF_MIN_BUILD_DELTA_SECONDS, lambda v: f"{v:.1f}s"),
+    "image_bytes": ("イメージサイズ", PERF_MIN_IMAGE_DELTA_MB * 1024 * 1024, lambda v: f"{v / 1024 / 1024:.0f}MB"),
+}
+
+def record(store, run_id, result):
+    """ビルド・テスト結果の性能指標を履歴に追加する（静的解析のみの結果は対象外）。"""
+    if result.get("build_success") is None:
+        return
+    store.add_docker_metrics(result["repo_name"], run_id, result)
+
+def find_regressions(store, baseline_runs=PERF_BASELINE_RUNS, threshold=PERF_REGRESSION_THRESHOLD):
+    """最新のビルドが直近baseline_runs回の中央値より悪化したリポジトリ {repo: [劣化内容]} を返す。
+
+    劣化内容は {"metric", "label", "latest", "baseline", "ratio", "recorded_at"}。ビルド成功分のみを比べ、
+    比較対象が2回未満のリポジトリは判定しない。最新の実行がビルド失敗のリポジトリは、
+    古い成功回の劣化を出し続けないよう判定しない。
+    """
+    regressions = {}
+    last_runs = store.recent_docker_metrics(1, successful_builds=False)
+    for repo, rows in store.recent_docker_metrics(baseline_runs + 1).items():
+        latest, previous = rows[0], rows[1:]
+        if not last_runs[repo][0]["build_success"]:
+            continue
+        for metric, (label, min_delta, _) in WATCHED_METRICS.items():
+            values = [r[metric] for r in previous if r[metric] is not None]
+            if latest[metric] is None or len(values) < 2:
+                continue
+            baseline = statistics.median(values)
+            delta = latest[metric] - baseline
+            if baseline > 0 and delta >= min_delta and delta > baseline * threshold:
+                regressions.setdefault(repo, []).append({
+                    "metric": metric,
+                    "label": label,
+                    "latest": latest[metric],
+                    "baseline": baseline,
+                    "ratio": round(latest[metric] / baseline, 3),
+                    "recorded_at": latest["recorded_at"],
+                })
+    return regressions
+
+def describe(regression):
+    """例: "ビルド時間 95.0s（基準 60.0s の 1.58倍、2026-10-17 23:40 計測）"。"""
+    fmt = WATCHED_METRICS[regression["metric"]][2]
+    measured = time.strftime("%Y-%m-%d %H:%M", time.localtime(regression["recorded_at"]))
+    return (
+        f"{regression['label']} {fmt(regression['latest'])}"
+        f"（基準 {fmt(regression['baseline'])} の {regression['ratio']:.2f}倍、{measured} 計測）"
+    )
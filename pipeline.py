@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+CLONE_DIR = os.environ.get("CLONE_DIR", "repos")
+STATE_FILE = os.path.join("output", "pipeline_state.json")
+
+LOG_FILE = "logs/all.log"
+logging.basicConfig(
+    filename=LOG_FILE,
+    level=logging.INFO,
+    format="%(asctime)s [pipeline.py] %(message)s",
+    encoding="utf-8"
+)
+
+# 各ステージが読む/書くファイル（ディレクトリ可）。実行順に並べる。
+# 読み込みファイルは「それより前で最後にそのファイルを書いたステージ」の出力として扱う。
+# report は check の repo_index.json を読むので、check の後に report と docker が並行して走る。
+STAGES = [
+    {"name": "search", "script": "search_github_projects.py", "reads": [], "writes": ["output/repos.json"]},
+    {"name": "clone", "script": "clone_projects.py", "reads": ["output/repos.json"], "writes": ["output/repos.json", CLONE_DIR]},
+    {"name": "check", "script": "check_repo_files.py", "reads": [CLONE_DIR], "writes": ["output/check_results.json", "output/repo_index.json"]},
+    {"name": "report", "script": "generate_report.py", "reads": ["output/repos.json", CLONE_DIR, "output/repo_index.json"], "writes": ["output/repos.json"]},
+    {"name": "docker", "script": "docker_test_runner.py", "reads": ["output/check_results.json", CLONE_DIR], "writes": ["output/test_results.json"]},
+    {"name": "markdown", "script": "generate_markdown_report.py", "reads": ["output/repos.json", "output/test_results.json", "report_template.md", "report_repo.md", "report_index.md"], "writes": []},
+]
+STAGE_NAMES = [s["name"] for s in STAGES]
+
+def _log(msg):
+    print(msg)
+    logging.info(msg)
+
+def fingerprint(path):
+    """ファイルは内容のsha256、ディレクトリは配下（.git除く）のパス・サイズ・mtime。存在しなければNone。"""
+    h = hashlib.sha256()
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                h.update(chunk)
+        return h.hexdigest()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if d != ".git")
+            for name in sorted(files):
+                fpath = os.path.join(root, name)
+                try:
+                    st = os.stat(fpath)
+                except OSError:
+                    continue
+                rel = os.path.relpath(fpath, path)
+                h.update(f"{rel}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8", "replace"))
+        return h.hexdigest()
+    return None
+
+def cached_fingerprint(path, cache=None):
+    """1回のパイプライン実行中は同じパスを何度も走査しないよう、cacheにフィンガープリントを保持する。"""
+    if cache is None:
+        return fingerprint(path)
+    if path not in cache:
+        cache[path] = fingerprint(path)
+    return cache[path]
+
+def load_state(path=STATE_FILE):
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def save_state(state, path=STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+
+def writer_of(stage_index, path):
+    """stage_indexより前で最後にpathを書くステージを返す（なければNone）。"""
+    for prev in reversed(STAGES[:stage_index]):
+        if path in prev["writes"]:
+            return prev
+    return None
+
+def dependencies(stage):
+    index = STAGE_NAMES.index(stage["name"])
+    deps = []
+    for path in stage["reads"]:
+        writer = writer_of(index, path)
+        if writer and writer["name"] not in deps:
+            deps.append(writer["name"])
+    return deps
+
+def input_key(stage, state, cache=None):
+    """ステージの入力（上流の記録済み出力＋静的ファイル＋スクリプト）のフィンガープリント。
+
+    上流ステージが記録した出力はその値を使うので、CLONE_DIRのような大きなディレクトリも走査しない。
+    """
+    index = STAGE_NAMES.index(stage["name"])
+    parts = [("script", cached_fingerprint(stage["script"], cache))]
+    for path in stage["reads"]:
+        writer = writer_of(index, path)
+        recorded = state.get(writer["name"], {}).get("outputs", {}) if writer else {}
+        parts.append((path, recorded[path] if path in recorded else cached_fingerprint(path, cache)))
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def is_up_to_date(stage, state, cache=None):
+    if not all(os.path.exists(path) for path in stage["writes"]):
+        return False
+    if not stage["reads"]:
+        # 入力を持たないステージ（対話型検索）は出力があれば再実行しない
+        return True
+    record = state.get(stage["name"])
+    if not record:
+        return False
+    return record.get("input_key") == input_key(stage, state, cache)
+
+def run_stage(stage, in_process=False):
+    _log(f"[{stage['name']}] 開始: {stage['script']}")
+    with metrics.span("pipeline_stage", pipeline_stage=stage["name"]):
+        if in_process:
+            # インタプリタ起動・import済みモジュールを使い回す
+            from aicheck import run_command
+            return run_command(stage["name"], [], isolated=True)
+        result = subprocess.run([sys.executable, stage["script"]])
+    return result.returncode
+
+def select_stages(only=None, start=None):
+    """(対象ステージ名, 強制実行するステージ名) を返す。"""
+    if only:
+        return [n for n in STAGE_NAMES if n in only], set(only)
+    if start:
+        return STAGE_NAMES[STAGE_NAMES.index(start):], {start}
+    return list(STAGE_NAMES), set()
+
+def run_pipeline(only=None, start=None, force=False, jobs=2, in_process=False):
+    selected, forced = select_stages(only, start)
+    if in_process:
+        # 同一プロセス内ではステージを順に実行する
+        jobs = 1
+    state = load_state()
+    fingerprints = {}
+    stages = {s["name"]: s for s in STAGES}
+    # 選択外のステージは完了済みとみなす（記録済みの出力を使う）
+    pending = list(selected)
+    done = set(STAGE_NAMES) - set(selected)
+    failed = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while pending or running:
+            for name in list(pending):
+                deps = dependencies(stages[name])
+                if any(d in failed for d in deps):
+                    _log(f"[{name}] 上流ステージ失敗のためスキップ")
+                    pending.remove(name)
+                    failed.add(name)
+                    continue
+                if not all(d in done for d in deps):
+                    continue
+                pending.remove(name)
+                stage = stages[name]
+                if not force and name not in forced and is_up_to_date(stage, state, fingerprints):
+                    _log(f"[{name}] 入力に変更なし。スキップします。")
+                    metrics.incr("stages_skipped", pipeline_stage=name)
+                    done.add(name)
+                    continue
+                key = input_key(stage, state, fingerprints)
+                running[pool.submit(run_stage, stage, in_process)] = (name, key)
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key = running.pop(future)
+                returncode = future.result()
+                if returncode != 0:
+                    _log(f"[{name}] 失敗しました（終了コード {returncode}）")
+                    failed.add(name)
+                    continue
+                outputs = {path: fingerprint(path) for path in stages[name]["writes"]}
+                fingerprints.update(outputs)
+                state[name] = {"input_key": key, "outputs": outputs}
+                save_state(state)
+                _log(f"[{name}] 完了")
+                done.add(name)
+    return not failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="入力に変更のあったステージのみ実行するパイプライン")
+    parser.add_argument("--from", dest="start", choices=STAGE_NAMES, help="指定ステージから実行（指定ステージは強制実行）")
+    parser.add_argument("--only", help="カンマ区切りで指定したステージのみ強制実行")
+    parser.add_argument("--force", action="store_true", help="フィンガープリントに関わらず全対象ステージを実行")
+    parser.add_argument("--jobs", type=int, default=2, help="独立したステージの同時実行数")
+    parser.add_argument("--in-process", action="store_true", help="ステージ毎にPythonを起動せず1プロセスで順に実行")
+    args = parser.parse_args(argv)
+    metrics.init("pipeline")
+    only = [n.strip() for n in args.only.split(",")] if args.only else None
+    if only:
+        unknown = [n for n in only if n not in STAGE_NAMES]
+        if unknown:
+            parser.error(f"不明なステージ: {', '.join(unknown)}（{', '.join(STAGE_NAMES)}）")
+    ok = run_pipeline(only, args.start, args.force, args.jobs, args.in_process)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
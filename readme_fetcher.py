@@ -0,0 +1,108 @@
+import os
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from disk_cache import DiskCache, make_key
+import metrics
+
+load_dotenv()
+# ローカルのスタブで試験する場合は環境変数で差し替え
+README_RAW_BASE = os.environ.get("README_RAW_BASE", "https://raw.githubusercontent.com")
+README_FETCH_JOBS = int(os.environ.get("README_FETCH_JOBS", "8"))
+# 同一ホストへの同時接続数の上限
+README_FETCH_PER_HOST = int(os.environ.get("README_FETCH_PER_HOST", "4"))
+README_CACHE_DIR = os.environ.get("README_CACHE_DIR", os.path.join(".cache", "readme"))
+README_CACHE_MAX_MB = int(os.environ.get("README_CACHE_MAX_MB", "100"))
+README_CACHE_TTL_DAYS = float(os.environ.get("README_CACHE_TTL_DAYS", "30"))
+
+_session = None
+_cache = None
+_host_limits = {}
+_lock = threading.Lock()
+
+def get_session():
+    """接続を使い回すSession（1プロセス1つ）。"""
+    global _session
+    with _lock:
+        if _session is None:
+            import requests
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(README_FETCH_JOBS, README_FETCH_PER_HOST))
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+def get_cache():
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = DiskCache(
+                README_CACHE_DIR,
+                max_bytes=README_CACHE_MAX_MB * 1024 * 1024,
+                max_age=README_CACHE_TTL_DAYS * 24 * 3600,
+                name="readme",
+            )
+        return _cache
+
+def host_limit(url):
+    host = urlparse(url).netloc
+    with _lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(max(1, README_FETCH_PER_HOST))
+        return _host_limits[host]
+
+def readme_url(repo):
+    """repoの既定ブランチのREADME.mdのURL。既定ブランチ不明ならHEAD（rawは既定ブランチへ解決する）。"""
+    branch = repo.get("default_branch") or "HEAD"
+    return f"{README_RAW_BASE.rstrip('/')}/{repo['full_name']}/{branch}/README.md"
+
+def fetch_readme(repo):
+    """GitHub rawからREADME.mdを取得する。取得できなければ空文字。
+
+    前回取得分はETag/Last-Modifiedで再検証し、304ならキャッシュの本文を返す。
+    """
+    if not repo.get("full_name"):
+        return ""
+    url = readme_url(repo)
+    cache = get_cache()
+    key = make_key("readme-v1", url)
+    cached = cache.get(key)
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+    try:
+        with host_limit(url), metrics.span("readme_fetch"):
+            response = get_session().get(url, headers=headers, timeout=10)
+    except Exception as e:
+        metrics.incr("readme_fetches", status="error")
+        print(f"README取得失敗 {repo['full_name']}: {e}")
+        # 通信できない場合は前回の本文で代用
+        return cached["text"] if cached else ""
+    metrics.incr("readme_fetches", status=response.status_code)
+    if response.status_code == 304 and cached:
+        return cached["text"]
+    if response.status_code != 200:
+        if response.status_code == 404:
+            cache.delete(key)
+        return ""
+    # rawはcharset無しで返すことがありrequestsの既定(ISO-8859-1)だと日本語が化けるため
+    response.encoding = "utf-8"
+    text = response.text
+    cache.put(key, {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "text": text,
+    })
+    return text
+
+def fetch_readmes(repos, jobs=README_FETCH_JOBS):
+    """複数repoのREADMEを並列に取得し {full_name: 本文} を返す（別ownerの同名repoを区別するため）。"""
+    if not repos:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        texts = pool.map(fetch_readme, repos)
+        return {repo.get("full_name") or repo["name"]: text for repo, text in zip(repos, texts)}
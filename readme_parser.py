@@ -0,0 +1,166 @@
+import os
+import re
+
+# 読み込む本文の上限（文字数）。これを超えた分は見出し・コードブロック抽出にもキーワード走査にも使わない
+README_MAX_CHARS = int(os.environ.get("README_MAX_CHARS", str(2 * 1024 * 1024)))
+SECTION_MAX_CHARS = int(os.environ.get("README_SECTION_MAX_CHARS", "10000"))
+CODE_BLOCK_MAX_CHARS = int(os.environ.get("README_CODE_BLOCK_MAX_CHARS", "5000"))
+MAX_CODE_BLOCKS = int(os.environ.get("README_MAX_CODE_BLOCKS", "30"))
+
+# 見出しの先頭がこれらに一致する節を抜き出す
+SECTION_HEADINGS = {
+    "usage": re.compile(r"^(usage|使い方|使用方法)", re.IGNORECASE),
+    "installation": re.compile(r"^(install|getting started|quick ?start|setup|インストール|導入)", re.IGNORECASE),
+}
+
+# 見出しの本文は正規表現で取らない（遅延一致と末尾の # の組み合わせは空白の連続で二次関数的に遅くなる）
+ATX_HEADING_RE = re.compile(r"^ {0,3}(#{1,6})(?:[ \t]|$)")
+SETEXT_RE = re.compile(r"^ {0,3}(=+|-+)[ \t]*$")
+FENCE_OPEN_RE = re.compile(r"^( {0,3})(`{3,}|~{3,})[ \t]*([^`\s]*)(.*)$")
+FENCE_CLOSE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})[ \t]*$")
+
+
+def atx_title(rest):
+    """ATX見出しの # の後ろから、前後の空白と閉じの # 列を除いた見出し文字列を返す。"""
+    title = rest.strip(" \t\r\n")
+    closing = title.rstrip("#")
+    if not closing:
+        return ""
+    if closing != title and closing[-1] in " \t":
+        # "## Title ##" の閉じ # 列（"C#" のように空白なしで続く # は本文）
+        return closing.rstrip(" \t")
+    return title
+
+
+class ReadmeDoc:
+    """READMEを1回走査した結果。
+
+    - text: 上限までの本文（キーワード走査用）
+    - headings: [(レベル, 見出し)]
+    - sections: {"usage"|"installation": 節の本文}（最初に現れた節のみ）
+    - code_blocks: [(言語, コード)]
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.headings = []
+        self.sections = {}
+        self.code_blocks = []
+        self.truncated = False
+
+
+class _Capped:
+    """上限文字数までだけ行を溜める。"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+
+    def add(self, line):
+        if self.size < self.limit:
+            part = line[:self.limit - self.size]
+            self.parts.append(part)
+            self.size += len(part)
+
+    def pop(self):
+        if self.parts:
+            self.size -= len(self.parts.pop())
+
+    def text(self):
+        return "".join(self.parts)
+
+
+def parse_readme(lines, max_chars=README_MAX_CHARS):
+    """Markdownを行単位で1回だけ走査し ReadmeDoc を返す（入力長に対して線形）。
+
+    lines は開いたファイル等の行のイテラブル。``` と ~~~ のフェンス（言語タグ付き）、
+    ATX（#）・Setext（===/---）見出しに対応する。閉じられていないフェンスは末尾までをコードとみなす。
+    """
+    doc = ReadmeDoc()
+    text = _Capped(max_chars)
+    section = None  # (キー, レベル, _Capped)
+    fence = None  # (文字, 長さ, 言語, _Capped)
+    prev_blank = True
+    prev_line = None
+    consumed = 0
+
+    def close_section():
+        key, _, body = section
+        doc.sections.setdefault(key, body.text().strip())
+
+    def start_heading(level, title):
+        nonlocal section
+        doc.headings.append((level, title))
+        if section and level <= section[1]:
+            close_section()
+            section = None
+        if section is None:
+            for key, pattern in SECTION_HEADINGS.items():
+                if key not in doc.sections and pattern.match(title):
+                    section = (key, level, _Capped(SECTION_MAX_CHARS))
+                    break
+
+    for line in lines:
+        if consumed >= max_chars:
+            doc.truncated = True
+            break
+        consumed += len(line)
+        text.add(line)
+        if fence is not None:
+            m = FENCE_CLOSE_RE.match(line)
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= fence[1]:
+                if len(doc.code_blocks) < MAX_CODE_BLOCKS:
+                    doc.code_blocks.append((fence[2], fence[3].text().strip()))
+                fence = None
+            else:
+                fence[3].add(line)
+            if section:
+                section[2].add(line)
+            prev_blank, prev_line = False, None
+            continue
+        m = FENCE_OPEN_RE.match(line)
+        if m and not (m.group(2)[0] == "`" and "`" in m.group(4)):
+            # ```pip install x``` のように同じ行にバッククォートが続くものはインラインコードでありフェンスではない
+            fence = (m.group(2)[0], len(m.group(2)), m.group(3), _Capped(CODE_BLOCK_MAX_CHARS))
+            if section:
+                section[2].add(line)
+            prev_blank, prev_line = False, None
+            continue
+        m = ATX_HEADING_RE.match(line)
+        if m:
+            if section and len(m.group(1)) > section[1]:
+                # 節の中の小見出しは本文に残す
+                section[2].add(line)
+            start_heading(len(m.group(1)), atx_title(line[m.end(1):]))
+            prev_blank, prev_line = False, None
+            continue
+        m = SETEXT_RE.match(line)
+        if m and prev_line is not None and not prev_blank:
+            # 直前の行が見出しだった（節の本文に入れた分は取り消す）
+            level = 1 if m.group(1)[0] == "=" else 2
+            if section:
+                if level > section[1]:
+                    section[2].add(line)
+                else:
+                    section[2].pop()
+            start_heading(level, prev_line.strip())
+            prev_blank, prev_line = False, None
+            continue
+        if section:
+            section[2].add(line)
+        prev_blank = not line.strip()
+        prev_line = None if prev_blank else line
+    if fence is not None and len(doc.code_blocks) < MAX_CODE_BLOCKS:
+        doc.code_blocks.append((fence[2], fence[3].text().strip()))
+    if section:
+        close_section()
+    doc.text = text.text()
+    return doc
+
+
+def usage_items(doc):
+    """Usage例として並べる項目: Usage節、Installation節、各コードブロックの順。"""
+    items = [doc.sections[key] for key in ("usage", "installation") if doc.sections.get(key)]
+    items.extend(code for _, code in doc.code_blocks)
+    return items
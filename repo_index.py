@@ -0,0 +1,114 @@
+import os
+import re
+import json
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+REPOS_DIR = os.environ.get("CLONE_DIR", "repos")
+INDEX_FILE = "output/repo_index.json"
+DEFAULT_JOBS = int(os.environ.get("INDEX_JOBS", "8"))
+
+LOG_FILE = "logs/all.log"
+
+# 種別 → (正式なファイル名, 大文字小文字・拡張子違いも含めたパターン)
+RELEVANT_FILES = {
+    "readme": ("README.md", re.compile(r"^readme(\.(md|markdown|rst|txt))?$", re.IGNORECASE)),
+    "dockerfile": ("Dockerfile", re.compile(r"^(dockerfile|containerfile)$", re.IGNORECASE)),
+    "compose": ("compose.yaml", re.compile(r"^(docker-)?compose\.ya?ml$", re.IGNORECASE)),
+    "requirements": ("requirements.txt", re.compile(r"^requirements\.txt$", re.IGNORECASE)),
+    "package_json": ("package.json", re.compile(r"^package\.json$", re.IGNORECASE)),
+    "main_py": ("main.py", re.compile(r"^main\.py$", re.IGNORECASE)),
+    "app_js": ("app.js", re.compile(r"^app\.js$", re.IGNORECASE)),
+}
+
+def index_repo(repo_path):
+    """リポジトリ直下を1回だけscandirし、関係ファイルのサイズ・mtimeと種別ごとの代表ファイルを返す。"""
+    files = {}
+    with os.scandir(repo_path) as it:
+        for entry in it:
+            if not any(pat.match(entry.name) for _, pat in RELEVANT_FILES.values()):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            files[entry.name] = {"size": st.st_size, "mtime": st.st_mtime}
+    kinds = {}
+    for kind, (canonical, pat) in RELEVANT_FILES.items():
+        if canonical in files:
+            kinds[kind] = canonical
+            continue
+        matches = sorted(name for name in files if pat.match(name))
+        if matches:
+            kinds[kind] = matches[0]
+    return {"path": repo_path, "files": files, "kinds": kinds}
+
+def build_index(repos_dir=REPOS_DIR, jobs=DEFAULT_JOBS):
+    """clone先配下の各リポジトリを並列にインデックス化し {repo_name: entry} を返す（名前順）。"""
+    with os.scandir(repos_dir) as it:
+        repo_dirs = sorted((e.name, e.path) for e in it if e.is_dir())
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        entries = pool.map(lambda d: index_repo(d[1]), repo_dirs)
+        return {name: entry for (name, _), entry in zip(repo_dirs, entries)}
+
+def save_index(index, path=INDEX_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def load_index(path=INDEX_FILE):
+    """保存済みインデックスを読む。なければNone。"""
+    if not os.path.isfile(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+def entry_for(index, repo_dir):
+    """repo_dirに対応するインデックスエントリ（なければNone）。"""
+    if not index:
+        return None
+    target = os.path.normpath(repo_dir)
+    name = os.path.basename(target)
+    entry = index.get(name)
+    if entry and os.path.normpath(entry["path"]) == target:
+        return entry
+    for entry in index.values():
+        if os.path.normpath(entry["path"]) == target:
+            return entry
+    return None
+
+def main(argv=None):
+    # 他スクリプトからimportされた際にログ設定を奪わないよう、単体実行時のみ設定
+    logging.basicConfig(
+        filename=LOG_FILE,
+        level=logging.INFO,
+        format="%(asctime)s [repo_index.py] %(message)s",
+        encoding="utf-8"
+    )
+    parser = argparse.ArgumentParser(description="cloneしたリポジトリの関係ファイルをインデックス化")
+    parser.add_argument("--dir", default=REPOS_DIR, help="clone先ディレクトリ (既定: 環境変数CLONE_DIR、未指定時はrepos)")
+    parser.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="並列数")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.dir):
+        msg = "repos ディレクトリがありません。先にclone処理を実行してください。"
+        print(msg)
+        logging.info(msg)
+        return
+    index = build_index(args.dir, args.jobs)
+    save_index(index)
+    msg = f"{len(index)}件のリポジトリを {INDEX_FILE} にインデックス化しました。"
+    print(msg)
+    logging.info(msg)
+
+if __name__ == "__main__":
+    main()
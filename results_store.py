@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+RESULTS_DB = os.environ.get("RESULTS_DB", os.path.join("output", "results.db"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    input_hash TEXT
+);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    repo TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+CREATE INDEX IF NOT EXISTS results_stage ON results (stage, run_id, position);
+CREATE TABLE IF NOT EXISTS docker_metrics (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    repo TEXT NOT NULL,
+    run_id INTEGER,
+    recorded_at REAL NOT NULL,
+    build_success INTEGER,
+    test_success INTEGER,
+    build_seconds REAL,
+    run_seconds REAL,
+    image_bytes INTEGER,
+    peak_memory_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS docker_metrics_repo ON docker_metrics (repo, id);
+"""
+def input_fingerprint(items):
+    """ステージの入力（repos.json等の中身）のハッシュ。再開してよいかの判定に使う。"""
+    return hashlib.sha256(json.dumps(items, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+DOCKER_METRICS = ["build_success", "test_success", "build_seconds", "run_seconds", "image_bytes", "peak_memory_bytes"]
+
+
+class ResultsStore:
+    """ステージ毎・リポジトリ毎に1行ずつ結果を保存するSQLite（WAL）ストア。
+
+    1リポジトリ処理する度にcommitするので、途中で落ちても再実行時に続きから再開できる。
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # 以前はリポジトリ名で行を区別していたが、同名の別リポジトリ（オーナー違い）が上書きし合うので
+        # 入力中の位置で区別する。旧形式の途中結果は再開に使えないので作り直す
+        pk = [row[1] for row in self._conn.execute("PRAGMA table_info(results)") if row[5]]
+        if "repo" in pk:
+            self._conn.execute("DROP TABLE results")
+        self._conn.executescript(SCHEMA)
+        # input_hash 列がなかった頃のDBにも追加する
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(stage_runs)")]
+        if "input_hash" not in columns:
+            self._conn.execute("ALTER TABLE stage_runs ADD COLUMN input_hash TEXT")
+        self._conn.commit()
+
+    def start_run(self, stage, resume=True, fingerprint=None):
+        """未完了の前回実行があればそのrun_idを返し（resume時）、なければ新規に開始する。
+
+        fingerprint（input_fingerprint の値）が前回と異なる場合は、入力が変わって
+        処理済みの結果や並び順が当てにならないので再開せず新規に開始する。
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT run_id, finished_at, input_hash FROM stage_runs WHERE stage = ? ORDER BY run_id DESC LIMIT 1",
+                (stage,)
+            ).fetchone()
+            if resume and row and row[1] is None:
+                if row[2] == fingerprint:
+                    return row[0]
+                msg = f"{stage}: 前回中断時から入力が変わったため最初からやり直します"
+                print(msg)
+                logging.info(msg)
+            cur = self._conn.execute(
+                "INSERT INTO stage_runs (stage, started_at, input_hash) VALUES (?, ?, ?)",
+                (stage, time.time(), fingerprint)
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def finish_run(self, run_id):
+        with self._lock:
+            self._conn.execute("UPDATE stage_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+            self._conn.commit()
+
+    def completed(self, run_id):
+        """run_idで処理済みの {入力中の位置: data}。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT position, data FROM results WHERE run_id = ?", (run_id,)).fetchall()
+        return {position: json.loads(data) for position, data in rows}
+
+    def put(self, stage, run_id, repo, position, data):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (run_id, stage, repo, position, data, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (run_id, stage, repo, position, json.dumps(data, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def latest_run(self, stage, finished=True):
+        with self._lock:
+            sql = "SELECT run_id FROM stage_runs WHERE stage = ?"
+            if finished:
+                sql += " AND finished_at IS NOT NULL"
+            row = self._conn.execute(sql + " ORDER BY run_id DESC LIMIT 1", (stage,)).fetchone()
+        return row[0] if row else None
+
+    def iter_results(self, run_id):
+        """run_idの結果を入力順に1件ずつ返す。"""
+        # WALなので読み出し専用の別接続でカーソルを回し、全件をメモリに載せない
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            for (data,) in conn.execute("SELECT data FROM results WHERE run_id = ? ORDER BY position", (run_id,)):
+                yield json.loads(data)
+        finally:
+            conn.close()
+
+    def export_json(self, run_id, path):
+        """既存のテンプレートやツール向けにJSON配列として書き出す（1件ずつ書き込む）。"""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for i, data in enumerate(self.iter_results(run_id)):
+                f.write(",\n" if i else "\n")
+                f.write("  " + json.dumps(data, ensure_ascii=False, indent=2).replace("\n", "\n  "))
+            f.write("\n]" if f.tell() > 1 else "]")
+        os.replace(tmp, path)
+
+    def add_docker_metrics(self, repo, run_id, values):
+        """1回のビルド・テストの所要時間・イメージサイズ・ピークメモリを履歴に追加する（上書きしない）。"""
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO docker_metrics (repo, run_id, recorded_at, {', '.join(DOCKER_METRICS)}) VALUES (?, ?, ?{', ?' * len(DOCKER_METRICS)})",
+                (repo, run_id, time.time()) + tuple(values.get(k) for k in DOCKER_METRICS)
+            )
+            self._conn.commit()
+
+    def recent_docker_metrics(self, per_repo, successful_builds=True):
+        """リポジトリ毎に新しい順で最大per_repo件の履歴 {repo: [dict, ...]}。"""
+        where = "WHERE build_success = 1" if successful_builds else ""
+        sql = (
+            f"SELECT repo, recorded_at, {', '.join(DOCKER_METRICS)} FROM ("
+            f" SELECT *, ROW_NUMBER() OVER (PARTITION BY repo ORDER BY id DESC) AS rn FROM docker_metrics {where}"
+            ") WHERE rn <= ? ORDER BY repo, rn"
+        )
+        history = {}
+        with self._lock:
+            rows = self._conn.execute(sql, (per_repo,)).fetchall()
+        for row in rows:
+            history.setdefault(row[0], []).append(dict(zip(["recorded_at"] + DOCKER_METRICS, row[1:])))
+        return history
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
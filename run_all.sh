@@ -1,19 +1,6 @@
 #!/bin/bash
 
-# 対話型GitHub検索（AIAgent機能付き）
-python3 search_github_projects.py
-
-# クローン
-python3 clone_projects.py
-
-# ファイルチェック
-python3 check_repo_files.py
-
-# Readme解析＆repos.json更新
-python3 generate_report.py
-
-# Dockerテスト＆AI要約
-python3 docker_test_runner.py
-
-# Markdownレポート生成
-python3 generate_markdown_report.py
+# 検索 → クローン → ファイルチェック → Readme解析 / Dockerテスト＆AI要約（並行） → Markdownレポート生成
+# 入力に変更のないステージはスキップされる（python3 aicheck.py pipeline --help 参照）
+# 各ステージを個別に実行する場合: python3 aicheck.py <search|clone|check|report|docker|markdown> [引数]
+python3 aicheck.py pipeline "$@"
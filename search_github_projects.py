@@ -1,14 +1,33 @@
-import requests
-import openai
 import os
+import re
 import json
+import time
+import asyncio
+import argparse
 from dotenv import load_dotenv
+from disk_cache import DiskCache, make_key
+from llm_client import chat_completion, achat_completion, estimate_tokens, truncate_to_tokens, MODEL_CONTEXT_TOKENS
+import metrics
 
 load_dotenv()
 
-GITHUB_API_URL = "https://api.github.com/search/repositories"
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
+# ローカルのスタブで試験する場合は環境変数で差し替え
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com/search/repositories")
+SEARCH_MAX_RESULTS = int(os.environ.get("SEARCH_MAX_RESULTS", "20"))
+# レート制限時の1回あたりの最大待機秒数
+SEARCH_MAX_WAIT = float(os.environ.get("SEARCH_MAX_WAIT", "3600"))
+SEARCH_CACHE_DIR = os.path.join(".cache", "github_search")
+# 検索結果のAIレコメンド。1リクエストあたりの件数上限（応答のJSONがmax_tokensに収まる件数）と同時実行数
+RECOMMEND_MAX_TOKENS = 1024
+RECOMMEND_CHUNK_SIZE = int(os.environ.get("RECOMMEND_CHUNK_SIZE", "10"))
+RECOMMEND_CONCURRENCY = int(os.environ.get("RECOMMEND_CONCURRENCY", "4"))
+# プロンプト定型文の分を差し引いた検索結果のトークン予算
+RECOMMEND_INPUT_TOKENS = MODEL_CONTEXT_TOKENS - RECOMMEND_MAX_TOKENS - 300
+RECOMMEND_DESCRIPTION_TOKENS = 80
+JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+
+_session = None
+_search_cache = None
 
 def generate_search_query(user_input):
     prompt = (
@@ -17,7 +36,7 @@ def generate_search_query(user_input):
         "Do NOT include any Japanese or explanations, only the query.\n"
         f"Purpose/Requirement: {user_input}"
     )
-    response = openai.ChatCompletion.create(
+    response = chat_completion(
         model="gpt-3.5-turbo",
         messages=[
             {"role": "system", "content": "You are a skilled GitHub search agent."},
@@ -29,65 +48,216 @@ def generate_search_query(user_input):
     query = response["choices"][0]["message"]["content"].strip()
     return query
 
-def search_github_repos(query):
-    params = {
-        "q": query,
-        "sort": "stars",
-        "order": "desc",
-        "per_page": 20
-    }
-    headers = {}
-    token = os.environ.get("GITHUB_TOKEN")
-    if token:
-        headers["Authorization"] = f"token {token}"
+def get_session():
+    """GitHub API用に接続を使い回すSession（1プロセス1つ）。"""
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+        _session.headers["Accept"] = "application/vnd.github+json"
+        token = os.environ.get("GITHUB_TOKEN")
+        if token:
+            _session.headers["Authorization"] = f"token {token}"
+    return _session
 
-    response = requests.get(GITHUB_API_URL, params=params, headers=headers)
-    response.raise_for_status()
-    repos = response.json().get("items", [])
-    return repos
+def get_search_cache():
+    global _search_cache
+    if _search_cache is None:
+        _search_cache = DiskCache(SEARCH_CACHE_DIR, max_bytes=50 * 1024 * 1024, max_age=7 * 24 * 3600, name="github")
+    return _search_cache
 
-def summarize_repos(repos, user_input):
-    repo_summaries = []
-    for repo in repos:
-        summary = {
-            "name": repo["name"],
-            "full_name": repo["full_name"],
-            "clone_url": repo["clone_url"],
-            "stars": repo["stargazers_count"],
-            "html_url": repo["html_url"],
-            "description": repo.get("description", ""),
-            "path": os.path.join("repos", repo["name"])
+def wait_for_rate_limit(response):
+    """X-RateLimit-* / Retry-After ヘッダに従って待機する。待機した場合Trueを返す。"""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        delay = float(retry_after)
+    elif response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = float(response.headers.get("X-RateLimit-Reset", time.time()))
+        delay = max(0.0, reset - time.time()) + 1
+    else:
+        return False
+    print(f"GitHub APIのレート制限のため {delay:.0f} 秒待機します...")
+    metrics.incr("rate_limit_waits", kind="github")
+    time.sleep(min(delay, SEARCH_MAX_WAIT))
+    return True
+
+def fetch_search_page(params):
+    """1ページ分を取得する。ETagが一致すれば304となり、キャッシュ済みの本文を返す。"""
+    session = get_session()
+    cache = get_search_cache()
+    key = make_key("github-search-v1", GITHUB_API_URL, params)
+    cached = cache.get(key)
+    headers = {}
+    if cached and cached.get("etag"):
+        headers["If-None-Match"] = cached["etag"]
+    while True:
+        with metrics.span("github_request"):
+            response = session.get(GITHUB_API_URL, params=params, headers=headers, timeout=30)
+        metrics.incr("github_requests", status=response.status_code)
+        if response.status_code == 304 and cached:
+            return cached["body"]
+        if response.status_code in (403, 429) and wait_for_rate_limit(response):
+            continue
+        response.raise_for_status()
+        body = response.json()
+        if response.headers.get("ETag"):
+            cache.put(key, {"etag": response.headers["ETag"], "body": body})
+        # 残り0なら次のページの前に待機
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            wait_for_rate_limit(response)
+        return body
+
+def iter_github_repos(query, max_results=SEARCH_MAX_RESULTS):
+    """検索結果をページ単位で取得し、届いた順に1件ずつyieldする（最大max_results件）。"""
+    # GitHub Search APIは1検索あたり最大1000件まで
+    max_results = min(max_results, 1000)
+    per_page = min(100, max_results)
+    page = 1
+    yielded = 0
+    while yielded < max_results:
+        params = {
+            "q": query,
+            "sort": "stars",
+            "order": "desc",
+            "per_page": per_page,
+            "page": page
         }
-        repo_summaries.append(summary)
-    # AIによる推奨・要約
+        body = fetch_search_page(params)
+        items = body.get("items", [])
+        for repo in items:
+            yield repo
+            yielded += 1
+            if yielded >= max_results:
+                return
+        if len(items) < per_page or page * per_page >= body.get("total_count", 0):
+            return
+        page += 1
+
+def search_github_repos(query, max_results=SEARCH_MAX_RESULTS):
+    return list(iter_github_repos(query, max_results))
+
+def repo_summary(repo):
+    return {
+        "name": repo["name"],
+        "full_name": repo["full_name"],
+        "clone_url": repo["clone_url"],
+        "stars": repo["stargazers_count"],
+        "html_url": repo["html_url"],
+        "description": repo.get("description", ""),
+        "default_branch": repo.get("default_branch"),
+        "path": os.path.join("repos", repo["name"])
+    }
+
+def recommend_line(summary):
+    """レコメンド用に1件を1行へ詰める（説明文は切り詰める）。"""
+    description = truncate_to_tokens(summary["description"] or "", RECOMMEND_DESCRIPTION_TOKENS)
+    return json.dumps({"full_name": summary["full_name"], "stars": summary["stars"], "description": description}, ensure_ascii=False)
+
+def chunk_summaries(summaries, budget=RECOMMEND_INPUT_TOKENS, size=RECOMMEND_CHUNK_SIZE):
+    """1リクエストの入力がbudgetトークン・size件に収まるよう [(summary, 行)] のまとまりに分ける。"""
+    chunks = []
+    current = []
+    used = 0
+    for summary in summaries:
+        line = recommend_line(summary)
+        tokens = estimate_tokens(line)
+        if current and (len(current) >= size or used + tokens > budget):
+            chunks.append(current)
+            current, used = [], 0
+        current.append((summary, line))
+        used += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def build_recommend_messages(lines, user_input):
     prompt = (
         f"以下はGitHub検索結果です。目的: {user_input}\n"
-        "各プロジェクトの特徴・推奨理由を日本語で簡潔にまとめ、目的に合致する順に並べてJSON形式で出力してください。\n"
-        "### 検索結果:\n" + json.dumps(repo_summaries, ensure_ascii=False, indent=2)
+        "各プロジェクトについて目的への合致度を0〜10の整数で評価し、特徴・推奨理由を日本語で簡潔にまとめてください。\n"
+        '出力は [{"full_name": ..., "score": ..., "reason": ...}] 形式のJSON配列のみとしてください。\n'
+        "### 検索結果:\n" + truncate_to_tokens("\n".join(lines), RECOMMEND_INPUT_TOKENS)
     )
-    response = openai.ChatCompletion.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": "あなたはGitHubプロジェクト選定AIです。"},
-            {"role": "user", "content": prompt}
-        ],
-        max_tokens=1024,
-        temperature=0.4
-    )
-    ai_result = response["choices"][0]["message"]["content"]
+    return [
+        {"role": "system", "content": "あなたはGitHubプロジェクト選定AIです。"},
+        {"role": "user", "content": prompt}
+    ]
+
+def parse_recommendations(content):
+    """応答から {full_name: (score, reason)} を取り出す（読めなければ空）。"""
+    m = JSON_ARRAY_RE.search(content or "")
     try:
-        recommended = json.loads(ai_result)
-    except Exception:
-        recommended = repo_summaries
-    return recommended
+        items = json.loads(m.group(0)) if m else []
+    except ValueError:
+        return {}
+    recommendations = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not item.get("full_name"):
+            continue
+        try:
+            score = float(item.get("score"))
+        except (TypeError, ValueError):
+            score = None
+        recommendations[item["full_name"]] = (score, str(item.get("reason") or ""))
+    return recommendations
+
+async def recommend_chunks(chunks, user_input, concurrency=RECOMMEND_CONCURRENCY):
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(chunk):
+        async with semaphore:
+            try:
+                response = await achat_completion(
+                    build_recommend_messages([line for _, line in chunk], user_input),
+                    model="gpt-3.5-turbo", max_tokens=RECOMMEND_MAX_TOKENS, temperature=0.4
+                )
+                return parse_recommendations(response["choices"][0]["message"]["content"])
+            except Exception as e:
+                # このまとまりはレコメンドなし（検索順のまま）で残す
+                print(f"AIレコメンド失敗（{len(chunk)}件）: {e}")
+                metrics.incr("recommend_failures")
+                return {}
+
+    return await asyncio.gather(*(one(c) for c in chunks))
+
+def summarize_repos(repos, user_input):
+    """検索結果を要約し、AIの合致度が高い順（同点・未評価は検索順）に並べて返す。
+
+    結果が多くても1リクエストがモデルのコンテキストと応答上限に収まるよう分割して評価する。
+    AIが失敗した分は推奨理由なしで検索順のまま残る。
+    """
+    repo_summaries = [repo_summary(repo) for repo in repos]
+    if not repo_summaries:
+        return []
+    chunks = chunk_summaries(repo_summaries)
+    recommendations = {}
+    for result in asyncio.run(recommend_chunks(chunks, user_input)):
+        recommendations.update(result)
+    for summary in repo_summaries:
+        score, reason = recommendations.get(summary["full_name"], (None, ""))
+        if reason:
+            summary["推奨理由"] = reason
+        if score is not None:
+            summary["推奨度"] = score
+    # sortedは安定なので、同点・未評価のものは検索順（スター数順）のまま
+    return sorted(repo_summaries, key=lambda s: (s.get("推奨度") is None, -(s.get("推奨度") or 0)))
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AIAgentによるGitHubプロジェクト検索")
+    parser.add_argument("--max-results", type=int, default=SEARCH_MAX_RESULTS, help=f"取得する検索結果の上限 (既定{SEARCH_MAX_RESULTS}、最大1000)")
+    args = parser.parse_args(argv)
+    metrics.init("search")
     user_input = input("GitHub検索の目的・条件を日本語で入力してください: ")
     print("AIAgentが検索クエリを生成中...")
     query = generate_search_query(user_input)
     print(f"生成クエリ: {query}")
     print("GitHub APIで検索中...")
-    repos = search_github_repos(query)
+    repos = []
+    for repo in iter_github_repos(query, args.max_results):
+        repos.append(repo)
+        print(f"  {len(repos)}: {repo['full_name']} ★{repo['stargazers_count']}")
     print(f"検出リポジトリ数: {len(repos)}")
     print("AIAgentが検索結果を要約・レコメンド中...")
     recommended = summarize_repos(repos, user_input)
@@ -0,0 +1,35 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+# 各スクリプトはimport時に logs/all.log や output/ を相対パスで開くため、一時ディレクトリで実行する
+WORKDIR = tempfile.mkdtemp(prefix="aicheck-tests-")
+os.makedirs(os.path.join(WORKDIR, "logs"))
+os.makedirs(os.path.join(WORKDIR, "output"))
+os.chdir(WORKDIR)
+
+
+@pytest.fixture
+def no_docker(tmp_path, monkeypatch):
+    """PATHからdockerを外す。"""
+    empty = tmp_path / "empty-bin"
+    empty.mkdir()
+    monkeypatch.setenv("PATH", str(empty))
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """bench/stubs.py の偽dockerをPATHの先頭に置き、実行されたコマンドのログファイルを返す。"""
+    from stubs import install_fake_docker
+    bin_dir = tmp_path / "bin"
+    install_fake_docker(str(bin_dir))
+    log = tmp_path / "docker.log"
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ.get("PATH", ""))
+    monkeypatch.setenv("FAKE_DOCKER_LATENCY", "0")
+    monkeypatch.setenv("FAKE_DOCKER_LOG", str(log))
+    return log
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import pytest
+import clone_projects as cp
+
+GIT_ENV = {"GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@example.com",
+           "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@example.com"}
+
+
+def git(*args):
+    return subprocess.run(["git", *args], check=True, capture_output=True, text=True,
+                          env={**os.environ, **GIT_ENV}).stdout.strip()
+
+
+def make_remote(tmp_path, name, files):
+    """filesをコミットしたbareリポジトリを作り、(file:// URL, 作業用clone) を返す。"""
+    work = tmp_path / "src" / name
+    work.mkdir(parents=True)
+    git("init", "-q", "-b", "main", str(work))
+    for path, content in files.items():
+        (work / path).parent.mkdir(parents=True, exist_ok=True)
+        (work / path).write_text(content, encoding="utf-8")
+    git("-C", str(work), "add", "-A")
+    git("-C", str(work), "commit", "-q", "-m", "init")
+    bare = tmp_path / "remote" / f"{name}.git"
+    git("clone", "-q", "--bare", str(work), str(bare))
+    # bloblessミラーと個別blobの取得を許可（GitHubと同じ挙動）
+    git("-C", str(bare), "config", "uploadpack.allowFilter", "true")
+    git("-C", str(bare), "config", "uploadpack.allowAnySHA1InWant", "true")
+    git("-C", str(work), "remote", "add", "origin", str(bare))
+    return f"file://{bare}", work
+
+
+@pytest.fixture
+def mirrors(tmp_path, monkeypatch):
+    monkeypatch.setattr(cp.update_mirror, "__defaults__", (str(tmp_path / "mirrors"),))
+
+
+def test_metadata_mode_extracts_only_relevant_files(tmp_path, mirrors):
+    url, _ = make_remote(tmp_path, "docs", {
+        "README.md": "# docs\n", "requirements.txt": "requests\n", "data.csv": "1,2\n", "src/app.py": "print()\n"})
+    base = tmp_path / "repos"
+    outcome = cp.clone_repo(url, "docs", str(base), mode="metadata")
+    assert (outcome["status"], outcome["checkout"]) == ("cloned", "metadata")
+    target = base / "docs"
+    assert sorted(os.listdir(target)) == sorted(["README.md", "requirements.txt", cp.METADATA_MARKER])
+    assert (target / "requirements.txt").read_text(encoding="utf-8") == "requests\n"
+    assert cp.current_rev(str(target)) == git("-C", str(tmp_path / "remote" / "docs.git"), "rev-parse", "HEAD")
+
+
+def test_metadata_mode_checks_out_docker_targets_and_tracks_updates(tmp_path, mirrors):
+    url, work = make_remote(tmp_path, "app", {
+        "README.md": "# app\n", "Dockerfile": "FROM python:3.11\n", "src/app.py": "print()\n"})
+    base = tmp_path / "repos"
+    outcome = cp.clone_repo(url, "app", str(base), mode="metadata")
+    assert (outcome["status"], outcome["checkout"]) == ("cloned", "full")
+    target = base / "app"
+    assert (target / "src" / "app.py").is_file()
+    assert (target / ".git").is_file()
+    assert cp.clone_repo(url, "app", str(base), mode="metadata")["status"] == "fetched"
+
+    (work / "src" / "app.py").write_text("print('v2')\n", encoding="utf-8")
+    git("-C", str(work), "commit", "-q", "-am", "v2")
+    git("-C", str(work), "push", "-q", "origin", "main")
+    assert cp.clone_repo(url, "app", str(base), mode="metadata")["status"] == "updated"
+    assert (target / "src" / "app.py").read_text(encoding="utf-8") == "print('v2')\n"
+    assert cp.current_rev(str(target)) == git("-C", str(work), "rev-parse", "HEAD")
+
+
+def test_full_mode_replaces_metadata_checkout(tmp_path, mirrors):
+    url, _ = make_remote(tmp_path, "lib", {"README.md": "# lib\n", "src/lib.py": "x = 1\n"})
+    base = tmp_path / "repos"
+    cp.clone_repo(url, "lib", str(base), mode="metadata")
+    outcome = cp.clone_repo(url, "lib", str(base), mode="full")
+    assert (outcome["status"], outcome["checkout"]) == ("cloned", "full")
+    assert (base / "lib" / ".git").is_dir()
+    assert (base / "lib" / "src" / "lib.py").is_file()
+
+
+def test_clone_all_keeps_input_order_and_skips_duplicate_names(tmp_path):
+    urls = {}
+    for name in ["r0", "r1", "r2", "r3"]:
+        urls[name], _ = make_remote(tmp_path, name, {"README.md": f"# {name}\n"})
+    other_url, _ = make_remote(tmp_path / "other", "r1", {"README.md": "# another r1\n"})
+    repos = [{"name": n, "full_name": f"o/{n}", "clone_url": u} for n, u in urls.items()]
+    repos.insert(2, {"name": "r1", "full_name": "x/r1", "clone_url": other_url, "path": "repos/r1"})
+    base = tmp_path / "repos"
+    result = cp.clone_all(repos, str(base), jobs=4, mode="full")
+    assert [r["full_name"] for r in result] == ["o/r0", "o/r1", "x/r1", "o/r2", "o/r3"]
+    assert [r["clone_status"] for r in result] == ["cloned", "cloned", "skipped", "cloned", "cloned"]
+    assert all(isinstance(r["clone_duration"], float) for r in result)
+    # 同名の2件目は1件目のチェックアウトを指さない
+    assert "path" not in result[2]
+    assert result[1]["path"] == str(base / "r1")
+    assert (base / "r1" / "README.md").read_text(encoding="utf-8") == "# r1\n"
+
+
+def test_clone_all_refreshes_existing_clones(tmp_path):
+    url, work = make_remote(tmp_path, "app", {"README.md": "v1\n"})
+    base = tmp_path / "repos"
+    cp.clone_all([{"name": "app", "clone_url": url}], str(base), mode="full")
+    (work / "README.md").write_text("v2\n", encoding="utf-8")
+    git("-C", str(work), "commit", "-q", "-am", "v2")
+    git("-C", str(work), "push", "-q", "origin", "main")
+    (repo,) = cp.clone_all([{"name": "app", "clone_url": url}], str(base), mode="full")
+    assert repo["clone_status"] == "updated"
+    assert (base / "app" / "README.md").read_text(encoding="utf-8") == "v2\n"
+
+    # ローカルで分岐したものはfetchのみ（作業ツリーはそのまま）
+    checkout = base / "app"
+    (checkout / "local.txt").write_text("x\n", encoding="utf-8")
+    git("-C", str(checkout), "add", "local.txt")
+    git("-C", str(checkout), "commit", "-q", "-m", "local")
+    (work / "README.md").write_text("v3\n", encoding="utf-8")
+    git("-C", str(work), "commit", "-q", "-am", "v3")
+    git("-C", str(work), "push", "-q", "origin", "main")
+    (repo,) = cp.clone_all([{"name": "app", "clone_url": url}], str(base), mode="full")
+    assert repo["clone_status"] == "fetched"
+    assert (checkout / "README.md").read_text(encoding="utf-8") == "v2\n"
+    assert git("-C", str(checkout), "rev-parse", "origin/main") == git("-C", str(work), "rev-parse", "HEAD")
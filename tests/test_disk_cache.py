@@ -0,0 +1,52 @@
+import os
+import time
+from disk_cache import DiskCache, make_key
+
+
+def age(cache, key, created_ago=0, accessed_ago=0):
+    """エントリの作成時刻（mtime）と最終アクセス時刻（atime）を過去にずらす。"""
+    now = time.time()
+    os.utime(cache._path(key), (now - accessed_ago, now - created_ago))
+
+
+def test_get_put_and_counts(tmp_path):
+    cache = DiskCache(str(tmp_path), name="test")
+    key = make_key("repo", 1)
+    assert cache.get(key) is None
+    cache.put(key, {"ok": True})
+    assert cache.get(key) == {"ok": True}
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_ttl_counts_from_creation(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_age=100)
+    cache.put("k", 1)
+    assert cache.get("k") == 1
+    real_time = time.time
+    monkeypatch.setattr(time, "time", lambda: real_time() + 101)
+    assert cache.get("k") is None
+    assert not os.path.exists(cache._path("k"))
+
+
+def test_access_does_not_extend_ttl_on_evict(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=100)
+    cache.put("old", 1)
+    cache.put("new", 2)
+    age(cache, "old", created_ago=200)
+    # 期限内に読まれても作成時刻（mtime）は変わらない
+    cache.get("old")
+    assert time.time() - os.stat(cache._path("old")).st_mtime > 100
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ["new.json"]
+
+
+def test_lru_evicts_least_recently_accessed(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=0, max_age=0)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.put(key, "x" * 100)
+        age(cache, key, created_ago=300 - i, accessed_ago=300 - i)
+    cache.max_bytes = os.path.getsize(cache._path("a")) + os.path.getsize(cache._path("c"))
+    # 一番古く作った a を読むと最終アクセスが新しくなり、b が先に消える
+    assert cache.get("a") == "x" * 100
+    assert cache.evict() == 1
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
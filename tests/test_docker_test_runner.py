@@ -0,0 +1,279 @@
+import json
+import time
+import threading
+import docker_test_runner as dtr
+
+
+def test_schedule_without_docker_records_build_failure(tmp_path, no_docker):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "Dockerfile").write_text("FROM python:3.11\nCMD [\"true\"]\n", encoding="utf-8")
+    results, _ = dtr.schedule_docker_tests([(str(repo), "r", None)], image_budget_mb=0)
+    assert results["r"]["build_success"] is False
+    assert "docker" in results["r"]["build_log"]
+
+
+def test_image_budget_survives_missing_docker(no_docker):
+    budget = dtr.ImageBudget(budget_mb=0)
+    budget.add("r_img", size=10)
+    budget.release()
+    assert budget.total == 0
+
+
+def result(build_log="", test_log="", **kwargs):
+    return {"repo_name": "r", "build_success": False, "build_log": build_log, "test_log": test_log, **kwargs}
+
+
+def test_is_cacheable_keeps_repo_failures():
+    assert dtr.is_cacheable(result("ERROR: failed to solve: process \"/bin/sh -c make\" did not complete"))
+    assert dtr.is_cacheable(result(test_log="FAILED (failures=1)", build_success=True, test_success=False))
+
+
+def test_is_cacheable_skips_transient_failures():
+    assert not dtr.is_cacheable(result(dtr.BUILD_TIMEOUT_MSG + "\n..."))
+    assert not dtr.is_cacheable(result(test_log=dtr.RUN_TIMEOUT_MSG + "\n..."))
+    assert not dtr.is_cacheable(result(test_log=dtr.RUN_IDLE_TIMEOUT_MSG + "（30秒）\n..."))
+    assert not dtr.is_cacheable(result(
+        "Cannot connect to the Docker daemon at unix:///var/run/docker.sock. Is the docker daemon running?"))
+    assert not dtr.is_cacheable(result("#3 ERROR: toomanyrequests: You have reached your pull rate limit."))
+
+
+def test_missing_docker_result_is_not_cacheable(tmp_path, no_docker):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    (repo / "Dockerfile").write_text("FROM python:3.11\n", encoding="utf-8")
+    results, _ = dtr.schedule_docker_tests([(str(repo), "r", None)], image_budget_mb=0)
+    assert results["r"]["build_log"].startswith(dtr.DOCKER_ERROR_MSG)
+    assert not dtr.is_cacheable(results["r"])
+
+
+def test_output_matcher_fail_rule_is_decisive():
+    matcher = dtr.OutputMatcher()
+    assert not matcher.feed("collected 2 items\n")
+    assert matcher.feed("===== 1 failed, 1 passed in 0.12s =====\n")
+    assert matcher.decision == ("pytest_failed", "fail")
+
+
+def test_output_matcher_pass_rule_only_near_end():
+    matcher = dtr.OutputMatcher()
+    # 途中の "OK" では止めない
+    assert not matcher.feed("OK\n")
+    assert matcher.passed_at_end() == "unittest_ok"
+    for i in range(dtr.TEST_PASS_TAIL_LINES):
+        matcher.feed(f"line {i}\n")
+    assert matcher.passed_at_end() is None
+    assert matcher.decision is None
+
+
+def test_output_matcher_suspect_keywords():
+    matcher = dtr.OutputMatcher()
+    assert not matcher.feed("Connection TIMEOUT, retrying\n")
+    assert matcher.suspect == "keyword:timeout"
+    assert matcher.decision is None
+
+
+def test_idle_timeout_is_opt_in():
+    assert dtr.RUN_IDLE_TIMEOUT == 0
+
+
+def run(monkeypatch, output, exit_code=0):
+    monkeypatch.setenv("FAKE_DOCKER_RUN_OUTPUT", output)
+    monkeypatch.setenv("FAKE_DOCKER_RUN_EXIT", str(exit_code))
+    success, _, _, rule, _, _ = dtr.run_container("r")
+    return success, rule
+
+
+def test_run_container_pass_needs_exit_code_zero(fake_docker, monkeypatch):
+    assert run(monkeypatch, "Ran 3 tests in 0.01s\n\nOK") == (True, "unittest_ok")
+    # "OK" を出力した後に異常終了したものは失敗
+    assert run(monkeypatch, "OK\nTraceback (most recent call last):\n  boom", exit_code=1) == (False, "exit_code")
+
+
+def test_run_container_pass_rule_overrides_suspect_keywords(fake_docker, monkeypatch):
+    output = "test_error_handling ... ok\n===== 3 passed in 0.02s ====="
+    assert run(monkeypatch, output) == (True, "pytest_passed")
+    assert run(monkeypatch, "printing an error message") == (False, "keyword:error")
+
+
+def test_run_container_stops_on_fail_rule(fake_docker, monkeypatch):
+    monkeypatch.setenv("FAKE_DOCKER_HANG", "30")
+    assert run(monkeypatch, "===== 2 failed in 0.05s =====") == (False, "pytest_failed")
+
+
+def write_dockerfile(path, text, name="Dockerfile"):
+    path.mkdir(parents=True, exist_ok=True)
+    (path / name).write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_parse_base_images_expands_args_and_follows_stages(tmp_path):
+    repo = write_dockerfile(tmp_path / "multi", (
+        "ARG PY=3.11\n"
+        "ARG REGISTRY=ghcr.io/acme\n"
+        "FROM python:${PY}-slim AS builder\n"
+        "ARG LATE=ignored\n"
+        "FROM $REGISTRY/runtime AS runtime\n"
+        "FROM builder AS test\n"
+        "FROM --platform=linux/amd64 node:20 AS web\n"
+        "FROM runtime\n"
+        "COPY --from=builder /app /app\n"
+    ))
+    # 最終ステージ（runtime を参照）のベースが先頭、以降は出現順
+    assert dtr.parse_base_images(repo + "/Dockerfile") == [
+        "ghcr.io/acme/runtime:latest", "python:3.11-slim", "node:20"]
+
+
+def test_parse_base_images_skips_scratch_and_unresolved(tmp_path):
+    repo = write_dockerfile(tmp_path / "r", (
+        "FROM golang:1.22 AS build\n"
+        "FROM ${UNKNOWN}/img\n"
+        "FROM scratch\n"
+        "FROM alpine@sha256:abc\n"
+    ))
+    assert dtr.parse_base_images(repo + "/Dockerfile") == ["alpine@sha256:abc", "golang:1.22"]
+    assert dtr.parse_base_images(str(tmp_path / "missing" / "Dockerfile")) == []
+
+
+def docker_commands(log):
+    return [json.loads(line) for line in log.read_text(encoding="utf-8").splitlines()]
+
+
+def test_schedule_warms_bases_once_groups_builds_and_prunes(tmp_path, fake_docker):
+    targets = []
+    for name, base in [("a1", "python:3.11"), ("b1", "node:20"), ("a2", "python:3.11"), ("b2", "node:20"), ("a3", "python:3.11")]:
+        targets.append((write_dockerfile(tmp_path / name, f"FROM {base}\nCMD true\n"), name, None))
+    results, _ = dtr.schedule_docker_tests(targets, build_jobs=1, run_jobs=1, image_budget_mb=0)
+    assert all(r["build_success"] and r["test_success"] for r in results.values())
+    commands = docker_commands(fake_docker)
+    pulls = [c[1] for c in commands if c[0] == "pull"]
+    assert sorted(pulls) == ["node:20", "python:3.11"]
+    builds = [c[c.index("-t") + 1] for c in commands if c[0] == "build"]
+    first_build = next(i for i, c in enumerate(commands) if c[0] == "build")
+    assert max(i for i, c in enumerate(commands) if c[0] == "pull") < first_build
+    # 同じベースのビルドは連続する（3件のpythonグループが先）
+    assert builds == [dtr.docker_image_name(n) for n in ["a1", "a2", "a3", "b1", "b2"]]
+    # 上限0なのでテストの度にイメージを削除してpruneする
+    rmis = [c for c in commands if c[0] == "rmi"]
+    assert sorted(c[-1] for c in rmis) == sorted(dtr.docker_image_name(t[1]) for t in targets)
+    assert sum(c[:2] == ["image", "prune"] for c in commands) >= len(targets)
+
+
+def test_warm_base_images_records_failed_pull(fake_docker, monkeypatch):
+    monkeypatch.setenv("FAKE_DOCKER_PULL_FAIL", "private/img:latest")
+    counters = {}
+    monkeypatch.setattr(dtr.metrics, "incr", lambda name, value=1, **labels: counters.__setitem__(
+        (name, labels.get("status")), counters.get((name, labels.get("status")), 0) + value))
+    sizes = dtr.warm_base_images(["private/img:latest", "python:3.11"])
+    assert sizes == {"private/img:latest": None, "python:3.11": 123456789}
+    assert counters == {("base_images", "failed"): 1, ("base_images", "pulled"): 1}
+
+
+def test_schedule_builds_longest_first(tmp_path, fake_docker):
+    targets = [(write_dockerfile(tmp_path / n, "FROM python:3.11\n"), n, None) for n in ["short", "long", "new", "mid"]]
+    durations = {"short": 5, "long": 50, "mid": 20}
+    _, updated = dtr.schedule_docker_tests(targets, build_jobs=1, run_jobs=1, durations=durations, image_budget_mb=0)
+    builds = [c[c.index("-t") + 1] for c in docker_commands(fake_docker) if c[0] == "build"]
+    # 所要時間の分からないものは最長扱い
+    assert builds == [dtr.docker_image_name(n) for n in ["new", "long", "mid", "short"]]
+    assert set(updated) == {"short", "long", "new", "mid"}
+
+
+def test_schedule_respects_build_and_run_limits(tmp_path, fake_docker, monkeypatch):
+    monkeypatch.setenv("FAKE_DOCKER_LATENCY", "0.05")
+    monkeypatch.setenv("FAKE_DOCKER_HANG", "1")
+    active = {"build": 0, "run": 0}
+    peak = {"build": 0, "run": 0}
+    lock = threading.Lock()
+
+    def tracked(kind, fn):
+        def wrapper(*args, **kwargs):
+            with lock:
+                active[kind] += 1
+                peak[kind] = max(peak[kind], active[kind])
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with lock:
+                    active[kind] -= 1
+        return wrapper
+
+    monkeypatch.setattr(dtr, "build_image", tracked("build", dtr.build_image))
+    monkeypatch.setattr(dtr, "run_container", tracked("run", dtr.run_container))
+    targets = [(write_dockerfile(tmp_path / f"r{i}", "FROM python:3.11\n"), f"r{i}", None) for i in range(6)]
+    results, _ = dtr.schedule_docker_tests(targets, build_jobs=2, run_jobs=3, image_budget_mb=0)
+    assert len(results) == 6 and all(r["test_success"] for r in results.values())
+    assert peak == {"build": 2, "run": 3}
+
+
+def test_schedule_passes_resource_limits_to_docker_run(tmp_path, fake_docker):
+    targets = [(write_dockerfile(tmp_path / "r", "FROM python:3.11\n"), "r", None)]
+    dtr.schedule_docker_tests(targets, cpus="1.5", memory="512m", image_budget_mb=0)
+    (run,) = [c for c in docker_commands(fake_docker) if c[0] == "run"]
+    assert run[run.index("--cpus") + 1] == "1.5"
+    assert run[run.index("--memory") + 1] == "512m"
+    assert run[-1] == dtr.docker_image_name("r")
+
+
+def test_log_excerpt_keeps_head_and_tail():
+    excerpt = dtr.LogExcerpt(head_chars=10, tail_chars=8)
+    for i in range(100):
+        excerpt.add(f"line {i:03d}\n")
+    text = excerpt.text()
+    head, tail = text.split("\n...省略...\n")
+    assert head == "line 000\nl"
+    assert tail == "ine 099\n"
+
+
+def test_log_excerpt_without_truncation_is_verbatim():
+    excerpt = dtr.LogExcerpt(head_chars=10, tail_chars=100)
+    lines = [f"line {i}\n" for i in range(5)]
+    for line in lines:
+        excerpt.add(line)
+    assert excerpt.text() == "".join(lines)
+
+
+def python_cmd(code):
+    import sys
+    return [sys.executable, "-c", code]
+
+
+def test_stream_command_writes_full_log_and_returns_excerpt(tmp_path):
+    import gzip
+    log_path = str(tmp_path / "logs" / "r_build.log.gz")
+    rc, excerpt, ended = dtr.stream_command(
+        python_cmd("import sys\nfor i in range(5000): print(f'step {i}')\nprint('oops', file=sys.stderr)\nsys.exit(3)"),
+        timeout=30, log_path=log_path)
+    assert (rc, ended) == (3, None)
+    with gzip.open(log_path, "rt", encoding="utf-8") as f:
+        full = f.read()
+    assert full.count("step ") == 5000 and full.endswith("oops\n")
+    assert excerpt.startswith("step 0\n") and excerpt.endswith("oops\n")
+    assert "...省略..." in excerpt
+    assert len(excerpt) <= dtr.LOG_HEAD_CHARS + dtr.LOG_TAIL_CHARS + len("\n...省略...\n")
+
+
+def test_stream_command_kills_on_timeout_without_grace_period(tmp_path):
+    log_path = str(tmp_path / "r_run.log.gz")
+    started = time.monotonic()
+    rc, excerpt, ended = dtr.stream_command(
+        python_cmd("import time\nprint('started', flush=True)\ntime.sleep(60)"),
+        timeout=0.5, log_path=log_path)
+    assert (rc, ended) == (None, "timeout")
+    assert "started" in excerpt
+    # killを渡さない場合は猶予待ちせずにすぐ止める
+    assert time.monotonic() - started < 5
+
+
+def test_stream_command_stops_on_line_and_idle(tmp_path):
+    stop = dtr.stream_command(
+        python_cmd("import time\nprint('ready', flush=True)\ntime.sleep(60)"),
+        timeout=30, log_path=str(tmp_path / "a.log.gz"), on_line=lambda line: "ready" in line)
+    assert stop[0] is None and stop[2] == "stopped"
+    # docker kill 相当: 停止ファイルを置くと子プロセスが自分で終わる
+    flag = tmp_path / "killed"
+    started = time.monotonic()
+    idle = dtr.stream_command(
+        python_cmd(f"import os, time\nwhile not os.path.exists({str(flag)!r}): time.sleep(0.05)"),
+        timeout=30, log_path=str(tmp_path / "b.log.gz"), idle_timeout=0.5, kill=flag.touch)
+    assert idle[0] is None and idle[2] == "idle" and flag.exists()
+    assert time.monotonic() - started < 5
@@ -0,0 +1,33 @@
+import os
+import generate_markdown_report as gmr
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def render(tmp_path, monkeypatch, repos):
+    monkeypatch.setattr(gmr, "TEMPLATE_DIR", ROOT)
+    monkeypatch.setattr(gmr, "_env", None)
+    shard_dir = tmp_path / "report"
+    index_path, _, _ = gmr.write_shards(iter(repos), str(shard_dir))
+    return shard_dir, open(index_path, encoding="utf-8").read()
+
+
+def repo(name, **extra):
+    return {"name": name, "full_name": f"o/{name}", "stars": 1, "html_url": "https://example.com",
+            "技術スタック": ["Python"], "主な用途・使い方": [], "Usage例": [], "利用AI Provider": [], **extra}
+
+
+def test_regression_flags_and_note(tmp_path, monkeypatch):
+    flags = {"b": ["ビルド時間 95.0s（基準 60.0s の 1.58倍、2026-10-17 23:40 計測）"]}
+    shard_dir, index = render(tmp_path, monkeypatch, gmr.with_perf_flags([repo("a"), repo("b")], flags))
+    assert "[b](o__b.md) ⚠性能劣化" in index
+    assert gmr.perf_history.PERF_HISTORY_NOTE in index
+    shard = (shard_dir / "o__b.md").read_text(encoding="utf-8")
+    assert "### 性能劣化" in shard and gmr.perf_history.PERF_HISTORY_NOTE in shard
+    assert "性能劣化" not in (shard_dir / "o__a.md").read_text(encoding="utf-8")
+
+
+def test_no_note_without_regressions(tmp_path, monkeypatch):
+    _, index = render(tmp_path, monkeypatch, [repo("a")])
+    assert "性能劣化" not in index
+    assert "件）\n\n| プロジェクト |" in index
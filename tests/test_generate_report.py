@@ -0,0 +1,60 @@
+import generate_report
+from generate_report import build_scanner, scan_text, scan_file
+
+KEYWORDS = [("Node.js", "Node.js", "tech"), ("OpenAI", "OpenAI", "ai"), ("Python", "Python", "tech"), ("Py", "Py", "tech")]
+FEATURES = ["UI/UX", "自動化"]
+
+
+def labels(found, scanner):
+    return {label for i, kw in found for _, label in scanner[0][i][2][kw]}
+
+
+def test_tech_keywords_ignore_case_features_do_not():
+    scanner = build_scanner(KEYWORDS, FEATURES)
+    found = scan_text("uses OPENAI and python; ui/ux 自動化", set(), scanner)
+    # 同じ位置から始まる Py より長い Python を優先する
+    assert labels(found, scanner) == {"OpenAI", "Python", "自動化"}
+    found = scan_text("UI/UX", set(), scanner)
+    assert labels(found, scanner) == {"UI/UX"}
+
+
+def test_keywords_are_literal():
+    scanner = build_scanner(KEYWORDS, FEATURES)
+    assert labels(scan_text("nodexjs", set(), scanner), scanner) == set()
+    assert labels(scan_text("node.JS", set(), scanner), scanner) == {"Node.js"}
+
+
+def test_scan_file_matches_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(generate_report, "SCAN_CHUNK_SIZE", 8)
+    path = tmp_path / "main.py"
+    path.write_text("x" * 6 + "OpenAI " + "y" * 5 + "UI/UX", encoding="utf-8")
+    scanner = build_scanner(KEYWORDS, FEATURES)
+    assert labels(scan_file(str(path), set(), scanner), scanner) == {"OpenAI", "UI/UX"}
+
+
+def test_extract_info_from_readme(tmp_path):
+    readme = tmp_path / "README.md"
+    readme.write_text("# Demo\nA Python tool using openai for UI/UX 自動化.\n", encoding="utf-8")
+    (tmp_path / "requirements.txt").write_text("torch\n", encoding="utf-8")
+    tech, features, ai, _ = generate_report.extract_info_from_readme(str(readme), summarize=False)
+    assert "Python" in tech
+    assert ai == ["OpenAI"]
+    assert sorted(features) == sorted(["UI/UX", "自動化"])
+
+
+def test_summarize_readmes_records_span_per_repo(monkeypatch):
+    import asyncio
+    import metrics
+
+    async def fake_completion(messages, **kwargs):
+        if "broken" in messages[-1]["content"]:
+            raise RuntimeError("boom")
+        return {"choices": [{"message": {"content": "- 用途A\n- 使い方B"}}]}
+
+    monkeypatch.setattr(generate_report, "achat_completion", fake_completion)
+    monkeypatch.setattr(metrics, "_spans", [])
+    results = asyncio.run(generate_report.summarize_readmes(
+        ["alpha readme", "", "broken readme"], names=["a", "b", "c"]))
+    assert results[0] == ["用途A", "使い方B"] and results[1] == [] and results[2][0].startswith("AI要約失敗")
+    # 空のREADMEは要約しないのでスパンもない。失敗してもスパンは残る
+    assert sorted(s["labels"]["repo"] for s in metrics._spans if s["name"] == "summarize") == ["a", "c"]
@@ -0,0 +1,127 @@
+import random
+import pytest
+import llm_client
+from llm_client import estimate_tokens, truncate_to_tokens, chat_completion
+from disk_cache import DiskCache
+
+
+def reference_truncate(text, budget):
+    # 線形化する前の二分探索による実装
+    if estimate_tokens(text) <= budget:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def test_truncate_matches_binary_search():
+    rng = random.Random(0)
+    for _ in range(300):
+        text = "".join(rng.choice("ab c\n日本語") for _ in range(rng.randrange(0, 200)))
+        budget = rng.randrange(0, 120)
+        assert truncate_to_tokens(text, budget) == reference_truncate(text, budget)
+
+
+def test_truncate_large_text_fits_budget():
+    text = "word " * 200000
+    truncated = truncate_to_tokens(text, 1000)
+    assert estimate_tokens(truncated) <= 1000 < estimate_tokens(truncated + text[len(truncated)])
+
+
+MESSAGES = [{"role": "user", "content": "要約して"}]
+
+
+@pytest.fixture
+def openai_stub(tmp_path, monkeypatch):
+    """bench のOpenAIスタブへ向け、LLMキャッシュを一時ディレクトリにする。起動関数を返す。"""
+    from stubs import start_openai_stub
+    servers = []
+    sleeps = []
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(llm_client, "_openai", None)
+    monkeypatch.setattr(llm_client, "_cache", DiskCache(str(tmp_path / "llm"), name="llm"))
+    # time.sleepはスタブのスレッドとも共有なので、待機（正の秒数）だけを記録する
+    monkeypatch.setattr(llm_client.time, "sleep", lambda s: s > 0 and sleeps.append(s))
+
+    def start(**kwargs):
+        server = start_openai_stub(**kwargs)
+        servers.append(server)
+        monkeypatch.setenv("OPENAI_API_BASE", f"http://127.0.0.1:{server.server_port}/v1")
+        return server, sleeps
+
+    yield start
+    for server in servers:
+        server.shutdown()
+    import openai
+    openai.api_base = "https://api.openai.com/v1"
+
+
+def test_chat_completion_caches_responses(openai_stub):
+    server, _ = openai_stub()
+    first = chat_completion(MESSAGES)
+    assert first["choices"][0]["message"]["content"]
+    assert chat_completion(MESSAGES) == first
+    assert len(server.requests) == 1
+    assert llm_client.cache_stats()["hits"] == 1
+    # 引数が変わればキャッシュミスとしてAPIを呼ぶ
+    chat_completion(MESSAGES, max_tokens=100)
+    chat_completion(MESSAGES, use_cache=False)
+    assert len(server.requests) == 3
+
+
+def test_chat_completion_retries_429_after_retry_after(openai_stub):
+    server, sleeps = openai_stub(errors=[(429, {"Retry-After": "3"})])
+    response = chat_completion(MESSAGES)
+    assert response["choices"]
+    assert len(server.requests) == 2
+    assert sleeps == [3.0]
+
+
+def test_chat_completion_does_not_retry_400(openai_stub):
+    import openai
+    server, sleeps = openai_stub(errors=[(400, {})])
+    with pytest.raises(openai.error.InvalidRequestError):
+        chat_completion(MESSAGES)
+    assert len(server.requests) == 1
+    assert sleeps == []
+    # 失敗した応答はキャッシュしない
+    assert chat_completion(MESSAGES)["choices"]
+    assert len(server.requests) == 2
+
+
+def test_achat_completion_retries_429(openai_stub, monkeypatch):
+    import asyncio
+    server, _ = openai_stub(errors=[(429, {"Retry-After": "2"})])
+    waits = []
+
+    async def fake_sleep(delay):
+        waits.append(delay)
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", fake_sleep)
+    response = asyncio.run(llm_client.achat_completion(MESSAGES))
+    assert response["choices"]
+    assert len(server.requests) == 2
+    assert waits == [2.0]
+
+
+def test_tiktoken_lookup_is_resolved_once(monkeypatch):
+    import builtins
+    real_import = builtins.__import__
+    attempts = []
+
+    def counting_import(name, *args, **kwargs):
+        if name == "tiktoken":
+            attempts.append(name)
+        return real_import(name, *args, **kwargs)
+
+    llm_client._tiktoken_encoding.cache_clear()
+    monkeypatch.setattr(builtins, "__import__", counting_import)
+    for _ in range(5):
+        estimate_tokens("hello world")
+        truncate_to_tokens("hello world", 1)
+    assert len(attempts) == 1
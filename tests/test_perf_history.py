@@ -0,0 +1,59 @@
+import perf_history
+from results_store import ResultsStore
+
+MB = 1024 * 1024
+
+
+def add_runs(store, repo, runs):
+    for build_seconds, image_mb, ok in runs:
+        store.add_docker_metrics(repo, None, {
+            "build_success": ok,
+            "test_success": ok,
+            "build_seconds": build_seconds,
+            "image_bytes": image_mb * MB if image_mb is not None else None,
+        })
+
+
+def test_flags_build_time_against_median(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    add_runs(store, "slow", [(60, 100, True), (62, 100, True), (300, 100, False), (58, 100, True), (95, 100, True)])
+    add_runs(store, "steady", [(60, 100, True), (61, 100, True), (66, 100, True)])
+    regressions = perf_history.find_regressions(store, baseline_runs=5, threshold=0.2)
+    assert list(regressions) == ["slow"]
+    (item,) = regressions["slow"]
+    # 失敗したビルド（300s）はベースラインに含めない
+    assert item["metric"] == "build_seconds"
+    assert item["baseline"] == 60
+    assert item["ratio"] == round(95 / 60, 3)
+    assert "ビルド時間 95.0s（基準 60.0s の 1.58倍、" in perf_history.describe(item)
+
+
+def test_small_or_unsupported_changes_are_not_flagged(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    # 比率は超えても最小増加量（10s / 50MB）未満
+    add_runs(store, "small", [(5, 10, True), (5, 10, True), (9, 40, True)])
+    # 比較対象が1回だけ
+    add_runs(store, "new", [(10, 100, True), (100, 900, True)])
+    assert perf_history.find_regressions(store, baseline_runs=5, threshold=0.2) == {}
+
+
+def test_image_size_regression(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    add_runs(store, "big", [(60, 200, True), (60, 210, True), (60, 400, True)])
+    regressions = perf_history.find_regressions(store, baseline_runs=5, threshold=0.2)
+    assert [r["metric"] for r in regressions["big"]] == ["image_bytes"]
+
+
+def test_latest_failed_build_drops_stale_flag(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    add_runs(store, "r", [(60, 100, True), (60, 100, True), (120, 100, True)])
+    assert "r" in perf_history.find_regressions(store)
+    add_runs(store, "r", [(None, None, False)])
+    assert perf_history.find_regressions(store) == {}
+
+
+def test_record_skips_static_analysis(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    perf_history.record(store, 1, {"repo_name": "static", "build_success": None})
+    perf_history.record(store, 1, {"repo_name": "built", "build_success": True, "build_seconds": 3})
+    assert list(store.recent_docker_metrics(5, successful_builds=False)) == ["built"]
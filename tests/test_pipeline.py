@@ -0,0 +1,50 @@
+import pipeline
+
+
+def stage(name):
+    return pipeline.STAGES[pipeline.STAGE_NAMES.index(name)]
+
+
+def test_dependencies():
+    assert pipeline.dependencies(stage("check")) == ["clone"]
+    assert pipeline.dependencies(stage("report")) == ["clone", "check"]
+    assert pipeline.dependencies(stage("docker")) == ["check", "clone"]
+    assert pipeline.dependencies(stage("markdown")) == ["report", "docker"]
+
+
+def test_clone_dir_walked_once_and_unchanged_stages_skipped(tmp_path, monkeypatch):
+    clone_dir = tmp_path / "repos"
+    (clone_dir / "a").mkdir(parents=True)
+    (clone_dir / "a" / "Dockerfile").write_text("FROM scratch\n", encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "output").mkdir()
+    for path in ["output/repos.json", "output/check_results.json", "output/repo_index.json", "output/test_results.json"]:
+        (tmp_path / path).write_text("[]", encoding="utf-8")
+    stages = [dict(s) for s in pipeline.STAGES]
+    for s in stages:
+        s["reads"] = [str(clone_dir) if p == pipeline.CLONE_DIR else p for p in s["reads"]]
+        s["writes"] = [str(clone_dir) if p == pipeline.CLONE_DIR else p for p in s["writes"]]
+    monkeypatch.setattr(pipeline, "STAGES", stages)
+    ran = []
+    monkeypatch.setattr(pipeline, "run_stage", lambda s, in_process=False: ran.append(s["name"]) or 0)
+    walks = []
+    real_fingerprint = pipeline.fingerprint
+    monkeypatch.setattr(pipeline, "fingerprint", lambda p: (walks.append(p) if p == str(clone_dir) else None) or real_fingerprint(p))
+
+    assert pipeline.run_pipeline(jobs=1)
+    assert ran == ["clone", "check", "report", "docker", "markdown"]
+    assert walks == [str(clone_dir)]
+
+    ran.clear()
+    walks.clear()
+    assert pipeline.run_pipeline(jobs=1)
+    assert ran == []
+    assert walks == []
+
+    # docker はビルドコンテキスト（CLONE_DIR）の変更でも再実行される
+    ran.clear()
+    (clone_dir / "a" / "Dockerfile").write_text("FROM alpine\n", encoding="utf-8")
+    assert pipeline.run_pipeline(only=["clone"], jobs=1)
+    assert pipeline.run_pipeline(jobs=1)
+    # 出力の変わらなかった report/docker の後ろの markdown は再実行しない
+    assert ran == ["clone", "check", "report", "docker"]
@@ -0,0 +1,122 @@
+import time
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import readme_fetcher
+from disk_cache import DiskCache, make_key
+
+
+def start_raw_stub(files, latency=0.0):
+    """raw.githubusercontent.com を模したスタブ。files は {パス: 本文}、ETagで304を返す。"""
+    server = None
+    active = [0]
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            with lock:
+                active[0] += 1
+                server.peak = max(server.peak, active[0])
+            try:
+                time.sleep(latency)
+                text = files.get(self.path)
+                etag = f'"{hashlib.sha1(text.encode()).hexdigest()}"' if text is not None else None
+                if text is None:
+                    status = 404
+                elif self.headers.get("If-None-Match") == etag:
+                    status = 304
+                else:
+                    status = 200
+                server.requests.append((self.path, self.headers.get("If-None-Match"), status))
+                body = text.encode("utf-8") if status == 200 else b""
+                self.send_response(status)
+                if etag:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.requests = []
+    server.peak = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def raw(tmp_path, monkeypatch):
+    """READMEの取得先をローカルのスタブに向ける。起動関数を返す。"""
+    servers = []
+    monkeypatch.setattr(readme_fetcher, "_session", None)
+    monkeypatch.setattr(readme_fetcher, "_cache", DiskCache(str(tmp_path / "readme"), name="readme"))
+    monkeypatch.setattr(readme_fetcher, "_host_limits", {})
+
+    def start(files, **kwargs):
+        server = start_raw_stub(files, **kwargs)
+        servers.append(server)
+        monkeypatch.setattr(readme_fetcher, "README_RAW_BASE", f"http://127.0.0.1:{server.server_port}")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_readme_url_uses_default_branch_or_head(monkeypatch):
+    monkeypatch.setattr(readme_fetcher, "README_RAW_BASE", "https://raw.example.com/")
+    assert readme_fetcher.readme_url({"full_name": "o/r", "default_branch": "develop"}) == \
+        "https://raw.example.com/o/r/develop/README.md"
+    assert readme_fetcher.readme_url({"full_name": "o/r"}) == "https://raw.example.com/o/r/HEAD/README.md"
+
+
+def test_fetch_readme_revalidates_with_etag(raw):
+    files = {"/o/r/main/README.md": "# 日本語のREADME\n"}
+    server = raw(files)
+    repo = {"name": "r", "full_name": "o/r", "default_branch": "main"}
+    assert readme_fetcher.fetch_readme(repo) == "# 日本語のREADME\n"
+    assert readme_fetcher.fetch_readme(repo) == "# 日本語のREADME\n"
+    (_, first_etag, first), (_, etag, second) = server.requests
+    assert (first_etag, first) == (None, 200)
+    assert etag and second == 304
+    # 本文が変われば200で取り直す
+    files["/o/r/main/README.md"] = "# 更新\n"
+    assert readme_fetcher.fetch_readme(repo) == "# 更新\n"
+    assert server.requests[-1][2] == 200
+
+
+def test_fetch_readme_evicts_cache_on_404(raw):
+    files = {"/o/r/HEAD/README.md": "hello"}
+    server = raw(files)
+    repo = {"name": "r", "full_name": "o/r"}
+    assert readme_fetcher.fetch_readme(repo) == "hello"
+    key = make_key("readme-v1", readme_fetcher.readme_url(repo))
+    assert readme_fetcher.get_cache().get(key)
+    del files["/o/r/HEAD/README.md"]
+    assert readme_fetcher.fetch_readme(repo) == ""
+    assert readme_fetcher.get_cache().get(key) is None
+    # 消えたキャッシュで条件付きリクエストを送らない
+    files["/o/r/HEAD/README.md"] = "back"
+    assert readme_fetcher.fetch_readme(repo) == "back"
+    assert server.requests[-1][1:] == (None, 200)
+
+
+def test_fetch_readmes_limits_connections_per_host(raw, monkeypatch):
+    monkeypatch.setattr(readme_fetcher, "README_FETCH_PER_HOST", 2)
+    repos = [{"name": f"r{i}", "full_name": f"o/r{i}"} for i in range(8)]
+    server = raw({f"/o/r{i}/HEAD/README.md": f"readme {i}" for i in range(8)}, latency=0.1)
+    texts = readme_fetcher.fetch_readmes(repos, jobs=8)
+    assert texts == {f"o/r{i}": f"readme {i}" for i in range(8)}
+    assert server.peak == 2
+
+
+def test_fetch_readmes_keeps_same_name_from_different_owners(raw):
+    raw({"/a/tool/HEAD/README.md": "from a", "/b/tool/HEAD/README.md": "from b"})
+    repos = [{"name": "tool", "full_name": "a/tool"}, {"name": "tool", "full_name": "b/tool"}]
+    assert readme_fetcher.fetch_readmes(repos) == {"a/tool": "from a", "b/tool": "from b"}
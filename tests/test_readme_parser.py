@@ -0,0 +1,83 @@
+from readme_parser import parse_readme, usage_items
+
+
+def parse(text, **kwargs):
+    return parse_readme(text.splitlines(keepends=True), **kwargs)
+
+
+def test_inline_triple_backticks_do_not_open_fence():
+    doc = parse("# Demo\n\n```pip install demo```\n\n## Usage\n\nrun `demo`\n")
+    assert doc.code_blocks == []
+    assert doc.headings == [(1, "Demo"), (2, "Usage")]
+    assert doc.sections["usage"] == "run `demo`"
+
+
+def test_fenced_code_with_language():
+    doc = parse("```python\nimport demo\n```\n")
+    assert doc.code_blocks == [("python", "import demo")]
+
+
+def test_closing_fence_indented_four_spaces_is_code():
+    doc = parse("```\na\n    ```\nb\n```\n# After\n")
+    assert doc.code_blocks == [("", "a\n    ```\nb")]
+    assert doc.headings == [(1, "After")]
+
+
+def test_tilde_fence_ignores_backticks_and_needs_same_length():
+    doc = parse("~~~~sh\necho ```\n~~~\nls\n~~~~\n## Usage\nok\n")
+    assert doc.code_blocks == [("sh", "echo ```\n~~~\nls")]
+    assert doc.sections["usage"] == "ok"
+
+
+def test_hash_inside_fence_is_not_heading():
+    doc = parse("## Install\n```sh\n# comment\npip install demo\n```\n")
+    assert doc.headings == [(2, "Install")]
+    assert doc.sections["installation"] == "```sh\n# comment\npip install demo\n```"
+
+
+def test_setext_headings_and_sections():
+    doc = parse("Demo\n====\n\nintro\n\nUsage\n-----\n\nrun it\n\nDetails\n-------\nmore\n")
+    assert doc.headings == [(1, "Demo"), (2, "Usage"), (2, "Details")]
+    assert doc.sections["usage"] == "run it"
+
+
+def test_setext_underline_after_blank_line_is_not_heading():
+    doc = parse("## Usage\n\n---\ntext\n")
+    assert doc.headings == [(2, "Usage")]
+    assert doc.sections["usage"] == "---\ntext"
+
+
+def test_subheadings_stay_in_section():
+    doc = parse("## Usage\nintro\n### CLI\ndemo run\n## License\nMIT\n")
+    assert doc.sections["usage"] == "intro\n### CLI\ndemo run"
+
+
+def test_unterminated_fence_runs_to_end():
+    doc = parse("# Demo\n```bash\nmake\n# not a heading\n")
+    assert doc.headings == [(1, "Demo")]
+    assert doc.code_blocks == [("bash", "make\n# not a heading")]
+
+
+def test_max_chars_truncates():
+    doc = parse("# A\n" + "x\n" * 100 + "# B\n", max_chars=20)
+    assert doc.truncated
+    assert len(doc.text) <= 20
+    assert (1, "B") not in doc.headings
+
+
+def test_usage_items_order():
+    doc = parse("## Installation\npip install demo\n## Usage\ndemo\n```\ndemo --help\n```\n")
+    assert usage_items(doc) == ["demo\n```\ndemo --help\n```", "pip install demo", "demo --help"]
+
+
+def test_atx_heading_titles():
+    doc = parse("# Title #\n## C#\n###   Spaced   ###   \n#\n####### not a heading\n#hashtag\n")
+    assert doc.headings == [(1, "Title"), (2, "C#"), (3, "Spaced"), (1, "")]
+
+
+def test_long_space_run_in_heading_is_linear():
+    import time
+    started = time.perf_counter()
+    doc = parse("# a" + " " * 200000 + "b\n" + "## x" + " \t" * 100000 + "#\n")
+    assert time.perf_counter() - started < 1
+    assert doc.headings == [(1, "a" + " " * 200000 + "b"), (2, "x")]
@@ -0,0 +1,86 @@
+import json
+import sqlite3
+from results_store import ResultsStore, input_fingerprint
+
+
+def test_resume_unfinished_run_with_same_input(tmp_path):
+    repos = [{"name": "a"}, {"name": "b"}]
+    store = ResultsStore(str(tmp_path / "results.db"))
+    run_id = store.start_run("clone", fingerprint=input_fingerprint(repos))
+    store.put("clone", run_id, "a", 0, {"name": "a", "clone_status": "cloned"})
+    assert store.start_run("clone", fingerprint=input_fingerprint([dict(r) for r in repos])) == run_id
+    assert store.completed(run_id) == {0: {"name": "a", "clone_status": "cloned"}}
+    assert store.start_run("clone", resume=False, fingerprint=input_fingerprint(repos)) != run_id
+
+
+def test_changed_input_starts_new_run(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    run_id = store.start_run("report", fingerprint=input_fingerprint([{"name": "a"}, {"name": "b"}]))
+    store.put("report", run_id, "a", 0, {"name": "a"})
+    store.put("report", run_id, "b", 1, {"name": "b"})
+    # 順序が変わっただけでも位置がずれるので再開しない
+    new_run = store.start_run("report", fingerprint=input_fingerprint([{"name": "b"}, {"name": "a"}]))
+    assert new_run != run_id
+    assert store.completed(new_run) == {}
+    store.put("report", new_run, "b", 0, {"name": "b"})
+    out = tmp_path / "repos.json"
+    store.finish_run(new_run)
+    store.export_json(new_run, str(out))
+    assert json.loads(out.read_text(encoding="utf-8")) == [{"name": "b"}]
+
+
+def test_finished_run_is_not_resumed(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    fp = input_fingerprint([{"name": "a"}])
+    run_id = store.start_run("docker", fingerprint=fp)
+    store.finish_run(run_id)
+    assert store.start_run("docker", fingerprint=fp) != run_id
+    assert store.latest_run("docker") == run_id
+
+
+def test_export_keeps_input_order(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.db"))
+    run_id = store.start_run("clone")
+    for position, name in [(2, "c"), (0, "a"), (1, "b")]:
+        store.put("clone", run_id, name, position, {"name": name})
+    out = tmp_path / "repos.json"
+    store.export_json(run_id, str(out))
+    assert [r["name"] for r in json.loads(out.read_text(encoding="utf-8"))] == ["a", "b", "c"]
+
+
+def test_old_database_without_input_hash(tmp_path):
+    path = str(tmp_path / "results.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE stage_runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, stage TEXT NOT NULL, started_at REAL NOT NULL, finished_at REAL)")
+    conn.execute("INSERT INTO stage_runs (stage, started_at) VALUES ('clone', 0)")
+    conn.commit()
+    conn.close()
+    store = ResultsStore(path)
+    # 入力の分からない中断実行は再開しない
+    assert store.start_run("clone", fingerprint=input_fingerprint([])) != 1
+
+
+def test_duplicate_repo_names_are_kept(tmp_path):
+    repos = [{"name": "tool", "full_name": "a/tool"}, {"name": "other", "full_name": "b/other"},
+             {"name": "tool", "full_name": "c/tool"}]
+    store = ResultsStore(str(tmp_path / "results.db"))
+    run_id = store.start_run("report", fingerprint=input_fingerprint(repos))
+    for position, repo in enumerate(repos):
+        store.put("report", run_id, repo["name"], position, repo)
+    assert sorted(store.completed(run_id)) == [0, 1, 2]
+    out = tmp_path / "repos.json"
+    store.finish_run(run_id)
+    store.export_json(run_id, str(out))
+    assert json.loads(out.read_text(encoding="utf-8")) == repos
+
+
+def test_old_results_table_keyed_by_repo_is_rebuilt(tmp_path):
+    path = str(tmp_path / "results.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE results (run_id INTEGER NOT NULL, stage TEXT NOT NULL, repo TEXT NOT NULL, position INTEGER NOT NULL, data TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (run_id, repo))")
+    conn.commit()
+    conn.close()
+    store = ResultsStore(path)
+    store.put("clone", 1, "tool", 0, {"name": "tool"})
+    store.put("clone", 1, "tool", 1, {"name": "tool"})
+    assert sorted(store.completed(1)) == [0, 1]
@@ -0,0 +1,114 @@
+import json
+import pytest
+import search_github_projects as sgp
+from llm_client import estimate_tokens, MODEL_CONTEXT_TOKENS
+
+
+def make_repos(n):
+    return [{
+        "name": f"repo{i}",
+        "full_name": f"owner/repo{i}",
+        "clone_url": f"https://example.com/owner/repo{i}.git",
+        "stargazers_count": 1000 - i,
+        "html_url": f"https://example.com/owner/repo{i}",
+        "description": "An automation tool for design review. " * 20,
+        "default_branch": "main",
+    } for i in range(n)]
+
+
+def test_summarize_many_repos_fits_context(monkeypatch):
+    prompts = []
+
+    async def fake_achat(messages, max_tokens=256, **kwargs):
+        prompt = messages[-1]["content"]
+        prompts.append(prompt)
+        assert estimate_tokens("".join(m["content"] for m in messages)) + max_tokens <= MODEL_CONTEXT_TOKENS
+        names = [json.loads(line)["full_name"] for line in prompt.split("### 検索結果:\n", 1)[1].splitlines()]
+        # 番号が3の倍数のものだけ高評価
+        items = [{"full_name": n, "score": 9 if int(n[len("owner/repo"):]) % 3 == 0 else 2, "reason": "理由"} for n in names]
+        return {"choices": [{"message": {"content": "```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"}}]}
+
+    monkeypatch.setattr(sgp, "achat_completion", fake_achat)
+    result = sgp.summarize_repos(make_repos(300), "デザインレビュー")
+    assert len(prompts) > 1
+    assert len(result) == 300
+    top = [r["name"] for r in result[:100]]
+    assert top == [f"repo{i}" for i in range(0, 300, 3)]
+    assert all(r["clone_url"] and r["推奨理由"] == "理由" for r in result)
+
+
+def test_summarize_falls_back_on_api_error(monkeypatch):
+    async def failing_achat(*args, **kwargs):
+        raise RuntimeError("This model's maximum context length is 4096 tokens")
+
+    monkeypatch.setattr(sgp, "achat_completion", failing_achat)
+    result = sgp.summarize_repos(make_repos(25), "目的")
+    assert [r["name"] for r in result] == [f"repo{i}" for i in range(25)]
+    assert "推奨理由" not in result[0]
+
+
+def test_parse_recommendations_ignores_garbage():
+    assert sgp.parse_recommendations("- 用途A\n- 使い方B") == {}
+    assert sgp.parse_recommendations('[{"full_name": "a/b", "score": "x", "reason": "r"}, 3]') == {"a/b": (None, "r")}
+
+
+def stub_repos(n):
+    return [{"name": f"r{i}", "full_name": f"o/r{i}", "clone_url": f"https://example.com/o/r{i}.git",
+             "stars": 1000 - i, "html_url": f"https://example.com/o/r{i}", "description": "d"} for i in range(n)]
+
+
+@pytest.fixture
+def github(tmp_path, monkeypatch):
+    """bench のGitHubスタブに向け、検索キャッシュを一時ディレクトリにする。起動関数を返す。"""
+    from stubs import start_github_stub
+    from disk_cache import DiskCache
+    servers = []
+    sleeps = []
+    monkeypatch.setattr(sgp, "_session", None)
+    monkeypatch.setattr(sgp, "_search_cache", DiskCache(str(tmp_path / "cache"), name="github"))
+    monkeypatch.setattr(sgp.time, "sleep", lambda s: sleeps.append(s))
+
+    def start(repos, **kwargs):
+        server = start_github_stub(repos, **kwargs)
+        servers.append(server)
+        monkeypatch.setattr(sgp, "GITHUB_API_URL", f"http://127.0.0.1:{server.server_port}/search/repositories")
+        return server, sleeps
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_iter_github_repos_paginates(github):
+    server, _ = github(stub_repos(250))
+    names = [r["full_name"] for r in sgp.iter_github_repos("q", max_results=1000)]
+    assert names == [f"o/r{i}" for i in range(250)]
+    assert [page for page, _, _ in server.requests] == [1, 2, 3]
+
+
+def test_iter_github_repos_caps_results(github):
+    server, _ = github(stub_repos(250))
+    assert len(list(sgp.iter_github_repos("q", max_results=30))) == 30
+    assert [page for page, _, _ in server.requests] == [1]
+    server.requests.clear()
+    assert len(list(sgp.iter_github_repos("q", max_results=150))) == 150
+    # 150件なら1ページ100件で2ページ目まで
+    assert [page for page, _, _ in server.requests] == [1, 2]
+
+
+def test_iter_github_repos_reuses_cache_on_304(github):
+    server, _ = github(stub_repos(120))
+    first = list(sgp.iter_github_repos("q", max_results=200))
+    server.requests.clear()
+    second = list(sgp.iter_github_repos("q", max_results=200))
+    assert second == first
+    assert [(page, status) for page, etag, status in server.requests] == [(1, 304), (2, 304)]
+    assert all(etag for _, etag, _ in server.requests)
+
+
+def test_iter_github_repos_waits_when_rate_limited(github):
+    server, sleeps = github(stub_repos(5), rate_limited=1)
+    assert len(list(sgp.iter_github_repos("q", max_results=5))) == 5
+    assert [status for _, _, status in server.requests] == [403, 200]
+    waits = [s for s in sleeps if s > 0]
+    assert len(waits) == 1 and 0 < waits[0] <= 7
@@ -0,0 +1,82 @@
+import json
+import generate_report
+import watch_repos
+from watch_repos import ChangeQueue, replace_entry
+
+
+def test_change_queue_debounce():
+    queue = ChangeQueue(debounce=5)
+    queue.mark("a", now=0)
+    queue.mark("a", now=3)
+    assert queue.next_due() == 8
+    assert queue.ready(7, limit=2) == []
+    assert queue.ready(8, limit=2) == ["a"]
+    assert not queue.idle()
+    queue.finish("a")
+    assert queue.idle()
+
+
+def test_change_queue_max_delay():
+    queue = ChangeQueue(debounce=5)
+    # 書き込みが続いても最初の変更から debounce×WATCH_MAX_DELAY_FACTOR 秒で取り出す
+    for t in range(0, 100):
+        queue.mark("a", now=t)
+        if queue.ready(t, limit=1):
+            break
+    assert t == 5 * watch_repos.WATCH_MAX_DELAY_FACTOR
+
+
+def test_change_queue_holds_running_and_respects_limit():
+    queue = ChangeQueue(debounce=1)
+    for name in ["a", "b", "c"]:
+        queue.mark(name, now=0)
+    assert queue.ready(1, limit=2) == ["a", "b"]
+    # 処理中に変更された a は終わるまで取り出さない
+    queue.mark("a", now=1)
+    assert queue.ready(5, limit=5) == ["c"]
+    assert queue.next_due() is None
+    queue.finish("a")
+    assert queue.ready(5, limit=5) == ["a"]
+
+
+def test_replace_entry(tmp_path):
+    path = str(tmp_path / "results.json")
+    replace_entry(path, "repo_name", "gone", None)
+    assert not (tmp_path / "results.json").exists()
+    replace_entry(path, "repo_name", "a", {"repo_name": "a", "v": 1})
+    replace_entry(path, "repo_name", "b", {"repo_name": "b", "v": 1})
+    replace_entry(path, "repo_name", "a", {"repo_name": "a", "v": 2})
+    assert json.loads((tmp_path / "results.json").read_text(encoding="utf-8")) == [
+        {"repo_name": "a", "v": 2}, {"repo_name": "b", "v": 1}]
+    replace_entry(path, "repo_name", "a", None)
+    assert json.loads((tmp_path / "results.json").read_text(encoding="utf-8")) == [{"repo_name": "b", "v": 1}]
+
+
+def test_regenerate_report_failure_is_logged(tmp_path, monkeypatch):
+    repos_json = tmp_path / "repos.json"
+    repos_json.write_text("[]", encoding="utf-8")
+    monkeypatch.setattr(watch_repos, "REPOS_JSON", str(repos_json))
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("TemplateNotFound: report_repo.md")
+
+    monkeypatch.setattr(watch_repos, "write_shards", broken)
+    watch_repos.regenerate_report()
+
+
+def test_update_report_refreshes_repo_lookup(tmp_path, monkeypatch):
+    repo = {"name": "new", "clone_url": "https://example.com/new.git", "path": str(tmp_path / "new")}
+    repos_json = tmp_path / "repos.json"
+    repos_json.write_text(json.dumps([repo]), encoding="utf-8")
+    monkeypatch.setattr(watch_repos, "REPOS_JSON", str(repos_json))
+    monkeypatch.setattr(generate_report, "_repo_lookup", {})
+    seen = []
+
+    def fake_analyze(repo, repo_dir, readme_text=None):
+        seen.append(generate_report.get_repo_lookup().get(repo["name"]))
+        return generate_report.parse_readme([])
+
+    monkeypatch.setattr(watch_repos, "analyze_repo", fake_analyze)
+    processor = watch_repos.RepoProcessor(str(tmp_path), summarize=False, use_cache=False)
+    processor.update_report("new", repo["path"])
+    assert seen == [repo]
@@ -0,0 +1,465 @@
+import os
+import json
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import signal
+import struct
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import metrics
+import perf_history
+from results_store import ResultsStore
+from repo_index import index_repo, save_index
+from check_repo_files import check_result
+from clone_projects import clone_repo, current_rev, CLONE_MODE, DEFAULT_JOBS as CLONE_JOBS
+import generate_report
+from generate_report import analyze_repo, ai_summarize
+from docker_test_runner import (
+    run_docker_build_and_test, static_analysis_result, build_cache_key, is_cacheable,
+    open_build_cache, docker_image_name, context_manifest_hash, git_head, ImageBudget,
+)
+from generate_markdown_report import write_shards, iter_json_array, with_perf_flags, perf_flags
+
+load_dotenv()
+CLONE_DIR = os.environ.get("CLONE_DIR", "repos")
+REPOS_JSON = "output/repos.json"
+CHECK_RESULT_FILE = "output/check_results.json"
+TEST_RESULT_FILE = "output/test_results.json"
+# 最後の変更からこの秒数静まってから再処理する（変更が続いてもWATCH_MAX_DELAY_FACTOR倍で打ち切る）
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", "5"))
+WATCH_MAX_DELAY_FACTOR = 10
+# inotifyが使えない場合のポーリング間隔
+WATCH_POLL_INTERVAL = float(os.environ.get("WATCH_POLL_INTERVAL", "10"))
+# repos.json の各リポジトリを git fetch する間隔（0で無効）
+WATCH_FETCH_INTERVAL = float(os.environ.get("WATCH_FETCH_INTERVAL", "900"))
+# 同時に再処理するリポジトリ数
+WATCH_JOBS = int(os.environ.get("WATCH_JOBS", "2"))
+
+LOG_FILE = "logs/all.log"
+logging.basicConfig(
+    filename=LOG_FILE,
+    level=logging.INFO,
+    format="%(asctime)s [watch_repos.py] %(message)s",
+    encoding="utf-8"
+)
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+def _log(msg):
+    print(msg)
+    logging.info(msg)
+
+def _skip_dir(name):
+    # .git はfetchの度に変わるので見ない。*.tmp はmetadataモードの展開途中のディレクトリ
+    return name == ".git" or name.endswith(".tmp")
+
+def repo_dirs(root):
+    """root直下のリポジトリディレクトリ {名前: パス}。"""
+    if not os.path.isdir(root):
+        return {}
+    with os.scandir(root) as it:
+        return {e.name: e.path for e in it if e.is_dir() and not _skip_dir(e.name)}
+
+class InotifyWatcher:
+    """root配下（.git除く）をinotifyで監視し、変更のあったリポジトリ名を返す。"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1に失敗しました")
+        self.paths = {}
+        try:
+            self.add_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, path):
+        for dirpath, dirs, _ in os.walk(path):
+            dirs[:] = [d for d in dirs if not _skip_dir(d)]
+            wd = self._add_watch(self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    # max_user_watches を超えた。監視漏れを避けるためポーリングへ切り替えさせる
+                    raise OSError(err, "inotifyの監視数上限に達しました（fs.inotify.max_user_watches）")
+                continue
+            self.paths[wd] = dirpath
+
+    def repo_of(self, path):
+        rel = os.path.relpath(path, self.root)
+        name = rel.split(os.sep, 1)[0]
+        return None if name in (".", "..") or _skip_dir(name) else name
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # イベントを取りこぼしたので全リポジトリを対象にする
+                changed.update(repo_dirs(self.root))
+                continue
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            base = self.paths.get(wd)
+            if base is None:
+                continue
+            path = os.path.join(base, name) if name else base
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and not _skip_dir(name):
+                # 新しいディレクトリ（新規clone・metadata展開の差し替え等）も監視対象に加える
+                self.add_tree(path)
+            repo = self.repo_of(path)
+            if repo:
+                changed.add(repo)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """inotifyが使えない環境向け。interval秒毎に各リポジトリのパス・サイズ・mtimeを比べる。"""
+
+    def __init__(self, root, interval=WATCH_POLL_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.snapshot = self.scan()
+        self.next_scan = time.monotonic() + interval
+
+    def scan(self):
+        return {name: context_manifest_hash(path) for name, path in repo_dirs(self.root).items()}
+
+    def poll(self, timeout):
+        wait = self.next_scan - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(timeout, 0))
+            return set()
+        time.sleep(max(wait, 0))
+        current = self.scan()
+        self.next_scan = time.monotonic() + self.interval
+        changed = {n for n in set(current) | set(self.snapshot) if current.get(n) != self.snapshot.get(n)}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+def open_watcher(root, poll_interval=WATCH_POLL_INTERVAL, force_poll=False):
+    """inotifyで監視し、使えなければ（Linux以外・監視数上限等）ポーリングにする。"""
+    if not force_poll:
+        try:
+            watcher = InotifyWatcher(root)
+            _log(f"{root} をinotifyで監視します（{len(watcher.paths)}ディレクトリ）")
+            return watcher
+        except (OSError, AttributeError) as e:
+            _log(f"inotifyを使えないためポーリングに切り替えます: {e}")
+    _log(f"{root} を{poll_interval:g}秒毎のポーリングで監視します")
+    return PollingWatcher(root, poll_interval)
+
+class ChangeQueue:
+    """変更のあったリポジトリをdebounce秒静まってから取り出す。処理中のものは終わるまで取り出さない。"""
+
+    def __init__(self, debounce=WATCH_DEBOUNCE):
+        self.debounce = debounce
+        self.max_delay = debounce * WATCH_MAX_DELAY_FACTOR
+        self.due = {}
+        self.first = {}
+        self.running = set()
+
+    def mark(self, name, now=None):
+        now = time.monotonic() if now is None else now
+        first = self.first.setdefault(name, now)
+        self.due[name] = min(now + self.debounce, first + self.max_delay)
+
+    def ready(self, now, limit):
+        names = sorted((d, n) for n, d in self.due.items() if d <= now and n not in self.running)
+        taken = [n for _, n in names[:max(limit, 0)]]
+        for name in taken:
+            del self.due[name]
+            del self.first[name]
+            self.running.add(name)
+        return taken
+
+    def finish(self, name):
+        self.running.discard(name)
+
+    def next_due(self):
+        waiting = [d for n, d in self.due.items() if n not in self.running]
+        return min(waiting) if waiting else None
+
+    def idle(self):
+        return not self.due and not self.running
+
+def load_json_list(path):
+    if not os.path.isfile(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+def replace_entry(path, key, name, data):
+    """JSON配列の key==name の要素を data で置き換える（なければ追加、dataがNoneなら削除）。"""
+    items = load_json_list(path)
+    for i, item in enumerate(items):
+        if item.get(key) == name:
+            if data is None:
+                del items[i]
+            else:
+                items[i] = data
+            break
+    else:
+        if data is None:
+            return
+        items.append(data)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(items, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+class RepoProcessor:
+    """1リポジトリ分だけ check → README解析 → Dockerビルド・テスト を行い、各ステージの出力JSONを更新する。"""
+
+    def __init__(self, base_dir=CLONE_DIR, summarize=True, cpus=None, memory=None, use_cache=True):
+        self.base_dir = base_dir
+        self.summarize = summarize
+        self.cpus = cpus
+        self.memory = memory
+        self.cache = open_build_cache() if use_cache else None
+        self.budget = ImageBudget()
+        self.store = ResultsStore()
+        # 出力JSON・インデックスの読み書きはワーカー間で直列化する
+        self._lock = threading.Lock()
+
+    def process(self, name):
+        repo_dir = os.path.join(self.base_dir, name)
+        with metrics.span("watch_repo", repo=name):
+            if not os.path.isdir(repo_dir):
+                _log(f"[{name}] ディレクトリが削除されたため結果から除きます")
+                self.forget(name)
+                return
+            _log(f"[{name}] 変更を検知したため再処理します")
+            entry = index_repo(repo_dir)
+            check = check_result(name, entry)
+            with self._lock:
+                # 読み取り中の他スレッドに影響しないよう、インデックスは差し替える
+                index = dict(generate_report.get_repo_index())
+                index[name] = entry
+                generate_report._repo_index = index
+                save_index(index)
+                replace_entry(CHECK_RESULT_FILE, "repo_name", name, check)
+            self.update_report(name, repo_dir)
+            self.update_test_result(check)
+        metrics.incr("watch_processed")
+
+    def update_report(self, name, repo_dir):
+        with self._lock:
+            repo = next((r for r in load_json_list(REPOS_JSON) if r.get("name") == name), None)
+        if repo is None:
+            # repos.json にない（手動で置かれた）リポジトリはcheck・Dockerのみ
+            return
+        with self._lock:
+            # READMEをGitHubから取得する際の対応表も、起動後に追加・変更されたエントリに合わせる
+            lookup = dict(generate_report.get_repo_lookup())
+            lookup[name] = repo
+            generate_report._repo_lookup = lookup
+        previous = repo.get("主な用途・使い方")
+        doc = analyze_repo(repo, repo.get("path") or repo_dir)
+        if self.summarize:
+            ai_features = ai_summarize(doc.text) if doc.text.strip() else []
+            if ai_features:
+                repo["主な用途・使い方"] = ai_features
+        elif previous:
+            # 要約しない場合は前回のAI要約を残す
+            repo["主な用途・使い方"] = previous
+        with self._lock:
+            replace_entry(REPOS_JSON, "name", name, repo)
+
+    def update_test_result(self, check):
+        name = check["repo_name"]
+        if check["readme"] and check["dockerfile"]:
+            key = build_cache_key(check["path"], name, self.cpus, self.memory, check["dockerfile_file"])
+            result = self.cache.get(key) if self.cache is not None else None
+            if result is None:
+                result = run_docker_build_and_test(check["path"], name, self.cpus, self.memory, check["dockerfile_file"])
+                if self.cache is not None and is_cacheable(result):
+                    self.cache.put(key, result)
+                perf_history.record(self.store, None, result)
+                if result["build_success"]:
+                    self.budget.add(docker_image_name(name), size=result["image_bytes"])
+                else:
+                    self.budget.release()
+        elif check["readme"]:
+            result = static_analysis_result(check)
+        else:
+            result = None
+        with self._lock:
+            replace_entry(TEST_RESULT_FILE, "repo_name", name, result)
+
+    def forget(self, name):
+        with self._lock:
+            index = dict(generate_report.get_repo_index())
+            if index.pop(name, None) is not None:
+                generate_report._repo_index = index
+                save_index(index)
+            replace_entry(CHECK_RESULT_FILE, "repo_name", name, None)
+            replace_entry(TEST_RESULT_FILE, "repo_name", name, None)
+
+def checkout_rev(path):
+    """チェックアウトが指すコミット（metadata展開・worktree・通常のclone。なければNone）。"""
+    return current_rev(path) or (git_head(path) if os.path.isdir(os.path.join(path, ".git")) else None)
+
+def fetch_repos(base_dir=CLONE_DIR, mode=CLONE_MODE, jobs=CLONE_JOBS):
+    """repos.json の各リポジトリを git fetch して最新化し、チェックアウトが変わったリポジトリ名を返す。"""
+    repos = [r for r in load_json_list(REPOS_JSON) if r.get("clone_url") and r.get("name")]
+    if not repos:
+        return set()
+
+    def fetch(repo):
+        path = os.path.join(base_dir, repo["name"])
+        before = checkout_rev(path)
+        outcome = clone_repo(repo["clone_url"], repo["name"], base_dir, mode)
+        # refreshは変更がなくても "updated" を返すので、指すコミットで判定する
+        return outcome["status"] != "failed" and checkout_rev(path) != before
+
+    with metrics.span("watch_fetch"), ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        return {r["name"] for r, changed in zip(repos, pool.map(fetch, repos)) if changed}
+
+def regenerate_report():
+    """レポートを再生成する。失敗しても監視は続け、次の変更時に再試行する。"""
+    if not os.path.isfile(REPOS_JSON):
+        return
+    try:
+        with metrics.span("watch_report"):
+            index_path, rendered, total = write_shards(with_perf_flags(iter_json_array(REPOS_JSON), perf_flags()))
+    except Exception as e:
+        msg = f"レポートの再生成に失敗しました: {e}"
+        print(msg)
+        logging.exception(msg)
+        return
+    _log(f"{index_path} を更新しました（{total}件中 {rendered}件を再生成）")
+
+def watch(base_dir=CLONE_DIR, jobs=WATCH_JOBS, debounce=WATCH_DEBOUNCE, fetch_interval=WATCH_FETCH_INTERVAL,
+          poll_interval=WATCH_POLL_INTERVAL, force_poll=False, processor=None, mode=CLONE_MODE):
+    """Ctrl-C（SIGINT/SIGTERM）まで監視し、変更のあったリポジトリだけを最大jobs並列で再処理する。
+
+    変更が落ち着いて処理中のものがなくなった時点でレポート（シャード）を再生成する。
+    """
+    os.makedirs(base_dir, exist_ok=True)
+    processor = processor or RepoProcessor(base_dir)
+    watcher = open_watcher(base_dir, poll_interval, force_poll)
+    queue = ChangeQueue(debounce)
+    pool = ThreadPoolExecutor(max_workers=max(1, jobs))
+    fetch_pool = ThreadPoolExecutor(max_workers=1)
+    running = {}
+    fetching = None
+    next_fetch = time.monotonic() if fetch_interval > 0 else None
+    report_dirty = False
+    try:
+        while True:
+            now = time.monotonic()
+            waits = [poll_interval]
+            if queue.next_due() is not None:
+                waits.append(queue.next_due() - now)
+            if next_fetch is not None and fetching is None:
+                waits.append(next_fetch - now)
+            if running or fetching:
+                # 完了した処理を回収するため短く待つ
+                waits.append(0.5)
+            for name in watcher.poll(min(waits)):
+                queue.mark(name)
+            now = time.monotonic()
+            if fetching is None and next_fetch is not None and now >= next_fetch:
+                fetching = fetch_pool.submit(fetch_repos, base_dir, mode)
+            if fetching is not None and fetching.done():
+                try:
+                    for name in fetching.result():
+                        queue.mark(name)
+                except Exception as e:
+                    _log(f"git fetch 失敗: {e}")
+                fetching = None
+                next_fetch = time.monotonic() + fetch_interval
+            for future in [f for f in running if f.done()]:
+                name = running.pop(future)
+                queue.finish(name)
+                report_dirty = True
+                try:
+                    future.result()
+                except Exception as e:
+                    msg = f"[{name}] 再処理に失敗しました: {e}"
+                    print(msg)
+                    logging.exception(msg)
+            for name in queue.ready(now, jobs - len(running)):
+                running[pool.submit(processor.process, name)] = name
+            if report_dirty and queue.idle():
+                regenerate_report()
+                report_dirty = False
+    except KeyboardInterrupt:
+        _log("停止要求を受けました。処理中のリポジトリが終わるまで待ちます...")
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        fetch_pool.shutdown(wait=True, cancel_futures=True)
+        watcher.close()
+        if report_dirty:
+            regenerate_report()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="clone先を常駐監視し、変更のあったリポジトリだけを check・README解析・Dockerテスト・レポート更新する")
+    parser.add_argument("--dir", default=CLONE_DIR, help=f"監視するclone先ディレクトリ (既定: 環境変数CLONE_DIR、未指定時は{CLONE_DIR})")
+    parser.add_argument("--jobs", type=int, default=WATCH_JOBS, help=f"同時に再処理するリポジトリ数 (既定{WATCH_JOBS})")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE, help=f"最後の変更から再処理までの待ち秒数 (既定{WATCH_DEBOUNCE:g})")
+    parser.add_argument("--fetch-interval", type=float, default=WATCH_FETCH_INTERVAL, help=f"git fetch の間隔秒。0で無効 (既定{WATCH_FETCH_INTERVAL:g})")
+    parser.add_argument("--poll", action="store_true", help="inotifyを使わずポーリングで監視")
+    parser.add_argument("--poll-interval", type=float, default=WATCH_POLL_INTERVAL, help=f"ポーリング間隔秒 (既定{WATCH_POLL_INTERVAL:g})")
+    parser.add_argument("--mode", choices=["full", "metadata"], default=CLONE_MODE, help="fetch時のclone方式（clone_projects.py と同じ）")
+    parser.add_argument("--no-summary", action="store_true", help="README変更時のAI要約を省略（前回の要約を残す）")
+    parser.add_argument("--no-cache", action="store_true", help="Docker結果キャッシュを使わない")
+    parser.add_argument("--cpus", default=os.environ.get("DOCKER_CPUS"), help="コンテナ毎の --cpus 制限")
+    parser.add_argument("--memory", default=os.environ.get("DOCKER_MEMORY"), help="コンテナ毎の --memory 制限 (例: 2g)")
+    args = parser.parse_args(argv)
+    metrics.init("watch")
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _interrupt)
+    processor = RepoProcessor(args.dir, not args.no_summary, args.cpus, args.memory, not args.no_cache)
+    watch(args.dir, args.jobs, args.debounce, args.fetch_interval, args.poll_interval, args.poll, processor, args.mode)
+
+if __name__ == "__main__":
+    main()